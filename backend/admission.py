@@ -0,0 +1,376 @@
+"""Admission control for expensive endpoints
+
+Requests matching an admission rule (a full Graph scan, a Claude call, a
+cache flush) pass three gates before they reach the app:
+
+1. Each client has a token bucket per rule; an empty bucket is answered
+   with 429 and the time until the next token in Retry-After.
+2. Identical requests already in flight are joined: the follower waits for
+   the leader's response, up to ADMISSION_MAX_WAIT, and gets a copy
+   instead of running again.
+3. Each rule has a concurrency limit with a short bounded queue; a full
+   queue, or a wait past ADMISSION_MAX_WAIT, is answered with 503. The slot
+   is held until the response starts, so streaming a large body to a slow
+   client doesn't hold up the next request.
+
+Requests that match no rule, or whose rule says they are cheap right now
+(e.g. the data is cached), go straight through.
+"""
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs
+from config import get_settings
+from metrics import registry
+import asyncio
+import json
+import math
+import time
+
+admission_requests = registry.counter(
+    "jarvis_admission_requests_total", "Requests to admission-controlled routes by outcome"
+)
+admission_wait = registry.histogram(
+    "jarvis_admission_wait_seconds", "Time admitted requests spent queued"
+)
+
+ADMITTED = "admitted"
+QUEUED = "queued"
+DEDUPLICATED = "deduplicated"
+RATE_LIMITED = "rate_limited"
+SHED = "shed"
+
+# Responses larger than this aren't shared with identical requests; they run themselves
+DEDUPE_MAX_BYTES = 32 * 1024 * 1024
+
+# Client buckets kept before idle (full) ones are dropped
+MAX_CLIENT_BUCKETS = 10000
+
+# Requests that may wait on one in-flight request before identical ones are shed
+MAX_FOLLOWERS = 256
+
+
+@dataclass
+class AdmissionRule:
+    # Rules with the same name share one concurrency limit and client bucket
+    name: str
+    method: str
+    paths: Sequence[str]
+    # Whether this request is expensive right now; None means always
+    applies: Optional[Callable[[Dict[str, Any]], bool]] = None
+    # Share the response of identical in-flight requests (bodiless requests only)
+    dedupe: bool = True
+
+    def matches(self, scope: Dict[str, Any]) -> bool:
+        if scope["method"] != self.method or scope["path"] not in self.paths:
+            return False
+        return self.applies is None or self.applies(scope)
+
+
+def parse_limits(spec: str) -> Dict[str, int]:
+    """Parse "analyze=1,users=2" into {"analyze": 1, "users": 2}"""
+    limits = {}
+    for part in spec.split(","):
+        name, _, value = part.strip().partition("=")
+        if name and value:
+            limits[name.strip()] = max(int(value), 1)
+    return limits
+
+
+def query_param(scope: Dict[str, Any], name: str) -> Optional[str]:
+    """First value of a query parameter, parsed the way the app would"""
+    values = parse_qs(scope.get("query_string", b"").decode("latin-1")).get(name)
+    return values[0] if values else None
+
+
+def _header(scope: Dict[str, Any], name: bytes) -> Optional[bytes]:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value
+    return None
+
+
+class _Gate:
+    """Concurrency slots for one rule, with a bounded FIFO wait queue"""
+
+    def __init__(self, name: str, limit: int, queue_size: int):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.in_flight = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        # Moving average of time a request holds a slot, for Retry-After
+        self.service_seconds = 1.0
+
+    def retry_after(self) -> int:
+        """Seconds until the queue ahead of a new request has likely drained"""
+        return max(1, math.ceil(self.service_seconds * (len(self.waiters) + 1) / self.limit))
+
+    async def acquire(self, max_wait: float) -> Optional[str]:
+        """ADMITTED or QUEUED once a slot is held, None if shed"""
+        if self.in_flight < self.limit and not self.waiters:
+            self.in_flight += 1
+            return ADMITTED
+        if len(self.waiters) >= self.queue_size:
+            return None
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            done, _ = await asyncio.wait({waiter}, timeout=max_wait)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(0.0)
+            else:
+                self.waiters.remove(waiter)
+            raise
+        if not done:
+            self.waiters.remove(waiter)
+            waiter.cancel()
+            return None
+        return QUEUED
+
+    def release(self, held_seconds: Optional[float]) -> None:
+        if held_seconds:
+            self.service_seconds = 0.8 * self.service_seconds + 0.2 * held_seconds
+        self.in_flight -= 1
+        while self.waiters and self.in_flight < self.limit:
+            waiter = self.waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class _RateLimiter:
+    """Token bucket per (rule, client)"""
+
+    def __init__(self, per_minute: float, burst: int):
+        self.rate = per_minute / 60.0
+        self.burst = float(burst)
+        self.buckets: Dict[Tuple[str, str], _Bucket] = {}
+
+    def take(self, rule: str, client: str) -> float:
+        """0 if a token was taken, else seconds until one is available"""
+        now = time.monotonic()
+        bucket = self.buckets.get((rule, client))
+        if bucket is None:
+            if len(self.buckets) >= MAX_CLIENT_BUCKETS:
+                self._prune(now)
+            bucket = self.buckets[(rule, client)] = _Bucket(self.burst, now)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        if bucket.tokens >= 1.0:
+            bucket.tokens -= 1.0
+            return 0.0
+        return (1.0 - bucket.tokens) / self.rate
+
+    def _prune(self, now: float) -> None:
+        # A bucket that has refilled is indistinguishable from a new one
+        full = [
+            key for key, bucket in self.buckets.items()
+            if bucket.tokens + (now - bucket.updated) * self.rate >= self.burst
+        ]
+        for key in full:
+            del self.buckets[key]
+
+
+class _Flight:
+    """A leader's response, recorded for identical requests waiting on it"""
+
+    def __init__(self):
+        self.done = asyncio.Event()
+        self.messages: List[Dict[str, Any]] = []
+        self.size = 0
+        # False once the response can't be shared (too large, failed or incomplete)
+        self.shareable = True
+        self.followers = 0
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying admission rules, see the module docstring"""
+
+    def __init__(self, app, rules: Sequence[AdmissionRule] = ()):
+        self.app = app
+        self.settings = get_settings()
+        self.rules = list(rules)
+        limits = parse_limits(self.settings.admission_limits)
+        self.gates = {
+            rule.name: _Gate(rule.name, limits.get(rule.name, 1), self.settings.admission_queue_size)
+            for rule in self.rules
+        }
+        self.limiter = _RateLimiter(self.settings.admission_client_rate_per_minute, self.settings.admission_client_burst)
+        self.flights: Dict[Tuple, _Flight] = {}
+        admission_state.append(self)
+
+    async def __call__(self, scope, receive, send):
+        rule = None
+        if scope["type"] == "http" and self.settings.admission_enabled:
+            rule = next((rule for rule in self.rules if rule.matches(scope)), None)
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        # Before joining a flight too, so repeating one URL can't dodge the limit
+        retry_after = self.limiter.take(rule.name, self._client(scope))
+        if retry_after:
+            admission_requests.inc(route=rule.name, outcome=RATE_LIMITED)
+            await self._reject(None, send, 429, f"Too many {rule.name} requests from this client", retry_after)
+            return
+
+        key = self._dedupe_key(rule, scope)
+        flight = None
+        if key is not None:
+            leader = self.flights.get(key)
+            if leader is not None:
+                if not await self._follow(leader, rule):
+                    admission_requests.inc(route=rule.name, outcome=SHED)
+                    gate = self.gates[rule.name]
+                    await self._reject(None, send, 503, f"{rule.name} is at capacity", gate.retry_after())
+                    return
+                if leader.shareable:
+                    admission_requests.inc(route=rule.name, outcome=DEDUPLICATED)
+                    for message in leader.messages:
+                        await send(message)
+                    return
+                # Its response couldn't be shared: run like any other request
+            else:
+                # Lead from arrival, so identical requests join even while this one queues
+                flight = self.flights[key] = _Flight()
+                send = self._recording(flight, send)
+
+        try:
+            await self._admit(rule, flight, scope, receive, send)
+        except BaseException:
+            if flight is not None:
+                flight.shareable = False
+            raise
+        finally:
+            if flight is not None:
+                del self.flights[key]
+                last = flight.messages[-1] if flight.messages else {}
+                if last.get("type") != "http.response.body" or last.get("more_body", False):
+                    flight.shareable = False
+                flight.done.set()
+
+    async def _follow(self, leader: _Flight, rule: AdmissionRule) -> bool:
+        """Wait for an identical request to finish; False if it can't be waited on"""
+        if leader.followers >= MAX_FOLLOWERS:
+            return False
+        leader.followers += 1
+        try:
+            await asyncio.wait_for(leader.done.wait(), self.settings.admission_max_wait)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            leader.followers -= 1
+
+    async def _admit(self, rule: AdmissionRule, flight: Optional[_Flight], scope, receive, send) -> None:
+        gate = self.gates[rule.name]
+        started = time.perf_counter()
+        outcome = await gate.acquire(self.settings.admission_max_wait)
+        if outcome is None:
+            admission_requests.inc(route=rule.name, outcome=SHED)
+            await self._reject(flight, send, 503, f"{rule.name} is at capacity", gate.retry_after())
+            return
+        admission_requests.inc(route=rule.name, outcome=outcome)
+        admission_wait.observe(time.perf_counter() - started, route=rule.name)
+
+        held = time.perf_counter()
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                gate.release(time.perf_counter() - held)
+
+        async def send_and_release(message):
+            # The expensive part (loading the data) is over once the response starts
+            if message["type"] == "http.response.start":
+                release()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_release)
+        finally:
+            release()
+
+    @staticmethod
+    def _recording(flight: _Flight, send):
+        """`send` that also keeps the response for identical requests"""
+        async def send_and_record(message):
+            if flight.shareable:
+                flight.size += len(message.get("body", b""))
+                if flight.size > DEDUPE_MAX_BYTES:
+                    flight.shareable = False
+                    flight.messages = []
+                else:
+                    flight.messages.append(message)
+            await send(message)
+        return send_and_record
+
+    @staticmethod
+    def _dedupe_key(rule: AdmissionRule, scope) -> Optional[Tuple]:
+        if not rule.dedupe:
+            return None
+        # Requests with a body could differ in it
+        length = _header(scope, b"content-length")
+        if (length not in (None, b"0")) or _header(scope, b"transfer-encoding") is not None:
+            return None
+        # The encoding negotiated differs with Accept-Encoding
+        return (scope["method"], scope["path"], scope.get("query_string", b""), _header(scope, b"accept-encoding"))
+
+    def _client(self, scope) -> str:
+        header = self.settings.admission_client_header
+        if header:
+            value = _header(scope, header.lower().encode())
+            if value:
+                # X-Forwarded-For: the client is the first hop
+                return value.decode("latin-1").split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    @staticmethod
+    async def _reject(flight: Optional[_Flight], send, status: int, detail: str, retry_after: float) -> None:
+        if flight is not None:
+            # A rejection is about this request (and client), not an answer others should get
+            flight.shareable = False
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+# Middleware instances, for the metrics collector
+admission_state: List[AdmissionMiddleware] = []
+
+
+@registry.collector
+def _admission_metrics():
+    gates = [gate for middleware in admission_state for gate in middleware.gates.values()]
+    return [
+        ("jarvis_admission_in_flight", "gauge", "Admitted requests running per route",
+         [({"route": gate.name}, gate.in_flight) for gate in gates]),
+        ("jarvis_admission_queue_depth", "gauge", "Requests waiting for admission per route",
+         [({"route": gate.name}, len(gate.waiters)) for gate in gates]),
+        ("jarvis_admission_limit", "gauge", "Concurrent requests allowed per route",
+         [({"route": gate.name}, gate.limit) for gate in gates]),
+    ]
@@ -0,0 +1,160 @@
+"""Deterministic user classification and compact encoding for AI analysis"""
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# User categories
+ACTIVE = "active"
+NEVER_SIGNED_IN = "never_signed_in"
+INACTIVE = "inactive"
+ENABLED_UNLICENSED = "enabled_unlicensed"
+DISABLED_LICENSED = "disabled_licensed"
+DISABLED_UNLICENSED = "disabled_unlicensed"
+# Disabled and unlicensed, but signed in recently (or never): possibly mid-offboarding
+RECENTLY_DISABLED = "recently_disabled"
+
+# Categories whose action is clear-cut and resolved without Claude
+RESOLVED_ACTIONS = {
+    DISABLED_LICENSED: ("remove license", "account is disabled but still licensed"),
+    DISABLED_UNLICENSED: ("delete", "account is disabled, has no license and no recent sign-in"),
+}
+
+# Categories that need judgement (service accounts, shared mailboxes, new hires...)
+AMBIGUOUS = (NEVER_SIGNED_IN, INACTIVE, ENABLED_UNLICENSED, RECENTLY_DISABLED)
+
+# Short codes used in the compact table sent to Claude
+CATEGORY_CODES = {
+    NEVER_SIGNED_IN: "N",
+    INACTIVE: "I",
+    ENABLED_UNLICENSED: "U",
+    RECENTLY_DISABLED: "D",
+}
+
+TABLE_HEADER = "email|name|cat|days|lic|dept"
+
+
+@dataclass
+class PrefilterResult:
+    total: int = 0
+    active: int = 0
+    resolved: Dict[str, List[Any]] = field(default_factory=dict)
+    ambiguous: List[Tuple[str, Any]] = field(default_factory=list)
+
+    @property
+    def resolved_count(self) -> int:
+        return sum(len(users) for users in self.resolved.values())
+
+
+def _parse_sign_in(value: Any) -> Optional[datetime]:
+    """Normalize a last_sign_in value to an aware datetime"""
+    if not value:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def days_since_sign_in(user: Any, now: datetime) -> Optional[int]:
+    """Whole days since the user's last sign-in, or None if they never signed in"""
+    last_sign_in = _parse_sign_in(user.get("last_sign_in"))
+    if last_sign_in is None:
+        return None
+    return max((now - last_sign_in).days, 0)
+
+
+def classify_user(user: Any, now: datetime, inactive_days: int) -> str:
+    """Classify a single user with the local rules engine"""
+    enabled = bool(user.get("account_enabled"))
+    licensed = bool(user.get("license_type"))
+
+    days = days_since_sign_in(user, now)
+    if not enabled:
+        if licensed:
+            return DISABLED_LICENSED
+        # Deletion is permanent: only recommend it once the account has been idle past the threshold
+        if days is not None and days > inactive_days:
+            return DISABLED_UNLICENSED
+        return RECENTLY_DISABLED
+
+    if days is None:
+        return NEVER_SIGNED_IN
+    if days > inactive_days:
+        return INACTIVE
+    if not licensed:
+        return ENABLED_UNLICENSED
+    return ACTIVE
+
+
+def prefilter_users(
+    users: Iterable[Any],
+    inactive_days: int = 90,
+    now: Optional[datetime] = None
+) -> PrefilterResult:
+    """Split users into active, locally resolved and ambiguous candidates"""
+    now = now or datetime.now(timezone.utc)
+    result = PrefilterResult(resolved={category: [] for category in RESOLVED_ACTIONS})
+
+    for user in users:
+        result.total += 1
+        category = classify_user(user, now, inactive_days)
+        if category == ACTIVE:
+            result.active += 1
+        elif category in RESOLVED_ACTIONS:
+            result.resolved[category].append(user)
+        else:
+            result.ambiguous.append((category, user))
+
+    return result
+
+
+def _cell(value: Any) -> str:
+    if value is None or value == "":
+        return "-"
+    return str(value).replace("|", "/").replace("\n", " ")
+
+
+def encode_candidates(candidates: List[Tuple[str, Any]], now: datetime) -> str:
+    """Encode candidates as a pipe-separated table, one user per line"""
+    lines = [TABLE_HEADER]
+    for category, user in candidates:
+        days = days_since_sign_in(user, now)
+        lines.append("|".join((
+            _cell(user.get("email")),
+            _cell(user.get("display_name")),
+            CATEGORY_CODES[category],
+            _cell(days),
+            _cell(user.get("license_type")),
+            _cell(user.get("department")),
+        )))
+    return "\n".join(lines)
+
+
+def legacy_prompt_chars(users: Iterable[Any]) -> int:
+    """Size of the per-user repr encoding previously sent to Claude"""
+    total = 0
+    for user in users:
+        last_sign_in = _parse_sign_in(user.get("last_sign_in"))
+        total += len(repr({
+            "email": user.get("email"),
+            "name": user.get("display_name"),
+            "enabled": user.get("account_enabled"),
+            "last_sign_in": last_sign_in.isoformat() if last_sign_in else "Never",
+            "license": user.get("license_type")
+        })) + 2
+    return total
+
+
+def estimate_tokens(chars: int) -> int:
+    """Rough token estimate (~4 characters per token)"""
+    return (chars + 3) // 4
+
+
+def chunked(items: List[Any], size: int) -> List[List[Any]]:
+    """Split a list into chunks of at most `size` items"""
+    size = max(size, 1)
+    return [items[i:i + size] for i in range(0, len(items), size)]
@@ -1,61 +1,158 @@
-from anthropic import Anthropic
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Tuple, Callable
+from datetime import datetime, timezone
 from config import get_settings
+from scheduler import upstream_call
+from ai.prefilter import (
+    RESOLVED_ACTIONS,
+    prefilter_users,
+    encode_candidates,
+    legacy_prompt_chars,
+    estimate_tokens,
+    chunked,
+)
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+MODEL = "claude-sonnet-4-5-20250929"
 
 
 class AIRecommender:
     def __init__(self):
         self.settings = get_settings()
-        self.client = Anthropic(api_key=self.settings.anthropic_api_key)
+        AsyncAnthropic = self.load_sdk().AsyncAnthropic
+        self.client = AsyncAnthropic(
+            api_key=self.settings.anthropic_api_key,
+            base_url=self.settings.anthropic_base_url or None
+        )
 
-    async def analyze_users(self, users: list) -> Dict[str, Any]:
+    @staticmethod
+    def load_sdk():
+        """Import the anthropic SDK (deferred to keep app startup fast)"""
+        import anthropic
+        return anthropic
+
+    async def analyze_users(
+        self,
+        users: list,
+        on_chunk_done: Optional[Callable[[int, int], None]] = None
+    ) -> Dict[str, Any]:
         """Analyze users and provide cleanup recommendations"""
+        started = time.perf_counter()
+        now = datetime.now(timezone.utc)
 
-        # Prepare user data for analysis
-        user_summary = []
-        for user in users:
-            last_sign_in = user.get("last_sign_in")
-            if last_sign_in:
-                last_sign_in_str = last_sign_in.isoformat() if hasattr(last_sign_in, 'isoformat') else str(last_sign_in)
-            else:
-                last_sign_in_str = "Never"
-
-            user_summary.append({
-                "email": user.get("email"),
-                "name": user.get("display_name"),
-                "enabled": user.get("account_enabled"),
-                "last_sign_in": last_sign_in_str,
-                "license": user.get("license_type")
-            })
-
-        prompt = f"""Analyze the following Microsoft 365 user accounts and identify which users should be considered for cleanup (disabling or deletion).
-
-Users:
-{user_summary}
-
-Please identify:
-1. Users who have never signed in
-2. Users who haven't signed in for over 90 days
-3. Disabled users that still have licenses
-4. Any other anomalies
-
-Provide specific recommendations for each user that should be cleaned up, including the action to take (disable or delete) and the reason."""
-
-        message = self.client.messages.create(
-            model="claude-sonnet-4-5-20250929",
-            max_tokens=2000,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
+        # Classify locally first; only ambiguous candidates go to Claude
+        result = prefilter_users(users, self.settings.ai_inactive_days, now)
+        prefilter_ms = (time.perf_counter() - started) * 1000
+
+        summary = self._summarize_resolved(result)
+        chunks = chunked(result.ambiguous, self.settings.ai_chunk_size)
+
+        # Map: analyze chunks concurrently
+        semaphore = asyncio.Semaphore(self.settings.ai_max_concurrency)
 
-        response_text = message.content[0].text
+        done = 0
+
+        async def run_chunk(index: int, chunk: List[Tuple[str, Any]]):
+            nonlocal done
+            async with semaphore:
+                chunk_result = await self._analyze_chunk(chunk, index, len(chunks), result, now)
+            done += 1
+            if on_chunk_done:
+                on_chunk_done(done, len(chunks))
+            return chunk_result
+
+        llm_started = time.perf_counter()
+        chunk_results = await asyncio.gather(
+            *(run_chunk(i, chunk) for i, chunk in enumerate(chunks))
+        )
+        llm_ms = (time.perf_counter() - llm_started) * 1000
+
+        # Reduce: merge local findings with each chunk's analysis
+        sections = [summary] + [text for text, _, _ in chunk_results]
+        response_text = "\n\n".join(section for section in sections if section)
+
+        recommendations = self._resolved_recommendations(result)
+        for text, _, _ in chunk_results:
+            recommendations.extend(self._parse_recommendations(text))
+
+        input_tokens = sum(usage.input_tokens for _, usage, _ in chunk_results)
+        output_tokens = sum(usage.output_tokens for _, usage, _ in chunk_results)
+        baseline_tokens = estimate_tokens(legacy_prompt_chars(users))
+        llm_ms_sequential = sum(elapsed for _, _, elapsed in chunk_results)
+
+        stats = {
+            "users_total": result.total,
+            "users_active": result.active,
+            "users_resolved_locally": result.resolved_count,
+            "users_sent_to_llm": len(result.ambiguous),
+            "llm_calls": len(chunks),
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "baseline_input_tokens_estimate": baseline_tokens,
+            "input_tokens_saved_estimate": max(baseline_tokens - input_tokens, 0),
+            "prefilter_ms": round(prefilter_ms, 2),
+            "llm_ms": round(llm_ms, 2),
+            "latency_saved_ms": round(max(llm_ms_sequential - llm_ms, 0), 2),
+            "total_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+        logger.info(f"User analysis stats: {stats}")
 
         return {
             "response": response_text,
-            "recommendations": self._parse_recommendations(response_text)
+            "recommendations": recommendations,
+            "stats": stats
         }
 
+    async def _analyze_chunk(self, chunk: list, index: int, count: int, result, now: datetime):
+        """Send one chunk of ambiguous candidates to Claude"""
+        table = encode_candidates(chunk, now)
+        part = f" (part {index + 1} of {count})" if count > 1 else ""
+
+        prompt = f"""Analyze the following Microsoft 365 user accounts{part} and identify which users should be considered for cleanup (disabling or deletion).
+
+Tenant summary: {result.total} users, {result.active} active, {result.resolved_count} disabled accounts already handled. Inactivity threshold: {self.settings.ai_inactive_days} days.
+
+Candidates are pipe-separated, one per line. cat: N = never signed in, I = inactive past threshold, U = enabled without license, D = disabled without license but signed in within the threshold (or never). days = days since last sign-in, "-" = never or unknown.
+
+{table}
+
+Some of these may be service accounts, shared mailboxes or recent hires, and D accounts may be mid-offboarding. Provide specific recommendations for each user that should be cleaned up, including their email, the action to take (disable or delete) and the reason."""
+
+        started = time.perf_counter()
+        async with upstream_call("anthropic.messages", "anthropic"):
+            message = await self.client.messages.create(
+                model=MODEL,
+                max_tokens=2000,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ]
+            )
+        elapsed = (time.perf_counter() - started) * 1000
+
+        return message.content[0].text, message.usage, elapsed
+
+    def _summarize_resolved(self, result) -> str:
+        """Describe locally resolved findings"""
+        lines = []
+        for category, (action, reason) in RESOLVED_ACTIONS.items():
+            count = len(result.resolved.get(category, []))
+            if count:
+                lines.append(f"- {count} user(s) to {action}: {reason}")
+        if not lines:
+            return ""
+        return "Rule-based findings:\n" + "\n".join(lines)
+
+    def _resolved_recommendations(self, result) -> List[str]:
+        """One recommendation per locally resolved user"""
+        recommendations = []
+        for category, (action, reason) in RESOLVED_ACTIONS.items():
+            for user in result.resolved.get(category, []):
+                recommendations.append(f"{action.capitalize()} {user.get('email')}: {reason}")
+        return recommendations
+
     async def ask(self, question: str, context: Optional[Dict[str, Any]] = None) -> str:
         """Ask Claude for recommendations"""
 
@@ -63,13 +160,14 @@ Provide specific recommendations for each user that should be cleaned up, includ
         if context:
             prompt = f"Context: {context}\n\nQuestion: {question}"
 
-        message = self.client.messages.create(
-            model="claude-sonnet-4-5-20250929",
-            max_tokens=1500,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
+        async with upstream_call("anthropic.messages", "anthropic"):
+            message = await self.client.messages.create(
+                model=MODEL,
+                max_tokens=1500,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ]
+            )
 
         return message.content[0].text
 
@@ -0,0 +1,91 @@
+"""Content-addressed, SQLite-backed cache for AI results"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Optional
+from sqlalchemy.orm import Session
+from database import AIResultCache
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# User fields that affect the analysis
+SNAPSHOT_FIELDS = (
+    "id", "email", "display_name", "account_enabled",
+    "last_sign_in", "license_type", "department", "manager"
+)
+
+
+def _canonical(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def _normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def fingerprint_users(users: Iterable[Any]) -> str:
+    """Order-independent fingerprint of a user snapshot"""
+    rows = sorted(
+        _canonical([user.get(name) for name in SNAPSHOT_FIELDS])
+        for user in users
+    )
+    digest = hashlib.sha256()
+    for row in rows:
+        digest.update(row.encode())
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def result_key(kind: str, **parts: Any) -> str:
+    """Hash of the normalized input of an AI call"""
+    normalized = {
+        name: _normalize_text(value) if isinstance(value, str) else value
+        for name, value in parts.items()
+    }
+    return hashlib.sha256(f"{kind}:{_canonical(normalized)}".encode()).hexdigest()
+
+
+def get_result(db: Session, key: str, ttl_seconds: int) -> Optional[Dict[str, Any]]:
+    """Return a cached result if present and not expired"""
+    row = db.get(AIResultCache, key)
+    if row is None:
+        return None
+
+    if row.created_at < datetime.utcnow() - timedelta(seconds=ttl_seconds):
+        db.delete(row)
+        db.commit()
+        return None
+
+    return json.loads(row.payload)
+
+
+def put_result(
+    db: Session,
+    key: str,
+    kind: str,
+    payload: Dict[str, Any],
+    snapshot: Optional[str] = None
+) -> None:
+    """Store a result under its content key"""
+    db.merge(AIResultCache(
+        key=key,
+        kind=kind,
+        snapshot=snapshot,
+        payload=_canonical(payload),
+        created_at=datetime.utcnow()
+    ))
+    db.commit()
+
+
+def invalidate_stale_snapshots(db: Session, kind: str, snapshot: str) -> int:
+    """Drop results computed over any other user snapshot"""
+    removed = (
+        db.query(AIResultCache)
+        .filter(AIResultCache.kind == kind, AIResultCache.snapshot != snapshot)
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    if removed:
+        logger.info(f"Invalidated {removed} cached {kind} result(s) for previous user snapshots")
+    return removed
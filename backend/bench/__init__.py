@@ -0,0 +1 @@
+"""Offline benchmark harness"""
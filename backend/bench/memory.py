@@ -0,0 +1,91 @@
+"""Memory benchmark: cached user snapshot layouts
+
+Compares what the user cache retains under the previous layout (a pydantic
+UserListResponse dump per cache key: all users plus one per domain filter)
+with the compact UserStore, for synthetic directories of the given sizes.
+
+Usage:
+    python -m bench.memory --users 10000,100000
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List
+import argparse
+import gc
+import json
+import tracemalloc
+
+from models import UserListResponse
+from user_store import UserStore
+
+DOMAINS = ["contoso.com", "fabrikam.com", "example.org"]
+DEPARTMENTS = ["Engineering", "Sales", "Finance", "Marketing", "Support", "Operations", "Legal", "HR"]
+LICENSES = ["Business Standard", "Business Basic", None]
+
+
+def provider_users(count: int) -> List[Dict[str, Any]]:
+    """User dicts as MicrosoftGraphProvider.get_users builds them from Graph JSON"""
+    epoch = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    # Round-trip through JSON so every string is a distinct object, as when parsed from Graph
+    raw = json.loads(json.dumps([
+        {
+            "id": f"00000000-0000-0000-0000-{i:012d}",
+            "email": f"user{i}@{DOMAINS[i % len(DOMAINS)]}",
+            "display_name": f"User {i}",
+            "domain": DOMAINS[i % len(DOMAINS)],
+            "account_enabled": i % 9 != 0,
+            "license_type": LICENSES[i % len(LICENSES)],
+            "department": DEPARTMENTS[i % len(DEPARTMENTS)],
+            "manager": f"User {i // 10}",
+        }
+        for i in range(count)
+    ]))
+    for i, user in enumerate(raw):
+        user["last_sign_in"] = None if i % 13 == 0 else epoch - timedelta(days=i % 240, seconds=i)
+    return raw
+
+
+def legacy_layout(users: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Cache contents before UserStore: one validated dump per cache key"""
+    cached = {"users:all": UserListResponse(users=users, total=len(users), monthly_cost=0.0).model_dump()}
+    for domain in DOMAINS:
+        subset = [user for user in users if user["domain"] == domain]
+        cached[f"users:{domain}"] = UserListResponse(users=subset, total=len(subset), monthly_cost=0.0).model_dump()
+    return cached
+
+
+def compact_layout(users: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"users:all": UserStore(users)}
+
+
+def retained_bytes(build: Callable[[List[Dict[str, Any]]], Any], count: int) -> int:
+    """Bytes still allocated once the provider output is discarded and only the cache remains"""
+    gc.collect()
+    tracemalloc.start()
+    users = provider_users(count)
+    cached = build(users)
+    del users
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del cached
+    return retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare cached user snapshot memory layouts")
+    parser.add_argument("--users", default="1000,10000,100000", help="Comma-separated directory sizes")
+    args = parser.parse_args()
+
+    print(f"{'users':>8} {'legacy MB':>10} {'compact MB':>11} {'B/user legacy':>14} {'B/user compact':>15} {'ratio':>6}")
+    for count in (int(size) for size in args.users.split(",")):
+        legacy = retained_bytes(legacy_layout, count)
+        compact = retained_bytes(compact_layout, count)
+        print(
+            f"{count:>8} {legacy / 2**20:>10.1f} {compact / 2**20:>11.1f} "
+            f"{legacy // count:>14} {compact // count:>15} {legacy / compact:>6.1f}x",
+            flush=True
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Local Microsoft Graph change-notification simulator
+
+Plays Graph's side of the webhook protocol against a running JARVIS:
+the subscription validation handshake, then batches of user change
+notifications signed with the configured client state.
+
+Usage:
+    python -m bench.notify_sim --url http://localhost:8000 --client-state secret --validate
+    python -m bench.notify_sim --client-state secret --updated <id>,<id> --deleted <id>
+    python -m bench.notify_sim --client-state secret --tenant-id <MICROSOFT_TENANT_ID> --created <id>
+    python -m bench.notify_sim --client-state secret --random 500 --users 10000 --batch 100
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+import argparse
+import random
+import sys
+import time
+import uuid
+
+import httpx
+
+WEBHOOK_PATH = "/api/webhooks/graph"
+
+
+# Notifications are routed by tenant id: pass the tenant_id of a configured tenant
+DEFAULT_TENANT_ID = "00000000-0000-0000-0000-000000000000"
+
+
+def notification(
+    user_id: str,
+    change_type: str,
+    client_state: str,
+    subscription_id: str,
+    tenant_id: str = DEFAULT_TENANT_ID
+) -> Dict:
+    """A user change notification in Graph's wire format"""
+    expires = datetime.now(timezone.utc) + timedelta(days=2)
+    return {
+        "subscriptionId": subscription_id,
+        "subscriptionExpirationDateTime": expires.isoformat().replace("+00:00", "Z"),
+        "changeType": change_type,
+        "resource": f"Users/{user_id}",
+        "resourceData": {
+            "@odata.type": "#Microsoft.Graph.User",
+            "@odata.id": f"Users/{user_id}",
+            "id": user_id,
+            "organizationId": tenant_id,
+        },
+        "clientState": client_state,
+        "tenantId": tenant_id,
+    }
+
+
+def stub_user_id(index: int) -> str:
+    """User ids generated by bench.stubs"""
+    return f"00000000-0000-0000-0000-{index:012d}"
+
+
+def validate(client: httpx.Client) -> bool:
+    token = uuid.uuid4().hex
+    response = client.post(WEBHOOK_PATH, params={"validationToken": token})
+    ok = response.status_code == 200 and response.text == token
+    print(f"validation handshake: {'ok' if ok else 'FAILED'} ({response.status_code})")
+    return ok
+
+
+def send(client: httpx.Client, notifications: List[Dict], batch: int) -> bool:
+    ok = True
+    for start in range(0, len(notifications), batch):
+        chunk = notifications[start:start + batch]
+        started = time.perf_counter()
+        response = client.post(WEBHOOK_PATH, json={"value": chunk})
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"sent {len(chunk)} notification(s): {response.status_code} in {elapsed:.1f}ms")
+        ok = ok and response.status_code == 202
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate Graph user change notifications")
+    parser.add_argument("--url", default="http://localhost:8000", help="JARVIS base URL")
+    parser.add_argument("--client-state", required=True, help="Must match GRAPH_CLIENT_STATE")
+    parser.add_argument("--validate", action="store_true", help="Run the validation handshake")
+    parser.add_argument("--tenant-id", default=DEFAULT_TENANT_ID, help="Directory id of a configured tenant")
+    parser.add_argument("--created", default="", help="Comma-separated user ids")
+    parser.add_argument("--updated", default="", help="Comma-separated user ids")
+    parser.add_argument("--deleted", default="", help="Comma-separated user ids")
+    parser.add_argument("--random", type=int, default=0, help="Random changes against stub user ids")
+    parser.add_argument("--users", type=int, default=1000, help="Stub directory size for --random")
+    parser.add_argument("--batch", type=int, default=100, help="Notifications per POST")
+    args = parser.parse_args()
+
+    subscription_id = str(uuid.uuid4())
+    notifications = [
+        notification(user_id, change_type, args.client_state, subscription_id, args.tenant_id)
+        for change_type, ids in (("created", args.created), ("updated", args.updated), ("deleted", args.deleted))
+        for user_id in filter(None, ids.split(","))
+    ]
+    for _ in range(args.random):
+        change_type = "deleted" if random.random() < 0.1 else "updated"
+        user_id = stub_user_id(random.randrange(args.users))
+        notifications.append(notification(user_id, change_type, args.client_state, subscription_id, args.tenant_id))
+
+    ok = True
+    with httpx.Client(base_url=args.url, timeout=30.0) as client:
+        if args.validate:
+            ok = validate(client)
+        if notifications:
+            ok = send(client, notifications, args.batch) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
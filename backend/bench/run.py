@@ -0,0 +1,435 @@
+"""Offline benchmark driver for the JARVIS API
+
+Starts the stub upstreams in a subprocess, points every provider at them and
+drives the API in-process through an ASGI transport. Reports throughput,
+p50/p99 latency and memory per scenario and dataset size, and can store or
+compare against baselines in bench/baselines/.
+
+Usage:
+    python -m bench.run --users 1000,10000 --latency-ms 20
+    python -m bench.run --users 100000 --scenarios users_cold,users_warm --save-baseline main
+    python -m bench.run --users 1000 --compare main
+"""
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+
+SCENARIOS = [
+    "users_cold", "users_warm", "users_stampede", "tenants_users_cold", "servers_cold", "servers_warm", "rollups_warm", "stats_warm",
+    "licenses_warm", "search_warm", "expiring_warm", "export_users", "analyze_cold", "analyze_warm", "create_user", "bulk_create", "disable_user", "disable_under_load", "delete_user",
+]
+
+
+@dataclass
+class ScenarioResult:
+    scenario: str
+    users: int
+    requests: int
+    errors: int
+    throughput_rps: float
+    p50_ms: float
+    p99_ms: float
+    rss_mb: float
+    rss_delta_mb: float
+    peak_alloc_mb: Optional[float] = None
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        # Peak RSS is the best portable approximation (KB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+class StubProcess:
+    """Stub upstreams running in a child process"""
+
+    def __init__(self, **config):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.config = config
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self) -> None:
+        args = [sys.executable, "-m", "bench.stubs", "--port", str(self.port)]
+        for name, value in self.config.items():
+            args += [f"--{name.replace('_', '-')}", str(value)]
+        self.process = subprocess.Popen(args, cwd=BACKEND_DIR)
+
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                httpx.get(f"{self.url}/health", timeout=1.0).raise_for_status()
+                return
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        self.stop()
+        raise RuntimeError("Stub upstreams did not start")
+
+    def configure(self, **config) -> None:
+        httpx.post(f"{self.url}/_control", json=config, timeout=10.0).raise_for_status()
+
+    def request_counts(self) -> Dict[str, int]:
+        return httpx.get(f"{self.url}/_control", timeout=10.0).json()["requests"]
+
+    def stop(self) -> None:
+        if self.process:
+            self.process.terminate()
+            self.process.wait(timeout=10)
+            self.process = None
+
+
+def configure_environment(stub_url: str, database_path: str, tenants: int = 1) -> None:
+    """Point every provider at the stubs; must run before main is imported"""
+    # Extra tenants all talk to the same stub directory
+    extra_tenants = [
+        {"id": f"tenant{i}", "tenant_id": f"bench-tenant-{i}", "client_id": "bench-client", "client_secret": "bench-secret"}
+        for i in range(1, tenants)
+    ]
+    os.environ.update({
+        "MICROSOFT_TENANTS": json.dumps(extra_tenants),
+        "DATABASE_URL": f"sqlite:///{database_path}",
+        "MICROSOFT_TENANT_ID": "bench-tenant",
+        "MICROSOFT_CLIENT_ID": "bench-client",
+        "MICROSOFT_CLIENT_SECRET": "bench-secret",
+        "GRAPH_API_BASE": f"{stub_url}/graph/v1.0",
+        "DO_TOKEN": "bench-token",
+        "DO_API_BASE": f"{stub_url}/do/v2",
+        "AWS_ACCESS_KEY_ID": "AKIABENCHMARK",
+        "AWS_SECRET_ACCESS_KEY": "bench-secret",
+        "AWS_ENDPOINT_URL": f"{stub_url}/aws/",
+        "GODADDY_API_KEY": "bench-key",
+        "GODADDY_API_SECRET": "bench-secret",
+        "GODADDY_API_BASE": f"{stub_url}/godaddy/v1",
+        "ANTHROPIC_API_KEY": "bench-key",
+        "ANTHROPIC_BASE_URL": f"{stub_url}/anthropic",
+        # One bench client stands in for many users; concurrency limits still apply
+        "ADMISSION_CLIENT_RATE_PER_MINUTE": "1000000",
+        "ADMISSION_CLIENT_BURST": "1000000",
+    })
+    sys.path.insert(0, str(BACKEND_DIR))
+
+
+def use_stub_token_endpoint(stub_url: str) -> None:
+    """Fetch Graph tokens from the stub
+
+    MSAL only accepts https authorities, so the client-credentials exchange is
+    replaced by a plain POST to the stub token endpoint with the same latency.
+    Tokens are kept per provider instance, like MSAL's in-memory token cache.
+    """
+    from providers.microsoft import MicrosoftGraphProvider
+
+    def get_access_token(self) -> str:
+        if getattr(self, "_bench_token", None) is None:
+            response = httpx.post(f"{stub_url}/token", data={"grant_type": "client_credentials"})
+            response.raise_for_status()
+            self._bench_token = response.json()["access_token"]
+        return self._bench_token
+
+    MicrosoftGraphProvider._get_access_token = get_access_token
+
+
+async def measure(
+    name: str,
+    users: int,
+    send: Callable[[int], Awaitable[httpx.Response]],
+    requests: int,
+    concurrency: int,
+    before_each: Optional[Callable[[], None]] = None,
+    trace_memory: bool = False
+) -> ScenarioResult:
+    """Issue `requests` calls with bounded concurrency and collect latencies"""
+    latencies: List[float] = []
+    errors = 0
+    counter = 0
+    # Per-request setup (e.g. cache clears) would race with concurrent requests
+    concurrency = 1 if before_each else concurrency
+
+    async def worker():
+        nonlocal errors, counter
+        while counter < requests:
+            index = counter
+            counter += 1
+            if before_each:
+                before_each()
+            started = time.perf_counter()
+            try:
+                response = await send(index)
+                if response.status_code >= 400:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    rss_before = rss_mb()
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    peak_alloc = None
+    if trace_memory:
+        peak_alloc = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    rss_after = rss_mb()
+
+    return ScenarioResult(
+        scenario=name,
+        users=users,
+        requests=len(latencies),
+        errors=errors,
+        throughput_rps=round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        p50_ms=round(percentile(latencies, 50), 2),
+        p99_ms=round(percentile(latencies, 99), 2),
+        rss_mb=round(rss_after, 1),
+        rss_delta_mb=round(rss_after - rss_before, 1),
+        peak_alloc_mb=round(peak_alloc, 1) if peak_alloc is not None else None,
+    )
+
+
+def start_background_load(workers: int) -> List[asyncio.Task]:
+    """Full user listings at background priority, like jobs and cache refreshes"""
+    from scheduler import priority, BACKGROUND
+    from tenants import tenant_registry
+
+    async def worker():
+        with priority(BACKGROUND, max_wait=None):
+            while True:
+                await tenant_registry.provider().get_users()
+
+    return [asyncio.create_task(worker()) for _ in range(workers)]
+
+
+async def run_size(client: httpx.AsyncClient, users: int, args) -> List[ScenarioResult]:
+    """Run the selected scenarios against one dataset size"""
+    from cache import cache
+    from database import SessionLocal, AIResultCache
+
+    def clear_cache():
+        cache.clear()
+
+    def clear_ai_results():
+        db = SessionLocal()
+        try:
+            db.query(AIResultCache).delete()
+            db.commit()
+        finally:
+            db.close()
+
+    def user_id(index: int) -> str:
+        return f"00000000-0000-0000-0000-{index % users:012d}"
+
+    def bulk_csv(index: int) -> bytes:
+        rows = "".join(
+            f"Bulk User {index}-{row},bulk{index}x{row},contoso.com,Engineering\n"
+            for row in range(args.bulk_rows)
+        )
+        return ("full_name,username,domain,department\n" + rows).encode()
+
+    async def analyze(index: int) -> httpx.Response:
+        """Request an analysis and, when it was queued, follow the job to its result"""
+        response = await client.post("/api/analyze-users")
+        if response.status_code != 202:
+            return response
+        job_id = response.json()["job_id"]
+        while True:
+            job = (await client.get(f"/api/jobs/{job_id}")).json()
+            if job["status"] in ("succeeded", "failed"):
+                return await client.get(f"/api/jobs/{job_id}/result")
+            await asyncio.sleep(0.05)
+
+    scenarios = {
+        "users_cold": (lambda i: client.get("/api/users"), clear_cache, args.cold_requests),
+        "users_warm": (lambda i: client.get("/api/users"), None, args.requests),
+        "users_stampede": (lambda i: client.get("/api/users"), None, args.requests),
+        "tenants_users_cold": (lambda i: client.get("/api/tenants/users"), clear_cache, args.cold_requests),
+        "servers_cold": (lambda i: client.get("/api/servers"), clear_cache, args.cold_requests),
+        "servers_warm": (lambda i: client.get("/api/servers"), None, args.requests),
+        "rollups_warm": (lambda i: client.get(
+            "/api/servers/rollups", params={"by": ("provider,region", "size,status", "region")[i % 3]}
+        ), None, args.requests),
+        "stats_warm": (lambda i: client.get("/api/stats"), None, args.requests),
+        "licenses_warm": (lambda i: client.get("/api/licenses"), None, args.requests),
+        "export_users": (lambda i: client.get("/api/export/users"), None, args.cold_requests),
+        "expiring_warm": (lambda i: client.get("/api/expiring", params={"within": 365}), None, args.requests),
+        "search_warm": (lambda i: client.get("/api/search", params={"q": f"user {i % 1000}"}), None, args.requests),
+        "analyze_cold": (analyze, clear_ai_results, args.cold_requests),
+        "analyze_warm": (analyze, None, args.requests),
+        "create_user": (lambda i: client.post("/api/users", json={
+            "full_name": f"Bench User {i}",
+            "username": f"bench{i}",
+            "domain": "contoso.com",
+        }), None, args.requests),
+        "bulk_create": (lambda i: client.post(
+            "/api/users/bulk", content=bulk_csv(i), headers={"Content-Type": "text/csv"}
+        ), None, args.cold_requests),
+        "disable_user": (lambda i: client.post(f"/api/users/{user_id(i)}/disable"), None, args.requests),
+        "disable_under_load": (lambda i: client.post(f"/api/users/{user_id(i)}/disable"), None, args.requests),
+        "delete_user": (lambda i: client.delete(f"/api/users/{user_id(i + args.requests)}"), None, args.requests),
+    }
+
+    results = []
+    for name in args.scenarios:
+        send, before_each, requests = scenarios[name]
+        if name.endswith("_warm"):
+            # Prime the cache so only the warm path is measured
+            await send(0)
+        if name.endswith("_stampede"):
+            # Every request arrives at an empty cache at once
+            clear_cache()
+        load = start_background_load(args.background_load) if name.endswith("_under_load") else []
+        try:
+            result = await measure(name, users, send, requests, args.concurrency, before_each, args.trace_memory)
+        finally:
+            for task in load:
+                task.cancel()
+            await asyncio.gather(*load, return_exceptions=True)
+        print(
+            f"{name:>14} users={users:<7} n={result.requests:<5} err={result.errors:<3} "
+            f"rps={result.throughput_rps:<9} p50={result.p50_ms:<9} p99={result.p99_ms:<9} "
+            f"rss={result.rss_mb}MB (+{result.rss_delta_mb})"
+            + (f" peak_alloc={result.peak_alloc_mb}MB" if result.peak_alloc_mb is not None else ""),
+            flush=True
+        )
+        results.append(result)
+    return results
+
+
+def compare(results: List[ScenarioResult], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """List regressions against a baseline beyond the tolerance"""
+    regressions = []
+    for result in results:
+        key = f"{result.scenario}@{result.users}"
+        base = baseline.get(key)
+        if base is None:
+            continue
+        for metric in ("p50_ms", "p99_ms"):
+            if base[metric] and getattr(result, metric) > base[metric] * (1 + tolerance):
+                regressions.append(f"{key} {metric}: {getattr(result, metric)} > {base[metric]}")
+        if base["throughput_rps"] and result.throughput_rps < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{key} throughput_rps: {result.throughput_rps} < {base['throughput_rps']}")
+        if result.errors > base["errors"]:
+            regressions.append(f"{key} errors: {result.errors} > {base['errors']}")
+    return regressions
+
+
+async def run(args) -> int:
+    stub = StubProcess(latency_ms=args.latency_ms, llm_latency_ms=args.llm_latency_ms,
+                       throttle_rate=args.throttle_rate, instances=args.instances, droplets=args.droplets,
+                       graph_capacity=args.graph_capacity)
+    stub.start()
+    database = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    database.close()
+
+    try:
+        configure_environment(stub.url, database.name, args.tenants)
+        use_stub_token_endpoint(stub.url)
+        from main import app
+
+        await app.router.startup()
+        results: List[ScenarioResult] = []
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                for users in args.users:
+                    stub.configure(users=users)
+                    from cache import cache
+                    cache.clear()
+                    results.extend(await run_size(client, users, args))
+                    print(f"{'':>14} upstream requests: {stub.request_counts()}", flush=True)
+        finally:
+            await app.router.shutdown()
+    finally:
+        stub.stop()
+        os.unlink(database.name)
+
+    if args.save_baseline:
+        BASELINE_DIR.mkdir(exist_ok=True)
+        path = BASELINE_DIR / f"{args.save_baseline}.json"
+        path.write_text(json.dumps(
+            {f"{r.scenario}@{r.users}": asdict(r) for r in results}, indent=2
+        ) + "\n")
+        print(f"Saved baseline to {path}")
+
+    if args.compare:
+        baseline = json.loads((BASELINE_DIR / f"{args.compare}.json").read_text())
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"No regressions against baseline '{args.compare}'")
+
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JARVIS against local stub upstreams")
+    parser.add_argument("--users", default="1000,10000", help="Comma-separated dataset sizes")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated scenarios")
+    parser.add_argument("--requests", type=int, default=50, help="Requests per warm/mutation scenario")
+    parser.add_argument("--tenants", type=int, default=4, help="Tenants for tenants_users_cold")
+    parser.add_argument("--bulk-rows", type=int, default=100, help="CSV rows per bulk_create request")
+    parser.add_argument("--cold-requests", type=int, default=5, help="Requests per cold scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Upstream latency per request")
+    parser.add_argument("--llm-latency-ms", type=float, default=500.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of Graph calls throttled")
+    parser.add_argument("--graph-capacity", type=int, default=16, help="Graph requests the stub serves at once")
+    parser.add_argument("--background-load", type=int, default=32,
+                        help="Concurrent background listings during *_under_load scenarios")
+    parser.add_argument("--instances", type=int, default=200, help="AWS instances")
+    parser.add_argument("--droplets", type=int, default=50)
+    parser.add_argument("--trace-memory", action="store_true", help="Record peak allocations (slower)")
+    parser.add_argument("--save-baseline", metavar="NAME")
+    parser.add_argument("--compare", metavar="NAME")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    args.users = [int(size) for size in args.users.split(",")]
+    args.scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Search benchmark: typeahead index size and latency
+
+Builds a synthetic directory, then reports the index's retained memory next
+to the raw provider snapshot and the compact UserStore, its build time,
+query latency for typical typeahead input, and the cost of incremental
+updates.
+
+Usage:
+    python -m bench.search --users 100000 --queries 500
+"""
+from typing import Any, Callable, List
+import argparse
+import gc
+import random
+import statistics
+import time
+import tracemalloc
+
+from bench.memory import provider_users
+from user_store import UserStore
+
+
+def retained_bytes(build: Callable[[], Any]) -> tuple:
+    """(value, bytes it retains) for whatever `build` returns"""
+    gc.collect()
+    tracemalloc.start()
+    value = build()
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, retained
+
+
+def sample_queries(store: UserStore, count: int) -> List[str]:
+    """Prefixes of names, emails and departments as a user types them"""
+    queries = []
+    for _ in range(count):
+        user = store[random.randrange(len(store))]
+        text = random.choice((user.display_name, user.email, user.department or user.email))
+        queries.append(text[:random.randint(1, min(len(text), 12))])
+    return queries
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the typeahead search index")
+    parser.add_argument("--users", type=int, default=100000, help="Directory size")
+    parser.add_argument("--queries", type=int, default=500, help="Queries to time")
+    parser.add_argument("--updates", type=int, default=2000, help="Incremental changes to time")
+    args = parser.parse_args()
+    random.seed(42)
+
+    raw, raw_bytes = retained_bytes(lambda: provider_users(args.users))
+    store, store_bytes = retained_bytes(lambda: UserStore(raw))
+    del raw
+
+    started = time.perf_counter()
+    _, index_bytes = retained_bytes(lambda: store.search_index)
+    build = time.perf_counter() - started
+    # Built again untraced for a fair build time
+    store._search = None
+    started = time.perf_counter()
+    index = store.search_index
+    build = time.perf_counter() - started
+
+    print(f"users:          {len(store)}")
+    print(f"raw snapshot:   {raw_bytes / 2**20:.1f} MB")
+    print(f"user store:     {store_bytes / 2**20:.1f} MB")
+    print(f"search index:   {index_bytes / 2**20:.1f} MB ({raw_bytes / index_bytes:.1f}x smaller than raw)")
+    print(f"build:          {build * 1000:.0f} ms")
+
+    timings = []
+    for query in sample_queries(store, args.queries):
+        started = time.perf_counter()
+        index.search(query, 10)
+        timings.append((time.perf_counter() - started) * 1000)
+    print(
+        f"query:          p50 {statistics.median(timings):.2f} ms, "
+        f"p99 {percentile(timings, 0.99):.2f} ms, max {max(timings):.2f} ms"
+    )
+
+    started = time.perf_counter()
+    for i in range(args.updates):
+        user = store[random.randrange(len(store))]
+        if i % 4 == 0:
+            store.remove(user.id)
+        else:
+            store.update(user.id, display_name=f"Renamed {i}", department="Operations")
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"updates:        {args.updates} in {elapsed:.0f} ms ({elapsed * 1000 / args.updates:.0f} us each)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Cold-start import benchmark
+
+Imports `main` in fresh interpreters under `python -X importtime`, reports
+the median total import time and the slowest modules, and fails when the
+budget is exceeded or a lazily loaded SDK is imported at startup.
+
+Usage:
+    python -m bench.startup
+    python -m bench.startup --budget-ms 1500 --runs 5
+"""
+from pathlib import Path
+from typing import Dict, List, Tuple
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# SDKs and optional libraries that must only load on first use (or in the background prewarm)
+LAZY_MODULES = ("msal", "boto3", "botocore", "anthropic", "pyarrow", "numpy")
+
+LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def import_times(module: str) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """Run one cold import and return (cumulative, self) microseconds per module"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+    cumulative: Dict[str, int] = {}
+    self_times: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            name = match.group(4)
+            self_times[name] = int(match.group(1))
+            cumulative[name] = int(match.group(2))
+    return cumulative, self_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure JARVIS cold-start import time")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=2000.0, help="Fail if the median exceeds this")
+    parser.add_argument("--top", type=int, default=10, help="Slowest modules to list")
+    args = parser.parse_args()
+
+    totals: List[float] = []
+    cumulative: Dict[str, int] = {}
+    self_times: Dict[str, int] = {}
+    for _ in range(args.runs):
+        cumulative, self_times = import_times(args.module)
+        totals.append(cumulative[args.module] / 1000)
+
+    median = statistics.median(totals)
+    print(f"import {args.module}: median {median:.0f}ms over {args.runs} runs "
+          f"(min {min(totals):.0f}ms, max {max(totals):.0f}ms)")
+
+    print("Slowest modules (self time, last run):")
+    for name, micros in sorted(self_times.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {micros / 1000:8.1f}ms  {name}")
+
+    failures = []
+    eager = sorted({
+        name.split(".")[0] for name in cumulative
+        if name.split(".")[0] in LAZY_MODULES
+    })
+    if eager:
+        failures.append(f"SDKs imported at startup: {', '.join(eager)}")
+    if median > args.budget_ms:
+        failures.append(f"median import time {median:.0f}ms exceeds budget {args.budget_ms:.0f}ms")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,452 @@
+"""Local stub upstreams for offline benchmarking
+
+Serves fake Microsoft Graph, DigitalOcean, GoDaddy, AWS EC2 and Anthropic
+endpoints from a single process, with configurable latency, dataset sizes
+and Graph throttling. Datasets are generated on the fly from the record
+index, so 100k users cost no memory in the stub.
+
+Usage:
+    python -m bench.stubs --port 8900 --users 10000 --latency-ms 20
+"""
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
+from providers.aws import AWS_REGIONS
+import argparse
+import asyncio
+import httpx
+import json
+import random
+import re
+import uuid
+
+AWS_INSTANCE_TYPES = ["t2.micro", "t3.small", "t3.medium", "m5.large", "c5.xlarge", "r5.large", "m6i.large"]
+DEPARTMENTS = ["Engineering", "Sales", "Finance", "Marketing", "Support", "Operations", "Legal", "HR"]
+DOMAINS = ["contoso.com", "fabrikam.com", "example.org"]
+SKU_IDS = ["f245ecc8-75af-4f8e-b61f-27d8114de5f3", "3b555118-da6a-4418-894f-7df1e2096870"]
+SKU_PART_NUMBERS = ["O365_BUSINESS_PREMIUM", "O365_BUSINESS_ESSENTIALS"]
+EPOCH = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+@dataclass
+class StubConfig:
+    users: int = 1000
+    droplets: int = 50
+    instances: int = 200
+    godaddy_domains: int = 20
+    certificates: int = 10
+    page_size: int = 100  # Graph default page size when $top is absent
+    latency_ms: float = 20.0  # Per-request latency for every upstream
+    llm_latency_ms: float = 500.0
+    throttle_rate: float = 0.0  # Fraction of Graph requests answered with 429
+    retry_after_seconds: int = 1
+    graph_capacity: int = 0  # Graph requests served at once; more queue up (0 = unlimited)
+    sign_in_activity: int = 1  # 0: selecting signInActivity is refused with 403, as without Entra ID P1
+
+
+config = StubConfig()
+deleted_users: set = set()
+disabled_users: set = set()
+created_users: dict = {}
+subscriptions: dict = {}
+request_counts: dict = {}
+
+app = FastAPI(title="JARVIS stub upstreams")
+
+
+_graph_slots: Optional[asyncio.Semaphore] = None
+_graph_slots_size = 0
+
+
+async def _delay(upstream: str, latency_ms: Optional[float] = None) -> None:
+    global _graph_slots, _graph_slots_size
+    request_counts[upstream] = request_counts.get(upstream, 0) + 1
+    latency = config.latency_ms if latency_ms is None else latency_ms
+    if upstream == "graph" and config.graph_capacity:
+        # A saturated Graph queues requests, so latency grows with load
+        if _graph_slots is None or _graph_slots_size != config.graph_capacity:
+            _graph_slots = asyncio.Semaphore(config.graph_capacity)
+            _graph_slots_size = config.graph_capacity
+        async with _graph_slots:
+            if latency > 0:
+                await asyncio.sleep(latency / 1000)
+    elif latency > 0:
+        await asyncio.sleep(latency / 1000)
+
+
+def _user(index: int) -> dict:
+    """Deterministic Graph user record for an index"""
+    domain = DOMAINS[index % len(DOMAINS)]
+    user_id = f"00000000-0000-0000-0000-{index:012d}"
+    licensed = index % 5 != 0
+    last_sign_in = None if index % 13 == 0 else EPOCH - timedelta(days=index % 240)
+    return {
+        "id": user_id,
+        "displayName": f"User {index}",
+        "mail": f"user{index}@{domain}",
+        "userPrincipalName": f"user{index}@{domain}",
+        "accountEnabled": index % 9 != 0 and user_id not in disabled_users,
+        "department": DEPARTMENTS[index % len(DEPARTMENTS)],
+        "assignedLicenses": [{"skuId": SKU_IDS[index % len(SKU_IDS)], "disabledPlans": []}] if licensed else [],
+        "signInActivity": {
+            "lastSignInDateTime": last_sign_in.isoformat().replace("+00:00", "Z") if last_sign_in else None
+        },
+        "manager": {"id": f"00000000-0000-0000-0000-{index // 10:012d}", "displayName": f"User {index // 10}"},
+    }
+
+
+def _shape(user: dict, params) -> dict:
+    """Drop what the query didn't $select or $expand, as Graph does"""
+    if "signInActivity" not in params.get("$select", ""):
+        user.pop("signInActivity", None)
+    if "manager" not in params.get("$expand", ""):
+        user.pop("manager", None)
+    return user
+
+
+def _sign_in_refused(params) -> Optional[Response]:
+    if not config.sign_in_activity and "signInActivity" in params.get("$select", ""):
+        return JSONResponse(
+            {"error": {"code": "Authentication_RequestFromNonPremiumTenantOrB2CTenant", "message": "Forbidden"}},
+            status_code=403
+        )
+    return None
+
+
+def _graph_throttled() -> Optional[Response]:
+    if config.throttle_rate and random.random() < config.throttle_rate:
+        request_counts["graph_throttled"] = request_counts.get("graph_throttled", 0) + 1
+        return JSONResponse(
+            {"error": {"code": "TooManyRequests", "message": "Too many requests"}},
+            status_code=429,
+            headers={"Retry-After": str(config.retry_after_seconds)}
+        )
+    return None
+
+
+# Control
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/_control")
+async def get_control():
+    return {"config": asdict(config), "requests": request_counts}
+
+
+@app.post("/_control")
+async def set_control(request: Request):
+    """Reconfigure latency and dataset sizes, resetting stub state"""
+    for key, value in (await request.json()).items():
+        if hasattr(config, key):
+            setattr(config, key, type(getattr(config, key))(value))
+    deleted_users.clear()
+    disabled_users.clear()
+    created_users.clear()
+    request_counts.clear()
+    return asdict(config)
+
+
+# Microsoft identity platform
+
+@app.post("/token")
+async def token():
+    await _delay("token")
+    return {"token_type": "Bearer", "expires_in": 3599, "access_token": "stub-token"}
+
+
+# Microsoft Graph
+
+@app.get("/graph/v1.0/domains")
+async def graph_domains():
+    await _delay("graph")
+    return {"value": [{"id": domain, "isVerified": True} for domain in DOMAINS]}
+
+
+@app.get("/graph/v1.0/subscribedSkus")
+async def graph_subscribed_skus():
+    await _delay("graph")
+    licensed = [i for i in range(config.users) if i % 5 != 0]
+    skus = []
+    for position, (sku_id, part_number) in enumerate(zip(SKU_IDS, SKU_PART_NUMBERS)):
+        consumed = sum(1 for i in licensed if i % len(SKU_IDS) == position)
+        skus.append({
+            "skuId": sku_id,
+            "skuPartNumber": part_number,
+            "appliesTo": "User",
+            "capabilityStatus": "Enabled",
+            "consumedUnits": consumed,
+            # Some seats bought and never assigned
+            "prepaidUnits": {"enabled": consumed + consumed // 10, "suspended": 0, "warning": 0},
+        })
+    return {"value": skus}
+
+
+@app.get("/graph/v1.0/users")
+async def graph_users(request: Request):
+    await _delay("graph")
+    throttled = _graph_throttled()
+    if throttled:
+        return throttled
+
+    params = request.query_params
+    refused = _sign_in_refused(params)
+    if refused:
+        return refused
+    top = min(int(params.get("$top", config.page_size)), 999)
+    start = int(params.get("$skiptoken", 0))
+    end = min(start + top, config.users)
+
+    users = [_shape(_user(i), params) for i in range(start, end)]
+    users = [user for user in users if user["id"] not in deleted_users]
+    if start == 0:
+        users.extend(created_users.values())
+
+    body = {"value": users}
+    if end < config.users:
+        query = "&".join(f"{key}={value}" for key, value in params.items() if key != "$skiptoken")
+        body["@odata.nextLink"] = f"{request.base_url}graph/v1.0/users?{query}&$skiptoken={end}"
+    return body
+
+
+@app.get("/graph/v1.0/reports/getOffice365ActiveUserDetail(period='D180')")
+async def graph_activity_report():
+    await _delay("graph")
+    rows = ["\ufeffReport Refresh Date,User Principal Name,Display Name,Is Deleted,Last Activity Date"]
+    for index in range(config.users):
+        user = _user(index)
+        last_sign_in = user["signInActivity"]["lastSignInDateTime"]
+        rows.append(
+            f"{EPOCH:%Y-%m-%d},{user['userPrincipalName']},{user['displayName']},False,{(last_sign_in or '')[:10]}"
+        )
+    return PlainTextResponse("\n".join(rows) + "\n", media_type="application/octet-stream")
+
+
+@app.get("/graph/v1.0/users/{user_id}")
+async def graph_user(user_id: str, request: Request):
+    await _delay("graph")
+    refused = _sign_in_refused(request.query_params)
+    if refused:
+        return refused
+    if user_id in created_users:
+        return created_users[user_id]
+    match = re.fullmatch(r"0{8}-0{4}-0{4}-0{4}-(\d{12})", user_id)
+    if not match or int(match.group(1)) >= config.users or user_id in deleted_users:
+        return JSONResponse({"error": {"code": "Request_ResourceNotFound", "message": "Not found"}}, status_code=404)
+    return _shape(_user(int(match.group(1))), request.query_params)
+
+
+@app.post("/graph/v1.0/users")
+async def graph_create_user(request: Request):
+    await _delay("graph")
+    throttled = _graph_throttled()
+    if throttled:
+        return throttled
+    body = await request.json()
+    user = {
+        "id": str(uuid.uuid4()),
+        "displayName": body.get("displayName"),
+        "mail": body.get("userPrincipalName"),
+        "userPrincipalName": body.get("userPrincipalName"),
+        "accountEnabled": body.get("accountEnabled", True),
+        "department": body.get("department"),
+        "assignedLicenses": [],
+    }
+    created_users[user["id"]] = user
+    return JSONResponse(user, status_code=201)
+
+
+@app.patch("/graph/v1.0/users/{user_id}")
+async def graph_update_user(user_id: str, request: Request):
+    await _delay("graph")
+    throttled = _graph_throttled()
+    if throttled:
+        return throttled
+    body = await request.json()
+    if body.get("accountEnabled") is False:
+        disabled_users.add(user_id)
+    return Response(status_code=204)
+
+
+@app.delete("/graph/v1.0/users/{user_id}")
+async def graph_delete_user(user_id: str):
+    await _delay("graph")
+    throttled = _graph_throttled()
+    if throttled:
+        return throttled
+    deleted_users.add(user_id)
+    created_users.pop(user_id, None)
+    return Response(status_code=204)
+
+
+@app.post("/graph/v1.0/subscriptions")
+async def graph_create_subscription(request: Request):
+    """Validate the notification URL like Graph does, then create the subscription"""
+    await _delay("graph")
+    body = await request.json()
+    token = uuid.uuid4().hex
+    try:
+        async with httpx.AsyncClient() as client:
+            response = await client.post(body["notificationUrl"], params={"validationToken": token}, timeout=10.0)
+        valid = response.status_code == 200 and response.text == token
+    except httpx.HTTPError:
+        valid = False
+    if not valid:
+        return JSONResponse(
+            {"error": {"code": "ValidationError", "message": "Subscription validation request failed"}},
+            status_code=400
+        )
+
+    subscription = {**body, "id": str(uuid.uuid4())}
+    subscriptions[subscription["id"]] = subscription
+    return JSONResponse(subscription, status_code=201)
+
+
+@app.patch("/graph/v1.0/subscriptions/{subscription_id}")
+async def graph_renew_subscription(subscription_id: str, request: Request):
+    await _delay("graph")
+    if subscription_id not in subscriptions:
+        return JSONResponse({"error": {"code": "ResourceNotFound", "message": "Not found"}}, status_code=404)
+    subscriptions[subscription_id].update(await request.json())
+    return subscriptions[subscription_id]
+
+
+@app.delete("/graph/v1.0/subscriptions/{subscription_id}")
+async def graph_delete_subscription(subscription_id: str):
+    await _delay("graph")
+    if subscriptions.pop(subscription_id, None) is None:
+        return JSONResponse({"error": {"code": "ResourceNotFound", "message": "Not found"}}, status_code=404)
+    return Response(status_code=204)
+
+
+# DigitalOcean
+
+@app.get("/do/v2/droplets")
+async def do_droplets():
+    await _delay("digitalocean")
+    return {"droplets": [
+        {
+            "id": 100000 + i,
+            "name": f"droplet-{i}",
+            "vcpus": 1 + i % 4,
+            "memory": 1024 * (1 + i % 4),
+            "status": "active" if i % 10 else "off",
+            "size": {"slug": f"s-{1 + i % 4}vcpu-{1 + i % 4}gb", "price_monthly": 6.0 * (1 + i % 4)},
+            "region": {"slug": ["nyc1", "sfo3", "ams3", "fra1"][i % 4]},
+        }
+        for i in range(config.droplets)
+    ]}
+
+
+# GoDaddy
+
+@app.get("/godaddy/v1/domains")
+async def godaddy_domains():
+    await _delay("godaddy")
+    return [{"domain": f"site{i}.com", "domainId": 500000 + i, "status": "ACTIVE"} for i in range(config.godaddy_domains)]
+
+
+@app.get("/godaddy/v1/domains/{domain}")
+async def godaddy_domain(domain: str):
+    await _delay("godaddy")
+    index = int(re.sub(r"\D", "", domain) or 0)
+    expires = EPOCH + timedelta(days=15 * index)
+    return {"domain": domain, "domainId": 500000 + index, "status": "ACTIVE", "expires": expires.isoformat()}
+
+
+@app.get("/godaddy/v1/certificates")
+async def godaddy_certificates():
+    await _delay("godaddy")
+    return [
+        {
+            "certificateId": f"cert-{i}",
+            "commonName": f"site{i}.com",
+            "type": "DV_SSL",
+            "status": "ISSUED",
+            "validEnd": (EPOCH + timedelta(days=20 * i)).isoformat(),
+        }
+        for i in range(config.certificates)
+    ]
+
+
+# AWS EC2 (query protocol)
+
+@app.post("/aws/")
+async def aws_ec2(request: Request):
+    await _delay("aws")
+    form = await request.form()
+    if form.get("Action") != "DescribeInstances":
+        return PlainTextResponse("<Response><Errors><Error><Code>InvalidAction</Code></Error></Errors></Response>", status_code=400)
+
+    # The signing region is the only hint of which region the client asked for
+    match = re.search(r"Credential=[^/]+/\d+/([^/]+)/ec2/", request.headers.get("authorization", ""))
+    region = match.group(1) if match else "us-east-1"
+
+    region_index = AWS_REGIONS.index(region) if region in AWS_REGIONS else 0
+    items = []
+    for i in range(region_index, config.instances, len(AWS_REGIONS)):
+        items.append(
+            "<item><instanceId>i-{id:017x}</instanceId><instanceType>{type}</instanceType>"
+            "<instanceState><code>16</code><name>{state}</name></instanceState>"
+            "<platformDetails>{platform}</platformDetails>"
+            "<tagSet><item><key>Name</key><value>instance-{i}</value></item></tagSet></item>".format(
+                id=i, i=i,
+                type=AWS_INSTANCE_TYPES[i % len(AWS_INSTANCE_TYPES)],
+                state="running" if i % 8 else "stopped",
+                platform="Windows" if i % 6 == 0 else "Linux/UNIX"
+            )
+        )
+
+    xml = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<DescribeInstancesResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/">'
+        f"<requestId>{uuid.uuid4()}</requestId><reservationSet>"
+        f"<item><reservationId>r-{region_index:08x}</reservationId><instancesSet>{''.join(items)}</instancesSet></item>"
+        "</reservationSet></DescribeInstancesResponse>"
+    )
+    return Response(xml, media_type="text/xml")
+
+
+# Anthropic
+
+@app.post("/anthropic/v1/messages")
+async def anthropic_messages(request: Request):
+    await _delay("anthropic", config.llm_latency_ms)
+    body = await request.json()
+    prompt = json.dumps(body.get("messages", []))
+    emails = re.findall(r"[\w\.-]+@[\w\.-]+", prompt)[:20]
+    text = "\n".join(f"- Disable {email}: no recent sign-in activity" for email in emails) or "No cleanup needed."
+    return {
+        "id": f"msg_{uuid.uuid4().hex}",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get("model"),
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": len(prompt) // 4, "output_tokens": len(text) // 4},
+    }
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run JARVIS stub upstreams")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    for name, value in asdict(StubConfig()).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+
+    for name in asdict(config):
+        setattr(config, name, getattr(args, name))
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
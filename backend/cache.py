@@ -1,30 +1,40 @@
 """Simple in-memory cache with TTL support"""
 from datetime import datetime, timedelta
 from typing import Any, Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from metrics import registry, span
 
 @dataclass
 class CacheEntry:
     data: Any
     expires_at: datetime
+    # Derived forms of data (e.g. encoded/compressed payloads), dropped with the entry
+    variants: dict = field(default_factory=dict)
 
 class Cache:
     def __init__(self, default_ttl_seconds: int = 3600):  # 1 hour default
         self.store: dict[str, CacheEntry] = {}
         self.default_ttl = default_ttl_seconds
+        self.hits: dict[str, int] = {}
+        self.misses: dict[str, int] = {}
 
     def get(self, key: str) -> Optional[Any]:
         """Get cached value if it exists and hasn't expired"""
-        if key not in self.store:
-            return None
+        with span("cache.get"):
+            namespace = key.split(":", 1)[0]
+            if key not in self.store:
+                self.misses[namespace] = self.misses.get(namespace, 0) + 1
+                return None
 
-        entry = self.store[key]
-        if datetime.now() >= entry.expires_at:
-            # Expired - remove it
-            del self.store[key]
-            return None
+            entry = self.store[key]
+            if datetime.now() >= entry.expires_at:
+                # Expired - remove it
+                del self.store[key]
+                self.misses[namespace] = self.misses.get(namespace, 0) + 1
+                return None
 
-        return entry.data
+            self.hits[namespace] = self.hits.get(namespace, 0) + 1
+            return entry.data
 
     def set(self, key: str, value: Any, ttl_seconds: Optional[int] = None) -> None:
         """Set a cached value with optional custom TTL"""
@@ -32,6 +42,30 @@ class Cache:
         expires_at = datetime.now() + timedelta(seconds=ttl)
         self.store[key] = CacheEntry(data=value, expires_at=expires_at)
 
+    def contains(self, key: str) -> bool:
+        """Whether a live entry exists, without counting a hit or miss"""
+        entry = self.store.get(key)
+        return entry is not None and datetime.now() < entry.expires_at
+
+    def get_variant(self, key: str, variant: str) -> Optional[Any]:
+        """Get a derived form of a live cache entry"""
+        entry = self.store.get(key)
+        if entry is None or datetime.now() >= entry.expires_at:
+            return None
+        return entry.variants.get(variant)
+
+    def set_variant(self, key: str, variant: str, value: Any) -> None:
+        """Attach a derived form to a live cache entry; no-op if it's gone"""
+        entry = self.store.get(key)
+        if entry is not None:
+            entry.variants[variant] = value
+
+    def clear_variants(self, key: str) -> None:
+        """Drop derived forms of an entry after its data was updated in place"""
+        entry = self.store.get(key)
+        if entry is not None:
+            entry.variants.clear()
+
     def invalidate(self, key: str) -> None:
         """Remove a specific cache entry"""
         if key in self.store:
@@ -48,8 +82,22 @@ class Cache:
         return {
             "total_entries": len(self.store),
             "valid_entries": valid_entries,
-            "expired_entries": len(self.store) - valid_entries
+            "expired_entries": len(self.store) - valid_entries,
+            "hits": sum(self.hits.values()),
+            "misses": sum(self.misses.values())
         }
 
 # Global cache instance
 cache = Cache(default_ttl_seconds=3600)  # 1 hour cache by default
+
+
+@registry.collector
+def _cache_metrics():
+    return [
+        ("jarvis_cache_hits_total", "counter", "Cache hits by key namespace",
+         [({"namespace": namespace}, count) for namespace, count in cache.hits.items()]),
+        ("jarvis_cache_misses_total", "counter", "Cache misses by key namespace",
+         [({"namespace": namespace}, count) for namespace, count in cache.misses.items()]),
+        ("jarvis_cache_entries", "gauge", "Entries currently held in the cache",
+         [({}, len(cache.store))]),
+    ]
@@ -7,21 +7,93 @@ class Settings(BaseSettings):
     microsoft_tenant_id: str = ""
     microsoft_client_id: str = ""
     microsoft_client_secret: str = ""
+    graph_api_base: str = "https://graph.microsoft.com/v1.0"
+    graph_max_connections: int = 20  # Connection pool size per tenant
+    # Additional tenants as a JSON list of {"id", "name", "tenant_id", "client_id", "client_secret"}
+    microsoft_tenants: str = ""
+    tenant_fetch_concurrency: int = 8  # Tenants fetched at once by cross-tenant views
+    # Last sign-ins: "select" (signInActivity, needs AuditLog.Read.All and Entra ID P1),
+    # "report" (Microsoft 365 activity report, needs Reports.Read.All), "none", or "auto"
+    graph_sign_in_source: str = "auto"
 
     # DigitalOcean
     do_token: str = ""
+    do_api_base: str = "https://api.digitalocean.com/v2"
 
     # AWS
     aws_access_key_id: str = ""
     aws_secret_access_key: str = ""
     aws_region: str = "us-east-1"
+    aws_endpoint_url: str = ""  # Override for EC2-compatible endpoints
+    ec2_prices_file: str = ""  # CSV of instance_type,region,os,hourly_usd replacing the bundled price list
 
     # GoDaddy
     godaddy_api_key: str = ""
     godaddy_api_secret: str = ""
+    godaddy_api_base: str = "https://api.godaddy.com/v1"
 
     # Claude API (for AI recommendations)
     anthropic_api_key: str = ""
+    anthropic_base_url: str = ""  # Override for Anthropic-compatible endpoints
+    ai_inactive_days: int = 90  # Sign-in age that marks a user inactive
+    ai_chunk_size: int = 250  # Candidates per Claude call
+    ai_max_concurrency: int = 4  # Concurrent Claude calls per analysis
+    ai_cache_ttl_seconds: int = 86400  # Lifetime of cached AI results
+
+    # Graph change notifications (disabled unless a public webhook URL is set)
+    graph_notification_url: str = ""  # e.g. https://jarvis.example.com/api/webhooks/graph
+    graph_client_state: str = ""  # Shared secret echoed back in every notification
+    graph_subscription_minutes: int = 4200  # Requested subscription lifetime
+    graph_subscription_renew_minutes: int = 60  # Renew this long before expiry
+
+    # Upstream scheduling
+    upstream_budgets: str = "microsoft=16,digitalocean=4,aws=4,godaddy=4,anthropic=4"  # Concurrent calls per upstream
+    scheduler_interactive_reserve_percent: int = 25  # Share of each budget background work can't use
+    scheduler_queue_size: int = 200  # Waiting calls per upstream and priority before shedding
+    scheduler_background_max_wait: float = 30.0  # Seconds a background call may queue before it is shed
+
+    # Licensing
+    license_prices: str = ""  # JSON object of SKU id or part number -> monthly price, overriding list prices
+    license_sku_ttl_seconds: int = 3600  # Lifetime of cached /subscribedSkus per tenant
+    license_sku_retry_seconds: int = 300  # Wait before asking again after /subscribedSkus failed
+
+    # Admission control for expensive endpoints
+    admission_enabled: bool = True
+    admission_limits: str = "analyze=1,ask=4,refresh=1,users=2,tenant_users=1,servers=1"  # Concurrent requests per rule
+    admission_queue_size: int = 8  # Requests waiting per rule before 503s
+    admission_max_wait: float = 15.0  # Seconds a request may wait for admission before a 503
+    admission_client_rate_per_minute: float = 20.0  # Expensive requests each client may start per rule
+    admission_client_burst: int = 5
+    admission_client_header: str = ""  # e.g. X-Forwarded-For behind a proxy; default is the peer address
+
+    # Expiry alerts for domains and certificates
+    expiry_alert_days: str = "30,14,7,1,0"  # Days before expiry at which to alert; 0 alerts on expiry
+    expiry_check_interval_seconds: int = 3600  # Longest the evaluator sleeps between checks
+    expiry_alert_webhook_url: str = ""  # Optional URL alerts are POSTed to as JSON
+
+    # Inventory history
+    history_enabled: bool = True  # Record a snapshot on every user and server refresh
+    history_raw_days: int = 7  # Every sample and snapshot is kept this long
+    history_hourly_days: int = 90  # Hourly rollups kept this long
+    history_daily_days: int = 730  # Daily rollups kept this long
+    history_snapshot_days: int = 90  # One snapshot per day kept this long
+    history_max_deltas: int = 48  # Delta snapshots before a new keyframe
+
+    # Background jobs
+    job_workers: int = 2  # Jobs running concurrently
+    job_queue_size: int = 100  # Queued jobs before submissions are rejected
+
+    # Bulk onboarding
+    bulk_create_concurrency: int = 4  # Concurrent Graph user creations per upload
+    bulk_max_rows: int = 5000  # Rows accepted per CSV upload
+
+    # Responses
+    compression_min_bytes: int = 1024  # Smaller payloads are sent uncompressed
+    payload_cache_max_bytes: int = 64 * 1024 * 1024  # Encoded response bytes kept per cached snapshot
+    export_row_group_rows: int = 10000  # Rows per Parquet row group in exports
+
+    # Startup
+    prewarm_providers: bool = True  # Import provider SDKs in the background after startup
 
     # Database
     database_url: str = "sqlite:///./jarvis.db"
@@ -1,8 +1,10 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, String, DateTime, Float, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 from config import get_settings
+from metrics import record_span
+import time
 
 settings = get_settings()
 
@@ -13,6 +15,18 @@ engine = create_engine(
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+@event.listens_for(SessionLocal, "before_commit")
+def _start_commit_timer(session):
+    session.info["commit_started"] = time.perf_counter()
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _record_commit(session):
+    started = session.info.pop("commit_started", None)
+    if started is not None:
+        record_span("db.commit", time.perf_counter() - started)
+
 Base = declarative_base()
 
 
@@ -41,8 +55,101 @@ class UserCache(Base):
     cached_at = Column(DateTime, default=datetime.utcnow)
 
 
+class AIResultCache(Base):
+    __tablename__ = "ai_result_cache"
+
+    key = Column(String, primary_key=True)  # Hash of the normalized input
+    kind = Column(String, index=True)
+    snapshot = Column(String, index=True, nullable=True)  # User snapshot fingerprint
+    payload = Column(String)  # JSON-encoded result
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(String, primary_key=True)
+    kind = Column(String, index=True)
+    status = Column(String, index=True)  # queued, running, succeeded, failed
+    progress = Column(Float, default=0.0)  # 0.0 - 1.0
+    message = Column(String, nullable=True)
+    params = Column(String)  # JSON-encoded handler arguments
+    result = Column(String, nullable=True)  # JSON-encoded handler result
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class GraphSubscription(Base):
+    __tablename__ = "graph_subscriptions"
+
+    id = Column(String, primary_key=True)  # Graph subscription id
+    tenant = Column(String, index=True, server_default="default")  # Tenant registry id
+    resource = Column(String, index=True)
+    change_type = Column(String, nullable=True)  # e.g. "created,updated,deleted"
+    client_state = Column(String)
+    expires_at = Column(DateTime)  # UTC
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class InventoryExpiry(Base):
+    __tablename__ = "inventory_expiry"
+
+    key = Column(String, primary_key=True)  # "<provider>:<type>:<id>"
+    name = Column(String)
+    provider = Column(String, index=True)
+    type = Column(String)
+    expires_at = Column(DateTime, index=True)  # UTC
+    alerted_days = Column(Integer, nullable=True)  # Tightest alert threshold already sent
+    next_alert_at = Column(DateTime, index=True, nullable=True)  # UTC; None once every threshold fired
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class InventorySnapshot(Base):
+    __tablename__ = "inventory_snapshots"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, index=True)  # Cache key of the snapshot, e.g. "users:default" or "servers"
+    taken_at = Column(DateTime, index=True)  # UTC
+    base_id = Column(Integer, nullable=True)  # Snapshot this one is a delta against; None for keyframes
+    record_count = Column(Integer)
+    payload = Column(LargeBinary)  # zlib-compressed columnar JSON
+
+
+class MetricRollup(Base):
+    __tablename__ = "metric_rollups"
+
+    series = Column(String, primary_key=True)  # e.g. "users:default.monthly_cost"
+    resolution = Column(Integer, primary_key=True)  # Bucket width in seconds; 0 keeps every sample
+    bucket_start = Column(DateTime, primary_key=True)  # UTC
+    count = Column(Integer)
+    sum = Column(Float)
+    min = Column(Float)
+    max = Column(Float)
+    last = Column(Float)
+
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+
+
+def _add_missing_columns() -> None:
+    """Add columns introduced since a table was created; create_all only creates missing tables"""
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT '{column.server_default.arg}'"
+                connection.execute(text(ddl))
 
 
 def get_db():
@@ -0,0 +1,255 @@
+"""Expiry tracking and alerts for domains, certificates and other inventory
+
+Every inventory item with an `expires_at` is mirrored into SQLite with its
+expiry in an indexed column, so "what expires in the next N days" is an
+index range scan rather than a refetch of every provider. Each row also
+records when its next alert threshold is crossed; the evaluator sleeps until
+the earliest of those and only reads rows that are due.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import func
+from config import get_settings
+from database import SessionLocal, AuditLog, InventoryExpiry
+from metrics import registry, span
+import asyncio
+import httpx
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+expiry_alerts = registry.counter(
+    "jarvis_expiry_alerts_total", "Expiry alerts emitted by threshold"
+)
+
+
+def parse_thresholds(spec: str) -> Tuple[int, ...]:
+    """Parse "30,14,7" into (30, 14, 7), largest first"""
+    return tuple(sorted({max(int(part), 0) for part in spec.split(",") if part.strip()}, reverse=True))
+
+
+def parse_expiry(value: Any) -> Optional[datetime]:
+    """Naive UTC datetime from a provider's expiry value, or None if it has none"""
+    if not value:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            logger.warning(f"Unparseable expiry: {value}")
+            return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _isoformat(value: datetime) -> str:
+    return value.isoformat() + "Z"
+
+
+class ExpiryTracker:
+    def __init__(self):
+        self.settings = get_settings()
+        self.thresholds = parse_thresholds(self.settings.expiry_alert_days)
+        self.task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+
+    def _next_alert_at(self, expires_at: datetime, alerted_days: Optional[int]) -> Optional[datetime]:
+        """When the next threshold tighter than `alerted_days` is crossed"""
+        for days in self.thresholds:
+            if alerted_days is None or days < alerted_days:
+                return expires_at - timedelta(days=days)
+        return None
+
+    async def start(self) -> None:
+        self._wake = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def wake(self) -> None:
+        """Re-evaluate now, e.g. after new items were synced"""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _run(self) -> None:
+        while True:
+            self._wake.clear()
+            try:
+                await self.evaluate()
+                delay = self._seconds_until_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Expiry evaluation failed: {str(e)}", exc_info=True)
+                delay = 60
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _seconds_until_due(self) -> float:
+        db = SessionLocal()
+        try:
+            # MIN over an indexed column: a single index probe
+            due = db.query(func.min(InventoryExpiry.next_alert_at)).scalar()
+        finally:
+            db.close()
+        delay = float(self.settings.expiry_check_interval_seconds)
+        if due is not None:
+            delay = min(delay, (due - _utcnow()).total_seconds())
+        return max(delay, 1.0)
+
+    def sync(self, items: Iterable[Dict[str, Any]]) -> int:
+        """Mirror freshly fetched inventory, returning how many rows changed
+
+        Rows of a provider that returned expiring items but no longer lists
+        one are dropped. A provider that returned none keeps its rows, since
+        providers report fetch errors as an empty list.
+        """
+        fetched: Dict[str, Tuple[Dict[str, Any], datetime]] = {}
+        for item in items:
+            expires_at = parse_expiry(item.get("expires_at"))
+            if expires_at is not None:
+                fetched[f"{item.get('provider')}:{item.get('type')}:{item.get('id')}"] = (item, expires_at)
+        providers = {item.get("provider") for item, _ in fetched.values()}
+
+        changed = 0
+        db = SessionLocal()
+        try:
+            existing = {row.key: row for row in db.query(InventoryExpiry)}
+            for key, (item, expires_at) in fetched.items():
+                row = existing.pop(key, None)
+                if row is None:
+                    db.add(InventoryExpiry(
+                        key=key,
+                        name=item.get("name"),
+                        provider=item.get("provider"),
+                        type=item.get("type"),
+                        expires_at=expires_at,
+                        next_alert_at=self._next_alert_at(expires_at, None)
+                    ))
+                    changed += 1
+                elif row.expires_at != expires_at or row.name != item.get("name"):
+                    if row.expires_at != expires_at:
+                        # Renewed (or moved): alerting starts over
+                        row.expires_at = expires_at
+                        row.alerted_days = None
+                        row.next_alert_at = self._next_alert_at(expires_at, None)
+                    row.name = item.get("name")
+                    changed += 1
+
+            for row in existing.values():
+                if row.provider in providers:
+                    db.delete(row)
+                    changed += 1
+            if changed:
+                db.commit()
+        finally:
+            db.close()
+
+        if changed:
+            logger.info(f"Synced expiry index: {changed} change(s)")
+            self.wake()
+        return changed
+
+    def populated(self) -> bool:
+        db = SessionLocal()
+        try:
+            return db.query(InventoryExpiry.key).first() is not None
+        finally:
+            db.close()
+
+    def expiring(self, within_days: float, include_expired: bool = False) -> List[Dict[str, Any]]:
+        """Items expiring within `within_days`, soonest first"""
+        now = _utcnow()
+        db = SessionLocal()
+        try:
+            query = db.query(InventoryExpiry).filter(
+                InventoryExpiry.expires_at <= now + timedelta(days=within_days)
+            )
+            if not include_expired:
+                query = query.filter(InventoryExpiry.expires_at > now)
+            rows = query.order_by(InventoryExpiry.expires_at).all()
+        finally:
+            db.close()
+        return [self._item(row, now) for row in rows]
+
+    def _item(self, row: InventoryExpiry, now: datetime) -> Dict[str, Any]:
+        return {
+            "key": row.key,
+            "name": row.name,
+            "provider": row.provider,
+            "type": row.type,
+            "expires_at": _isoformat(row.expires_at),
+            "days_left": round((row.expires_at - now).total_seconds() / 86400, 2),
+        }
+
+    async def evaluate(self) -> List[Dict[str, Any]]:
+        """Emit an alert for every item that crossed a threshold since it was last checked"""
+        now = _utcnow()
+        alerts = []
+        db = SessionLocal()
+        try:
+            due = db.query(InventoryExpiry).filter(InventoryExpiry.next_alert_at <= now).all()
+            for row in due:
+                days_left = (row.expires_at - now).total_seconds() / 86400
+                # Only the tightest threshold crossed is reported, so an item first
+                # seen three days out alerts once for 7 days, not for 30, 14 and 7
+                crossed = min(days for days in self.thresholds if days_left <= days)
+                row.alerted_days = crossed
+                row.next_alert_at = self._next_alert_at(row.expires_at, crossed)
+                alerts.append({**self._item(row, now), "threshold_days": crossed})
+
+            if alerts:
+                db.add_all([
+                    AuditLog(
+                        action="expiry_alert",
+                        resource_type=alert["type"],
+                        resource_id=alert["key"],
+                        user="system",
+                        details=(
+                            f"{alert['name']} expired" if alert["days_left"] <= 0
+                            else f"{alert['name']} expires within {alert['threshold_days']} day(s)"
+                        )
+                    )
+                    for alert in alerts
+                ])
+                db.commit()
+        finally:
+            db.close()
+
+        for alert in alerts:
+            expiry_alerts.inc(threshold_days=alert["threshold_days"], type=alert["type"] or "unknown")
+            logger.warning(f"Expiry alert: {alert['name']} ({alert['type']}) expires {alert['expires_at']}")
+        if alerts and self.settings.expiry_alert_webhook_url:
+            await self._notify(alerts)
+        return alerts
+
+    async def _notify(self, alerts: List[Dict[str, Any]]) -> None:
+        try:
+            with span("expiry.webhook"):
+                async with httpx.AsyncClient() as client:
+                    response = await client.post(
+                        self.settings.expiry_alert_webhook_url,
+                        content=json.dumps({"alerts": alerts}),
+                        headers={"Content-Type": "application/json"},
+                        timeout=10.0
+                    )
+                    response.raise_for_status()
+        except Exception as e:
+            # Alerts are already in the audit log; a failed delivery isn't retried
+            logger.error(f"Could not deliver {len(alerts)} expiry alert(s): {str(e)}")
+
+
+# Global expiry tracker instance
+expiry_tracker = ExpiryTracker()
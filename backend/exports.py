@@ -0,0 +1,231 @@
+"""Streaming CSV and Parquet exports
+
+Rows are encoded as they are read, from the cached snapshots or from the
+audit table in keyset-paginated batches, so an export holds one buffer of
+output (CSV) or one row group (Parquet) at a time however large it is.
+Generators are synchronous; StreamingResponse runs them in the threadpool,
+which keeps encoding and SQLite reads off the event loop.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from database import SessionLocal, AuditLog
+from config import get_settings
+import csv
+import io
+import logging
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "parquet")
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "parquet": "application/vnd.apache.parquet"}
+
+# CSV bytes buffered before a chunk is sent
+CSV_CHUNK_BYTES = 64 * 1024
+
+# Audit rows read per query
+AUDIT_BATCH_ROWS = 1000
+
+# (field, type) with type one of "string", "bool", "int", "float", "timestamp", "list" (of strings)
+Columns = Sequence[Tuple[str, str]]
+
+USER_EXPORT_COLUMNS: Columns = (
+    ("id", "string"), ("email", "string"), ("display_name", "string"), ("domain", "string"),
+    ("last_sign_in", "timestamp"), ("account_enabled", "bool"), ("licenses", "list"),
+    ("license_type", "string"), ("monthly_cost", "float"), ("department", "string"), ("manager", "string"),
+)
+SERVER_EXPORT_COLUMNS: Columns = (
+    ("id", "string"), ("name", "string"), ("provider", "string"), ("type", "string"),
+    ("size", "string"), ("cost_monthly", "float"), ("status", "string"), ("region", "string"),
+    ("expires_at", "string"),
+)
+AUDIT_EXPORT_COLUMNS: Columns = (
+    ("id", "int"), ("timestamp", "timestamp"), ("action", "string"), ("resource_type", "string"),
+    ("resource_id", "string"), ("user", "string"), ("details", "string"),
+)
+
+
+class ExportFormatError(ValueError):
+    """The requested export format is unknown or unavailable"""
+
+
+def load_pyarrow():
+    """Import pyarrow on first Parquet export (deferred to keep app startup fast); None if not installed"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def check_format(format: str) -> str:
+    if format not in FORMATS:
+        raise ExportFormatError(f"Unknown export format: {format} (expected one of {', '.join(FORMATS)})")
+    if format == "parquet" and load_pyarrow() is None:
+        raise ExportFormatError("Parquet export requires the pyarrow package")
+    return format
+
+
+def select_columns(columns: Columns, fields: Optional[Sequence[str]]) -> Columns:
+    """Columns restricted to `fields`, keeping the export's column order"""
+    if not fields:
+        return columns
+    return tuple(column for column in columns if column[0] in fields)
+
+
+def naive_utc(value: datetime) -> datetime:
+    """UTC without tzinfo, as timestamps are stored in SQLite"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return naive_utc(value).isoformat() + "Z"
+    if isinstance(value, (list, tuple)):
+        return ";".join(value)
+    return "" if value is None else value
+
+
+def stream_csv(rows: Iterable[Any], columns: Columns) -> Iterator[bytes]:
+    """Encode rows (anything with .get()) as CSV, a buffer at a time"""
+    names = [name for name, _ in columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for row in rows:
+        writer.writerow([_csv_value(row.get(name)) for name in names])
+        if buffer.tell() >= CSV_CHUNK_BYTES:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file the Parquet writer fills and the stream drains"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def _arrow_type(pyarrow, kind: str):
+    return {
+        "string": pyarrow.string(),
+        "bool": pyarrow.bool_(),
+        "int": pyarrow.int64(),
+        "float": pyarrow.float64(),
+        "timestamp": pyarrow.timestamp("us", tz="UTC"),
+        "list": pyarrow.list_(pyarrow.string()),
+    }[kind]
+
+
+def _arrow_value(value: Any, kind: str) -> Any:
+    if value is None:
+        return None
+    if kind == "string":
+        return str(value)
+    if kind == "float":
+        return float(value)
+    if kind == "list":
+        return list(value)
+    if kind == "timestamp" and value.tzinfo is None:
+        # Naive datetimes in this codebase are UTC
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def stream_parquet(rows: Iterable[Any], columns: Columns, row_group_rows: Optional[int] = None) -> Iterator[bytes]:
+    """Encode rows as Parquet, flushing one row group at a time"""
+    pyarrow = load_pyarrow()
+    row_group_rows = row_group_rows or get_settings().export_row_group_rows
+    schema = pyarrow.schema([(name, _arrow_type(pyarrow, kind)) for name, kind in columns])
+    sink = _Sink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema, compression="zstd")
+    values: List[List[Any]] = [[] for _ in columns]
+
+    def flush() -> bytes:
+        arrays = [pyarrow.array(column, type=field.type) for column, field in zip(values, schema)]
+        writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema), row_group_size=row_group_rows)
+        for column in values:
+            column.clear()
+        return sink.drain()
+
+    try:
+        count = 0
+        for row in rows:
+            for column, (name, kind) in zip(values, columns):
+                column.append(_arrow_value(row.get(name), kind))
+            count += 1
+            if count % row_group_rows == 0:
+                yield flush()
+        if count % row_group_rows:
+            yield flush()
+    finally:
+        writer.close()
+    # The footer
+    yield sink.drain()
+
+
+def stream_rows(rows: Iterable[Any], columns: Columns, format: str) -> Iterator[bytes]:
+    if format == "parquet":
+        return stream_parquet(rows, columns)
+    return stream_csv(rows, columns)
+
+
+def audit_rows(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    action: Optional[str] = None,
+    batch_rows: int = AUDIT_BATCH_ROWS
+) -> Iterator[Dict[str, Any]]:
+    """Audit log rows in id order, read in keyset-paginated batches
+
+    Each batch uses its own short session, so a slow download never holds a
+    read transaction that would block writers.
+    """
+    last_id = 0
+    names = [name for name, _ in AUDIT_EXPORT_COLUMNS]
+    columns = [getattr(AuditLog, name) for name in names]
+    while True:
+        db = SessionLocal()
+        try:
+            query = db.query(*columns).filter(AuditLog.id > last_id)
+            if since is not None:
+                query = query.filter(AuditLog.timestamp >= naive_utc(since))
+            if until is not None:
+                query = query.filter(AuditLog.timestamp < naive_utc(until))
+            if action:
+                query = query.filter(AuditLog.action == action)
+            batch = query.order_by(AuditLog.id).limit(batch_rows).all()
+        finally:
+            db.close()
+
+        for values in batch:
+            yield dict(zip(names, values))
+        if len(batch) < batch_rows:
+            return
+        last_id = batch[-1][0]
+
+
+def export_filename(kind: str, format: str) -> str:
+    return f"jarvis-{kind}-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.{format}"
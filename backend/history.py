@@ -0,0 +1,405 @@
+"""Inventory and cost history
+
+Every user and server refresh records two things:
+
+- a snapshot of the records, stored columnar and zlib-compressed, either as
+  a keyframe or as a delta (changed rows plus removed keys) against the
+  previous snapshot. The first snapshot of each UTC day is a keyframe, so a
+  day's deltas can be dropped without breaking any chain.
+- aggregate metrics (seat counts, license spend, cloud cost), folded into
+  rollups at raw, hourly and daily resolution as they arrive.
+
+Time-series queries read only rollups, never snapshots. Retention drops raw
+rows, then hourly rows, then old days' deltas and keyframes, so storage
+stays bounded however long JARVIS runs.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from config import get_settings
+from database import SessionLocal, InventorySnapshot, MetricRollup
+from metrics import span
+import asyncio
+import json
+import logging
+import threading
+import zlib
+
+logger = logging.getLogger(__name__)
+
+RAW = 0
+HOUR = 3600
+DAY = 86400
+RESOLUTIONS = (RAW, HOUR, DAY)
+
+BUCKETS = {"raw": RAW, "hour": HOUR, "day": DAY, "week": 7 * DAY, "month": 31 * DAY}
+AGGREGATES = ("avg", "min", "max", "last", "sum")
+
+# Pruning runs at most this often
+PRUNE_INTERVAL = timedelta(hours=1)
+
+
+class HistoryQueryError(ValueError):
+    """A time-series query asked for an unknown bucket or aggregate"""
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _day_start(value: datetime) -> datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _bucket_start(value: datetime, bucket: str) -> datetime:
+    """Start of the calendar bucket containing `value`"""
+    if bucket == "raw":
+        return value
+    if bucket == "hour":
+        return value.replace(minute=0, second=0, microsecond=0)
+    day = _day_start(value)
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _resolution_start(value: datetime, resolution: int) -> datetime:
+    if resolution == RAW:
+        return value
+    return _bucket_start(value, "hour" if resolution == HOUR else "day")
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat().replace("+00:00", "Z")
+    if isinstance(value, tuple):
+        # As it comes back from JSON, so replayed rows compare equal
+        return list(value)
+    return value
+
+
+def flatten_metrics(prefix: str, stats: Dict[str, Any]) -> Dict[str, float]:
+    """{"by_license": {"Basic": {"users": 3}}} -> {"<prefix>.by_license.Basic.users": 3.0}"""
+    flat = {}
+    for name, value in stats.items():
+        key = f"{prefix}.{name}"
+        if isinstance(value, dict):
+            flat.update(flatten_metrics(key, value))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[key] = float(value)
+    return flat
+
+
+class InventoryHistory:
+    def __init__(self):
+        self.settings = get_settings()
+        # Snapshots of one kind must be written in order to chain deltas correctly
+        self._lock = threading.Lock()
+        self._tasks: Set[asyncio.Future] = set()
+        self._last_prune: Optional[datetime] = None
+
+    def _retention(self, resolution: int) -> timedelta:
+        days = {
+            RAW: self.settings.history_raw_days,
+            HOUR: self.settings.history_hourly_days,
+            DAY: self.settings.history_daily_days,
+        }[resolution]
+        return timedelta(days=days)
+
+    def record(
+        self,
+        kind: str,
+        records: Sequence[Any],
+        fields: Sequence[str],
+        key: Callable[[Any], str],
+        metrics: Dict[str, float]
+    ) -> None:
+        """Record a snapshot and its metrics in the background
+
+        `records` must not change afterwards; pass a copy of a live snapshot.
+        """
+        if not self.settings.history_enabled:
+            return
+        task = asyncio.ensure_future(
+            asyncio.to_thread(self._record, kind, records, tuple(fields), key, metrics, _utcnow())
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._finished)
+
+    def _finished(self, task: asyncio.Future) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Could not record history: {str(task.exception())}", exc_info=task.exception())
+
+    async def drain(self) -> None:
+        """Wait for snapshots still being written"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _record(
+        self,
+        kind: str,
+        records: Sequence[Any],
+        fields: Tuple[str, ...],
+        key: Callable[[Any], str],
+        metrics: Dict[str, float],
+        taken_at: datetime
+    ) -> None:
+        with self._lock, span("history.record"):
+            db = SessionLocal()
+            try:
+                self._add_snapshot(db, kind, records, fields, key, taken_at)
+                self._add_samples(db, metrics, taken_at)
+                db.commit()
+                if self._last_prune is None or taken_at - self._last_prune >= PRUNE_INTERVAL:
+                    self._prune(db, taken_at)
+                    db.commit()
+                    self._last_prune = taken_at
+            finally:
+                db.close()
+
+    # Snapshots
+
+    def _add_snapshot(
+        self,
+        db,
+        kind: str,
+        records: Sequence[Any],
+        fields: Tuple[str, ...],
+        key: Callable[[Any], str],
+        taken_at: datetime
+    ) -> None:
+        rows = {key(record): tuple(_plain(record.get(name)) for name in fields) for record in records}
+        previous = (
+            db.query(InventorySnapshot)
+            .filter(InventorySnapshot.kind == kind)
+            .order_by(InventorySnapshot.taken_at.desc())
+            .first()
+        )
+
+        base = None
+        if previous is not None and _day_start(previous.taken_at) == _day_start(taken_at):
+            chain = self._chain(db, previous)
+            previous_fields, previous_rows = self._replay(chain)
+            if len(chain) <= self.settings.history_max_deltas and previous_fields == fields:
+                base = previous
+
+        if base is None:
+            payload = {"fields": fields, "columns": self._columns(rows.items(), len(fields))}
+        else:
+            upserted = [(record_key, row) for record_key, row in rows.items() if previous_rows.get(record_key) != row]
+            payload = {
+                "fields": fields,
+                "columns": self._columns(upserted, len(fields)),
+                "removed": [record_key for record_key in previous_rows if record_key not in rows],
+            }
+
+        db.add(InventorySnapshot(
+            kind=kind,
+            taken_at=taken_at,
+            base_id=base.id if base is not None else None,
+            record_count=len(rows),
+            payload=zlib.compress(json.dumps(payload, separators=(",", ":")).encode(), 6)
+        ))
+
+    @staticmethod
+    def _columns(rows: Iterable[Tuple[str, tuple]], width: int) -> List[list]:
+        """Column-major values, keys first: repeated values in a column compress well"""
+        columns: List[list] = [[] for _ in range(width + 1)]
+        for record_key, row in rows:
+            columns[0].append(record_key)
+            for column, value in zip(columns[1:], row):
+                column.append(value)
+        return columns
+
+    def _chain(self, db, snapshot: InventorySnapshot) -> List[InventorySnapshot]:
+        """Keyframe first, then each delta up to `snapshot`"""
+        chain = [snapshot]
+        while chain[-1].base_id is not None:
+            chain.append(db.get(InventorySnapshot, chain[-1].base_id))
+        chain.reverse()
+        return chain
+
+    @staticmethod
+    def _replay(chain: List[InventorySnapshot]) -> Tuple[Tuple[str, ...], Dict[str, tuple]]:
+        rows: Dict[str, tuple] = {}
+        fields: Tuple[str, ...] = ()
+        for snapshot in chain:
+            payload = json.loads(zlib.decompress(snapshot.payload))
+            fields = tuple(payload["fields"])
+            columns = payload["columns"]
+            for record_key in payload.get("removed", ()):
+                rows.pop(record_key, None)
+            for position, record_key in enumerate(columns[0]):
+                rows[record_key] = tuple(column[position] for column in columns[1:])
+        return fields, rows
+
+    def snapshots(self, kind: Optional[str] = None, start: Optional[datetime] = None,
+                  end: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            query = db.query(
+                InventorySnapshot.id, InventorySnapshot.kind, InventorySnapshot.taken_at,
+                InventorySnapshot.base_id, InventorySnapshot.record_count,
+                InventorySnapshot.payload
+            )
+            if kind:
+                query = query.filter(InventorySnapshot.kind == kind)
+            if start is not None:
+                query = query.filter(InventorySnapshot.taken_at >= start)
+            if end is not None:
+                query = query.filter(InventorySnapshot.taken_at < end)
+            return [
+                {
+                    "id": row.id,
+                    "kind": row.kind,
+                    "taken_at": row.taken_at.isoformat() + "Z",
+                    "delta": row.base_id is not None,
+                    "records": row.record_count,
+                    "stored_bytes": len(row.payload),
+                }
+                for row in query.order_by(InventorySnapshot.taken_at)
+            ]
+        finally:
+            db.close()
+
+    def snapshot_records(self, snapshot_id: int) -> Optional[Dict[str, Any]]:
+        """The full record set of a snapshot, rebuilt from its keyframe and deltas"""
+        db = SessionLocal()
+        try:
+            snapshot = db.get(InventorySnapshot, snapshot_id)
+            if snapshot is None:
+                return None
+            fields, rows = self._replay(self._chain(db, snapshot))
+            return {
+                "id": snapshot.id,
+                "kind": snapshot.kind,
+                "taken_at": snapshot.taken_at.isoformat() + "Z",
+                "records": [dict(zip(fields, row)) for row in rows.values()],
+            }
+        finally:
+            db.close()
+
+    # Metrics
+
+    def _add_samples(self, db, metrics: Dict[str, float], taken_at: datetime) -> None:
+        if not metrics:
+            return
+        names = list(metrics)
+        for resolution in RESOLUTIONS:
+            bucket_start = _resolution_start(taken_at, resolution)
+            existing = {
+                row.series: row
+                for row in db.query(MetricRollup).filter(
+                    MetricRollup.resolution == resolution,
+                    MetricRollup.bucket_start == bucket_start,
+                    MetricRollup.series.in_(names)
+                )
+            }
+            for name, value in metrics.items():
+                row = existing.get(name)
+                if row is None:
+                    db.add(MetricRollup(
+                        series=name, resolution=resolution, bucket_start=bucket_start,
+                        count=1, sum=value, min=value, max=value, last=value
+                    ))
+                else:
+                    row.count += 1
+                    row.sum += value
+                    row.min = min(row.min, value)
+                    row.max = max(row.max, value)
+                    row.last = value
+
+    def metric_names(self, prefix: Optional[str] = None) -> List[str]:
+        db = SessionLocal()
+        try:
+            query = db.query(MetricRollup.series).filter(MetricRollup.resolution == DAY)
+            if prefix:
+                query = query.filter(MetricRollup.series.startswith(prefix, autoescape=True))
+            return [row.series for row in query.distinct().order_by(MetricRollup.series)]
+        finally:
+            db.close()
+
+    def series(
+        self,
+        name: str,
+        start: datetime,
+        end: datetime,
+        bucket: str = "day",
+        aggregate: str = "avg"
+    ) -> List[Dict[str, Any]]:
+        """Values of one series in [start, end), one point per calendar bucket
+
+        Day, week and month buckets read daily rollups, so months of history
+        cost a few hundred rows at most.
+        """
+        if bucket not in BUCKETS:
+            raise HistoryQueryError(f"Unknown bucket: {bucket} (expected one of {', '.join(BUCKETS)})")
+        if aggregate not in AGGREGATES:
+            raise HistoryQueryError(f"Unknown aggregate: {aggregate} (expected one of {', '.join(AGGREGATES)})")
+
+        # Rollup buckets nest inside calendar buckets, so the coarsest one that
+        # fits gives exact aggregates from the fewest rows
+        resolution = max(resolution for resolution in RESOLUTIONS if resolution <= BUCKETS[bucket])
+
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(MetricRollup)
+                .filter(
+                    MetricRollup.series == name,
+                    MetricRollup.resolution == resolution,
+                    MetricRollup.bucket_start >= _resolution_start(start, resolution),
+                    MetricRollup.bucket_start < end
+                )
+                .order_by(MetricRollup.bucket_start)
+                .all()
+            )
+        finally:
+            db.close()
+
+        points: List[Dict[str, Any]] = []
+        current: Optional[Dict[str, Any]] = None
+        for row in rows:
+            bucket_start = _bucket_start(row.bucket_start, bucket)
+            if current is None or current["start"] != bucket_start:
+                current = {"start": bucket_start, "count": 0, "sum": 0.0, "min": row.min, "max": row.max}
+                points.append(current)
+            current["count"] += row.count
+            current["sum"] += row.sum
+            current["min"] = min(current["min"], row.min)
+            current["max"] = max(current["max"], row.max)
+            current["last"] = row.last
+
+        return [
+            {
+                "t": point["start"].isoformat() + "Z",
+                "value": round(point["sum"] / point["count"] if aggregate == "avg" else point[aggregate], 4),
+                "samples": point["count"],
+            }
+            for point in points
+        ]
+
+    # Retention
+
+    def _prune(self, db, now: datetime) -> None:
+        for resolution in RESOLUTIONS:
+            db.query(MetricRollup).filter(
+                MetricRollup.resolution == resolution,
+                MetricRollup.bucket_start < now - self._retention(resolution)
+            ).delete(synchronize_session=False)
+
+        # Whole days only: a day's deltas chain back to that day's keyframe
+        raw_cutoff = _day_start(now - timedelta(days=self.settings.history_raw_days))
+        db.query(InventorySnapshot).filter(
+            InventorySnapshot.base_id.isnot(None),
+            InventorySnapshot.taken_at < raw_cutoff
+        ).delete(synchronize_session=False)
+        db.query(InventorySnapshot).filter(
+            InventorySnapshot.taken_at < _day_start(now - timedelta(days=self.settings.history_snapshot_days))
+        ).delete(synchronize_session=False)
+
+
+# Global history instance
+inventory_history = InventoryHistory()
@@ -0,0 +1,217 @@
+"""In-process background job queue with state persisted in SQLite"""
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from config import get_settings
+from database import SessionLocal, Job
+from scheduler import priority, BACKGROUND
+import asyncio
+import json
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+FINISHED = (SUCCEEDED, FAILED)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class JobContext:
+    """Handle passed to job handlers for progress reporting"""
+
+    def __init__(self, manager: "JobManager", job_id: str):
+        self.manager = manager
+        self.job_id = job_id
+
+    def progress(self, fraction: float, message: Optional[str] = None) -> None:
+        """Report progress between 0.0 and 1.0"""
+        fields: Dict[str, Any] = {"progress": min(max(fraction, 0.0), 1.0)}
+        if message is not None:
+            fields["message"] = message
+        self.manager._update(self.job_id, **fields)
+
+
+Handler = Callable[..., Awaitable[Any]]
+
+
+class JobManager:
+    def __init__(self, workers: int = 2, queue_size: int = 100):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.handlers: Dict[str, Handler] = {}
+        self.queue: Optional[asyncio.Queue] = None
+        self.tasks: List[asyncio.Task] = []
+        self.changed: Dict[str, asyncio.Event] = {}
+
+    def register(self, kind: str) -> Callable[[Handler], Handler]:
+        """Decorator registering the handler for a job kind"""
+        def decorator(handler: Handler) -> Handler:
+            self.handlers[kind] = handler
+            return handler
+        return decorator
+
+    async def start(self) -> None:
+        """Start workers and recover jobs left over from a previous process"""
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+
+        db = SessionLocal()
+        try:
+            # Running jobs died with the previous process; queued ones can resume
+            db.query(Job).filter(Job.status == RUNNING).update({
+                "status": FAILED,
+                "error": "Interrupted by server restart",
+                "finished_at": datetime.utcnow()
+            })
+            db.commit()
+            pending = [job.id for job in db.query(Job).filter(Job.status == QUEUED).order_by(Job.created_at)]
+        finally:
+            db.close()
+
+        for job_id in pending:
+            try:
+                self.queue.put_nowait(job_id)
+            except asyncio.QueueFull:
+                self._update(job_id, status=FAILED, error="Job queue full on restart", finished_at=datetime.utcnow())
+
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Started {self.workers} job worker(s), {len(pending)} job(s) resumed")
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def submit(self, kind: str, **params: Any) -> str:
+        """Persist and enqueue a job, returning its id"""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if self.queue is None:
+            raise RuntimeError("Job manager is not running")
+        if self.queue.full():
+            raise QueueFullError("Job queue is full, try again later")
+
+        job_id = uuid.uuid4().hex
+        db = SessionLocal()
+        try:
+            db.add(Job(id=job_id, kind=kind, status=QUEUED, progress=0.0, params=json.dumps(params)))
+            db.commit()
+        finally:
+            db.close()
+
+        self.queue.put_nowait(job_id)
+        logger.info(f"Queued {kind} job {job_id}")
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Current state of a job"""
+        db = SessionLocal()
+        try:
+            job = db.get(Job, job_id)
+            return self._to_dict(job) if job else None
+        finally:
+            db.close()
+
+    def result(self, job_id: str) -> Any:
+        """Decoded result of a finished job"""
+        db = SessionLocal()
+        try:
+            job = db.get(Job, job_id)
+            return json.loads(job.result) if job and job.result else None
+        finally:
+            db.close()
+
+    async def events(self, job_id: str, timeout: float = 15.0) -> AsyncIterator[Dict[str, Any]]:
+        """Yield job state whenever it changes, until it finishes"""
+        last = None
+        while True:
+            event = self.changed.setdefault(job_id, asyncio.Event())
+            state = self.get(job_id)
+            if state is None or state["status"] in FINISHED:
+                self.changed.pop(job_id, None)
+                if state is not None and state != last:
+                    yield state
+                return
+            if state != last:
+                yield state
+                last = state
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            event.clear()
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self.queue.get()
+            try:
+                await self._run(job_id)
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job_id: str) -> None:
+        state = self.get(job_id)
+        if state is None or state["status"] != QUEUED:
+            return
+
+        handler = self.handlers.get(state["kind"])
+        if handler is None:
+            self._update(job_id, status=FAILED, error=f"No handler for {state['kind']}", finished_at=datetime.utcnow())
+            return
+
+        self._update(job_id, status=RUNNING, started_at=datetime.utcnow())
+        try:
+            # Jobs yield upstream quota to interactive requests
+            with priority(BACKGROUND):
+                result = await handler(JobContext(self, job_id), **state["params"])
+            self._update(
+                job_id,
+                status=SUCCEEDED,
+                progress=1.0,
+                result=json.dumps(result, default=str),
+                finished_at=datetime.utcnow()
+            )
+            logger.info(f"Job {job_id} ({state['kind']}) succeeded")
+        except Exception as e:
+            logger.error(f"Job {job_id} ({state['kind']}) failed: {str(e)}", exc_info=True)
+            self._update(job_id, status=FAILED, error=str(e), finished_at=datetime.utcnow())
+
+    def _update(self, job_id: str, **fields: Any) -> None:
+        db = SessionLocal()
+        try:
+            db.query(Job).filter(Job.id == job_id).update(fields)
+            db.commit()
+        finally:
+            db.close()
+
+        event = self.changed.get(job_id)
+        if event is not None:
+            event.set()
+        if fields.get("status") in FINISHED:
+            self.changed.pop(job_id, None)
+
+    @staticmethod
+    def _to_dict(job: Job) -> Dict[str, Any]:
+        return {
+            "id": job.id,
+            "kind": job.kind,
+            "status": job.status,
+            "progress": job.progress,
+            "message": job.message,
+            "params": json.loads(job.params) if job.params else {},
+            "error": job.error,
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+            "started_at": job.started_at.isoformat() if job.started_at else None,
+            "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        }
+
+
+# Global job manager instance
+job_manager = JobManager(workers=get_settings().job_workers, queue_size=get_settings().job_queue_size)
@@ -0,0 +1,185 @@
+"""Microsoft 365 license catalog and pricing
+
+Users carry the SKU ids Graph reports in `assignedLicenses`. A tenant's
+catalog combines its `/subscribedSkus` (names, purchased and consumed seats)
+with a table of list prices by SKU id, overridable with LICENSE_PRICES.
+
+Users share a handful of license combinations, so each combination is
+resolved to a label and a monthly cost once and the result is shared by
+every record holding it.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from config import get_settings
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Sku:
+    sku_id: str
+    part_number: str
+    name: str
+    monthly_price: float
+    # Seats from /subscribedSkus; None for SKUs the tenant hasn't subscribed to
+    purchased: Optional[int] = None
+    consumed: Optional[int] = None
+    priced: bool = True
+
+
+# List prices in USD per user per month (annual commitment)
+KNOWN_SKUS = (
+    Sku("3b555118-da6a-4418-894f-7df1e2096870", "O365_BUSINESS_ESSENTIALS", "Microsoft 365 Business Basic", 6.00),
+    Sku("f245ecc8-75af-4f8e-b61f-27d8114de5f3", "O365_BUSINESS_PREMIUM", "Microsoft 365 Business Standard", 12.50),
+    Sku("cbdc14ab-d96c-4c30-b9f4-6ada7cdc1d46", "SPB", "Microsoft 365 Business Premium", 22.00),
+    Sku("cdd28e44-67e3-425e-be4c-737fab2899d3", "O365_BUSINESS", "Microsoft 365 Apps for business", 8.25),
+    Sku("18181a46-0d4e-45cd-891e-60aabd171b4e", "STANDARDPACK", "Office 365 E1", 10.00),
+    Sku("6fd2c87f-b296-42f0-b197-1e91e994b900", "ENTERPRISEPACK", "Office 365 E3", 23.00),
+    Sku("c7df2760-2c81-4ef7-b578-5b5392b571df", "ENTERPRISEPREMIUM", "Office 365 E5", 38.00),
+    Sku("05e9a617-0261-4cee-bb44-138d3ef5d965", "SPE_E3", "Microsoft 365 E3", 36.00),
+    Sku("06ebc4ee-1bb5-47dd-8120-11324bc54e06", "SPE_E5", "Microsoft 365 E5", 57.00),
+    Sku("66b55226-6b4f-492c-910c-a3b7a3c9d993", "SPE_F1", "Microsoft 365 F3", 8.00),
+    Sku("4b9405b0-7788-4568-add1-99614e613b69", "EXCHANGESTANDARD", "Exchange Online (Plan 1)", 4.00),
+    Sku("f30db892-07e9-47e9-837c-80727f46fd3d", "FLOW_FREE", "Power Automate Free", 0.00),
+    Sku("a403ebcc-fae0-4ca2-8c8c-7a907fd6c235", "POWER_BI_STANDARD", "Power BI (free)", 0.00),
+)
+
+# Short names accepted where a license is named rather than assigned (CreateUserRequest.license_type)
+ALIASES = {
+    "Business Basic": "3b555118-da6a-4418-894f-7df1e2096870",
+    "Business Standard": "f245ecc8-75af-4f8e-b61f-27d8114de5f3",
+    "Business Premium": "cbdc14ab-d96c-4c30-b9f4-6ada7cdc1d46",
+}
+
+
+def _price_overrides() -> Dict[str, float]:
+    """LICENSE_PRICES: JSON object of SKU id or part number -> monthly price"""
+    spec = get_settings().license_prices
+    if not spec:
+        return {}
+    try:
+        return {str(key): float(value) for key, value in json.loads(spec).items()}
+    except (ValueError, TypeError, AttributeError) as e:
+        raise ValueError(f"Invalid LICENSE_PRICES: {str(e)}")
+
+
+class LicenseCatalog:
+    def __init__(self, subscribed: Iterable[Dict[str, Any]] = (), overrides: Optional[Dict[str, float]] = None):
+        self.skus: Dict[str, Sku] = {
+            sku.sku_id: Sku(sku.sku_id, sku.part_number, sku.name, sku.monthly_price) for sku in KNOWN_SKUS
+        }
+        for entry in subscribed:
+            sku = self.skus.get(entry["sku_id"])
+            if sku is None:
+                # Not in the price table: named after its part number and priced at 0 until overridden
+                sku = self.skus[entry["sku_id"]] = Sku(
+                    entry["sku_id"], entry["part_number"], entry["part_number"], 0.0, priced=False
+                )
+            sku.purchased = entry.get("purchased") or 0
+            sku.consumed = entry.get("consumed") or 0
+
+        overrides = _price_overrides() if overrides is None else overrides
+        for sku in self.skus.values():
+            price = overrides.get(sku.sku_id, overrides.get(sku.part_number))
+            if price is not None:
+                sku.monthly_price = price
+                sku.priced = True
+
+        self._by_name = {sku.name: sku.sku_id for sku in self.skus.values()}
+        self._by_name.update({sku.part_number: sku.sku_id for sku in self.skus.values()})
+        self._by_name.update(ALIASES)
+        self._resolved: Dict[Tuple, Tuple[Tuple[str, ...], Optional[str], float]] = {}
+
+    def sku(self, key: str) -> Optional[Sku]:
+        """A SKU by id, name or part number"""
+        return self.skus.get(key) or self.skus.get(self._by_name.get(key, ""))
+
+    def price(self, key: str) -> float:
+        sku = self.sku(key)
+        return sku.monthly_price if sku else 0.0
+
+    def name(self, key: str) -> str:
+        sku = self.sku(key)
+        return sku.name if sku else key
+
+    def resolve(
+        self,
+        licenses: Iterable[str] = (),
+        license_type: Optional[str] = None
+    ) -> Tuple[Tuple[str, ...], Optional[str], float]:
+        """(SKU ids, display label, monthly cost) for a user's licenses
+
+        Users without assigned SKUs but with a named license (e.g. created
+        with license_type "Business Basic") resolve through that name. The
+        result is memoized per combination, so records share the tuple and
+        label objects.
+        """
+        licenses = tuple(sorted(licenses or ()))
+        memo_key = licenses or (None, license_type)
+        resolved = self._resolved.get(memo_key)
+        if resolved is None:
+            label = license_type
+            if not licenses and license_type:
+                sku = self.sku(license_type)
+                # Unknown names stay as given, unpriced
+                licenses = (sku.sku_id,) if sku else ()
+            if licenses:
+                skus = sorted(licenses, key=lambda key: (-self.price(key), self.name(key)))
+                label = " + ".join(self.name(key) for key in skus)
+            resolved = self._resolved[memo_key] = (licenses, label, sum(self.price(key) for key in licenses))
+        return resolved
+
+    def subscribed(self) -> List[Sku]:
+        return [sku for sku in self.skus.values() if sku.purchased is not None]
+
+
+def license_report(catalog: LicenseCatalog, by_license: Dict[str, List]) -> Dict[str, Any]:
+    """Spend and waste per SKU
+
+    Purchased and consumed seats come from /subscribedSkus, assignments from
+    the user snapshot (`UserStats.by_license`). Waste is seats bought but not
+    consumed plus seats held by disabled accounts.
+    """
+    keys = [sku.sku_id for sku in catalog.subscribed()]
+    keys += [key for key in by_license if key not in keys]
+
+    skus = []
+    totals = {"monthly_spend": 0.0, "assigned_cost": 0.0, "waste_monthly_cost": 0.0, "unused_seats": 0}
+    for key in keys:
+        sku = catalog.sku(key)
+        price = sku.monthly_price if sku else 0.0
+        users, enabled_cost, disabled = by_license.get(key, (0, 0.0, 0))
+        purchased = sku.purchased if sku else None
+        unused = max(purchased - (sku.consumed or 0), 0) if purchased is not None else 0
+        waste = (unused + disabled) * price
+        skus.append({
+            "sku_id": sku.sku_id if sku else None,
+            "part_number": sku.part_number if sku else None,
+            "name": sku.name if sku else key,
+            "monthly_price": price,
+            "priced": sku.priced if sku else False,
+            "purchased": purchased,
+            "consumed": sku.consumed if sku else None,
+            "assigned": users,
+            "assigned_disabled": disabled,
+            "unused": unused,
+            "monthly_spend": round((purchased if purchased is not None else users) * price, 2),
+            "assigned_cost": round(enabled_cost, 2),
+            "waste_monthly_cost": round(waste, 2),
+        })
+        totals["monthly_spend"] += (purchased if purchased is not None else users) * price
+        totals["assigned_cost"] += enabled_cost
+        totals["waste_monthly_cost"] += waste
+        totals["unused_seats"] += unused
+
+    skus.sort(key=lambda entry: (-entry["waste_monthly_cost"], entry["name"]))
+    return {
+        "skus": skus,
+        **{name: round(value, 2) if isinstance(value, float) else value for name, value in totals.items()},
+    }
+
+
+# Prices only: used wherever no tenant catalog has been loaded
+default_catalog = LicenseCatalog()
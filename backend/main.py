@@ -1,32 +1,119 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request, Response, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from starlette.datastructures import UploadFile
 from sqlalchemy.orm import Session
-from typing import Optional, List
-from datetime import datetime
+from typing import Any, Optional, List, Callable
+from datetime import datetime, timedelta
+import asyncio
+import json
 import logging
 
 from config import get_settings
 from cache import cache
+from metrics import MetricsMiddleware, registry
+from admission import AdmissionMiddleware, AdmissionRule, query_param
+from responses import parse_fields, project, cached_json_response, json_response, RequestStreamingResponse
+from user_store import UserStore, USER_FIELDS
+from search import SearchIndex, SERVER_SEARCH_FIELDS
+from licensing import LicenseCatalog, license_report
+from rollups import InventoryColumns, ROLLUP_DIMENSIONS
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-from database import get_db, init_db, AuditLog
+from database import get_db, init_db, AuditLog, SessionLocal
+from jobs import job_manager, JobContext, QueueFullError, FINISHED
+from subscriptions import subscription_manager, apply_user_notifications
+from onboarding import bulk_create_users, upload_chunks, CSVFormatError
+from expiry import expiry_tracker
+from history import inventory_history, flatten_metrics, HistoryQueryError
+from exports import (
+    check_format,
+    select_columns,
+    stream_rows,
+    audit_rows,
+    export_filename,
+    ExportFormatError,
+    naive_utc,
+    MEDIA_TYPES,
+    USER_EXPORT_COLUMNS,
+    SERVER_EXPORT_COLUMNS,
+    AUDIT_EXPORT_COLUMNS
+)
+from tenants import tenant_registry, tenant_key, UnknownTenantError, DEFAULT_TENANT
 from models import (
     Domain,
     User,
     CreateUserRequest,
     UserListResponse,
+    Tenant,
+    SearchResponse,
+    ExpiringResponse,
+    LicenseReport,
     AIAnalysisRequest,
-    AIAnalysisResponse
+    AIAnalysisResponse,
+    JobSubmitResponse,
+    SERVER_FIELDS
+)
+from providers import get_provider, prewarm
+from ai.recommender import MODEL
+from ai.result_cache import (
+    fingerprint_users,
+    result_key,
+    get_result,
+    put_result,
+    invalidate_stale_snapshots
 )
-from providers.microsoft import MicrosoftGraphProvider
-from ai.recommender import AIRecommender
 
 app = FastAPI(title="JARVIS API", version="1.0.0")
 
 settings = get_settings()
 
+
+def _users_uncached(scope) -> bool:
+    try:
+        tenant = tenant_registry.resolve(query_param(scope, "tenant"))
+    except UnknownTenantError:
+        # Answered with a 404 straight away
+        return False
+    return not cache.contains(tenant_key("users", tenant))
+
+
+def _tenant_users_uncached(scope) -> bool:
+    return not all(cache.contains(tenant_key("users", tenant)) for tenant in tenant_registry.tenants())
+
+
+def _servers_uncached(scope) -> bool:
+    return not cache.contains("servers")
+
+
+# Requests that start a full Graph scan, provider sweep or Claude call; the
+# first matching rule applies. Served from cache, listings are cheap and unlimited.
+ADMISSION_RULES = [
+    AdmissionRule("analyze", "POST", ("/api/analyze-users",)),
+    AdmissionRule("ask", "POST", ("/api/ask",), dedupe=False),
+    AdmissionRule("refresh", "POST", ("/api/cache/refresh",)),
+    AdmissionRule(
+        "users", "GET",
+        ("/api/users", "/api/stats", "/api/licenses", "/api/search"),
+        applies=_users_uncached
+    ),
+    AdmissionRule("tenant_users", "GET", ("/api/tenants/users",), applies=_tenant_users_uncached),
+    AdmissionRule(
+        "servers", "GET",
+        ("/api/servers", "/api/servers/rollups", "/api/stats"),
+        applies=_servers_uncached
+    ),
+    # Exports load the same snapshots, but a follower would wait out a whole
+    # (possibly slow) download, so they aren't deduplicated
+    AdmissionRule("users", "GET", ("/api/export/users",), applies=_users_uncached, dedupe=False),
+    AdmissionRule("servers", "GET", ("/api/export/servers",), applies=_servers_uncached, dedupe=False),
+]
+
+# Innermost, so CORS headers and request metrics cover its 429s and 503s
+app.add_middleware(AdmissionMiddleware, rules=ADMISSION_RULES)
+
 # CORS configuration
 cors_origins = settings.cors_origins.split(",")
 app.add_middleware(
@@ -35,86 +122,237 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "Retry-After"],
 )
+app.add_middleware(MetricsMiddleware)
 
 # Initialize database on startup
 @app.on_event("startup")
-def startup_event():
+async def startup_event():
     init_db()
+    await job_manager.start()
+    await subscription_manager.start()
+    await expiry_tracker.start()
+
+    # Load provider SDKs off the event loop so the first request doesn't pay for them
+    if settings.prewarm_providers:
+        asyncio.get_running_loop().run_in_executor(None, prewarm)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await subscription_manager.stop()
+    await expiry_tracker.stop()
+    await job_manager.stop()
+    await inventory_history.drain()
+    await tenant_registry.aclose()
 
 
 # User Management Endpoints (PRIORITY)
 
-@app.get("/api/domains", response_model=List[Domain])
-async def get_domains():
-    """Fetch verified domains from Microsoft 365"""
+def _tenant(tenant: Optional[str]) -> str:
+    """Resolve the `tenant` query parameter (default tenant when omitted)"""
     try:
-        # Check cache first
-        cached = cache.get("domains")
-        if cached is not None:
-            logger.info("Returning cached domains")
-            return cached
+        return tenant_registry.resolve(tenant)
+    except UnknownTenantError:
+        raise HTTPException(status_code=404, detail=f"Unknown tenant: {tenant}")
 
-        # Fetch from API
-        provider = MicrosoftGraphProvider()
-        domains = await provider.get_domains()
 
-        # Cache for 1 hour
-        cache.set("domains", domains, ttl_seconds=3600)
+async def _load_domains(tenant: str) -> List[dict]:
+    """Return the tenant's cached verified domains, fetching them on a miss"""
+    # Check cache first
+    cached = cache.get(tenant_key("domains", tenant))
+    if cached is not None:
+        logger.info(f"Returning cached domains for tenant: {tenant}")
+        return cached
+
+    # Fetch from API
+    provider = tenant_registry.provider(tenant)
+    domains = await provider.get_domains()
+
+    # Cache for 1 hour
+    cache.set(tenant_key("domains", tenant), domains, ttl_seconds=3600)
 
-        return domains
+    return domains
+
+
+@app.get("/api/tenants", response_model=List[Tenant])
+async def get_tenants():
+    """List the Microsoft 365 tenants this deployment manages"""
+    return [
+        {"id": config.id, "name": config.name or config.id}
+        for config in tenant_registry.tenants().values()
+    ]
+
+
+@app.get("/api/domains", response_model=List[Domain])
+async def get_domains(tenant: Optional[str] = None):
+    """Fetch verified domains from Microsoft 365"""
+    tenant = _tenant(tenant)
+    try:
+        return await _load_domains(tenant)
     except Exception as e:
         logger.error(f"Error fetching domains: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/api/users", response_model=UserListResponse)
-async def get_users(domain: Optional[str] = None, db: Session = Depends(get_db)):
-    """List all O365 users, filterable by domain"""
+async def _load_license_catalog(tenant: str) -> LicenseCatalog:
+    """Return the tenant's cached license catalog, fetching its subscribed SKUs on a miss"""
+    catalog = cache.get(tenant_key("skus", tenant))
+    if catalog is not None:
+        return catalog
+
+    provider = tenant_registry.provider(tenant)
+    ttl = settings.license_sku_ttl_seconds
     try:
-        # Create cache key based on domain filter
-        cache_key = f"users:{domain if domain else 'all'}"
+        catalog = LicenseCatalog(await provider.get_subscribed_skus())
+    except Exception as e:
+        # Needs Organization.Read.All; without it licenses are still priced from the list.
+        # The fallback is cached too, so a missing permission costs one failed call per retry period
+        logger.error(f"Error fetching subscribed SKUs for tenant {tenant}: {str(e)}")
+        catalog = LicenseCatalog()
+        ttl = settings.license_sku_retry_seconds
 
-        # Check cache first
-        cached = cache.get(cache_key)
-        if cached is not None:
-            logger.info(f"Returning cached users for domain: {domain or 'all'}")
-            return UserListResponse(**cached)
+    cache.set(tenant_key("skus", tenant), catalog, ttl_seconds=ttl)
+    return catalog
 
+
+async def _load_users(domain: Optional[str] = None, tenant: str = DEFAULT_TENANT) -> UserStore:
+    """Return the tenant's cached user snapshot (or a domain view of it), fetching it on a miss"""
+    # One snapshot serves every domain filter; views share its records
+    store = cache.get(tenant_key("users", tenant))
+    if store is not None:
+        logger.info(f"Returning cached users for tenant: {tenant}, domain: {domain or 'all'}")
+    else:
         # Fetch from API
-        provider = MicrosoftGraphProvider()
-        users = await provider.get_users(domain=domain)
+        provider = tenant_registry.provider(tenant)
+        users, catalog = await asyncio.gather(provider.get_users(), _load_license_catalog(tenant))
+        store = UserStore(users, catalog)
 
-        # Calculate monthly cost (rough estimate)
-        # Business Basic: $6/user/month, Business Standard: $12.50/user/month
-        monthly_cost = 0.0
-        for user in users:
-            if user.get("account_enabled") and user.get("license_type"):
-                if "Standard" in user.get("license_type", ""):
-                    monthly_cost += 12.50
-                else:
-                    monthly_cost += 6.00
-
-        result = UserListResponse(
-            users=users,
-            total=len(users),
-            monthly_cost=monthly_cost
+        # Cache for 1 hour
+        cache.set(tenant_key("users", tenant), store, ttl_seconds=3600)
+
+        kind = tenant_key("users", tenant)
+        inventory_history.record(
+            kind, store[:], USER_FIELDS, key=lambda user: user.id,
+            metrics=flatten_metrics(kind, store.stats.to_dict())
         )
 
-        # Cache the dict representation for 1 hour
-        cache.set(cache_key, result.model_dump(), ttl_seconds=3600)
+    return store.for_domain(domain) if domain else store
+
+
+def _users_fingerprint(store: UserStore, tenant: str = DEFAULT_TENANT) -> str:
+    """Fingerprint of the tenant's user snapshot, computed once per change to it"""
+    key = tenant_key("users", tenant)
+    snapshot = cache.get_variant(key, "fingerprint")
+    if snapshot is None:
+        snapshot = fingerprint_users(store)
+        cache.set_variant(key, "fingerprint", snapshot)
+    return snapshot
+
+
+def _cached_users_fingerprint(tenant: str = DEFAULT_TENANT) -> Optional[str]:
+    """Fingerprint of the tenant's snapshot if it is cached and already fingerprinted
+
+    For handlers that only need the snapshot to key a result: they must not
+    fetch (or fingerprint) the whole directory just to find a cache entry.
+    """
+    return cache.get_variant(tenant_key("users", tenant), "fingerprint")
 
-        return result
+
+def _update_cached_users(tenant: str, change: Callable[[UserStore], Any]) -> None:
+    """Apply a known change to the tenant's cached snapshot instead of dropping it"""
+    key = tenant_key("users", tenant)
+    store = cache.get(key)
+    if store is not None:
+        change(store)
+        # Only the encoded payloads derived from the snapshot are stale
+        cache.clear_variants(key)
+
+
+@app.get("/api/users", response_model=UserListResponse)
+async def get_users(
+    request: Request,
+    domain: Optional[str] = None,
+    fields: Optional[str] = None,
+    tenant: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """List all O365 users, filterable by domain, optionally projected to `fields`"""
+    projection = parse_fields(fields, USER_FIELDS)
+    tenant = _tenant(tenant)
+    try:
+        # Each domain gets its own cached payloads; only verified domains may add one
+        if domain and domain not in {entry["name"] for entry in await _load_domains(tenant)}:
+            raise HTTPException(status_code=404, detail=f"Unknown domain: {domain}")
+        users = await _load_users(domain, tenant)
+        if not domain:
+            # The cached snapshot's aggregates are kept current by notifications on
+            # the event loop, so they are first built here rather than in the build thread
+            users.stats
+
+        def build(fields):
+            return {
+                "users": users.to_dicts(fields or USER_FIELDS),
+                "total": len(users),
+                "monthly_cost": round(users.stats.monthly_cost, 2)
+            }
+
+        return await cached_json_response(
+            request, tenant_key("users", tenant), build, projection, variant=domain or "all"
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching users: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/tenants/users")
+async def get_tenant_users(request: Request, fields: Optional[str] = None):
+    """Users across every tenant, fetched concurrently; each record carries its `tenant`
+
+    A tenant that fails to load is reported under `tenants` with its error
+    rather than failing the whole view.
+    """
+    projection = parse_fields(fields, USER_FIELDS)
+    stores = await tenant_registry.gather(lambda tenant: _load_users(tenant=tenant))
+
+    tenants = []
+    users = []
+    for tenant, store in stores.items():
+        if isinstance(store, Exception):
+            logger.error(f"Error fetching users for tenant {tenant}: {str(store)}")
+            tenants.append({"id": tenant, "total": 0, "monthly_cost": 0.0, "error": str(store)})
+            continue
+        tenants.append({
+            "id": tenant,
+            "total": len(store),
+            "monthly_cost": round(store.stats.monthly_cost, 2),
+            "error": None
+        })
+        for user in store.to_dicts(projection or USER_FIELDS):
+            user["tenant"] = tenant
+            users.append(user)
+
+    return json_response(request, {
+        "tenants": tenants,
+        "users": users,
+        "total": len(users),
+        "monthly_cost": sum(entry["monthly_cost"] for entry in tenants)
+    })
+
+
 @app.post("/api/users", response_model=User)
-async def create_user(user_request: CreateUserRequest, db: Session = Depends(get_db)):
+async def create_user(
+    user_request: CreateUserRequest,
+    tenant: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
     """Create new user with domain selection"""
+    tenant = _tenant(tenant)
     try:
-        provider = MicrosoftGraphProvider()
+        provider = tenant_registry.provider(tenant)
         user = await provider.create_user(
             full_name=user_request.full_name,
             username=user_request.username,
@@ -123,12 +361,8 @@ async def create_user(user_request: CreateUserRequest, db: Session = Depends(get
             license_type=user_request.license_type
         )
 
-        # Invalidate user caches (all variations)
-        cache.invalidate("users:all")
-        # Also invalidate domain-specific caches (simple approach: clear all user caches)
-        for key in list(cache.store.keys()):
-            if key.startswith("users:"):
-                cache.invalidate(key)
+        # Add the user to the cached snapshot (keeps its stats current)
+        _update_cached_users(tenant, lambda store: store.upsert(user))
 
         # Log the action
         log = AuditLog(
@@ -146,18 +380,112 @@ async def create_user(user_request: CreateUserRequest, db: Session = Depends(get
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/users/bulk")
+async def bulk_create(request: Request, tenant: Optional[str] = None):
+    """Create users from a CSV, streaming one NDJSON result per row
+
+    Send the CSV as the raw body (Content-Type: text/csv), parsed as it
+    arrives, or as a multipart `file` field. Columns: full_name, username,
+    domain and optionally department, manager_email, license_type. The last
+    line is a summary.
+    """
+    tenant = _tenant(tenant)
+    try:
+        domains = await _load_domains(tenant)
+    except Exception as e:
+        logger.error(f"Error fetching domains: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # Parsed here rather than as a File() parameter: FastAPI closes those
+    # before a streaming response has read them
+    form = None
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if not isinstance(upload, UploadFile):
+            await form.close()
+            raise HTTPException(status_code=400, detail="Missing CSV file field")
+        chunks = upload_chunks(upload)
+    else:
+        chunks = request.stream()
+
+    results = bulk_create_users(
+        chunks,
+        tenant_registry.provider(tenant),
+        [domain["name"] for domain in domains],
+        concurrency=settings.bulk_create_concurrency,
+        max_rows=settings.bulk_max_rows,
+        record_created=lambda users: _record_bulk_creation(users, tenant)
+    )
+    # Pull the first result now so a malformed file is rejected with a 400
+    try:
+        first = await results.__anext__()
+    except CSVFormatError as e:
+        if form is not None:
+            await form.close()
+        raise HTTPException(status_code=400, detail=str(e))
+    except StopAsyncIteration:
+        first = None
+
+    async def stream():
+        counts = {"created": 0, "invalid": 0, "failed": 0}
+        try:
+            if first is not None:
+                async for result in _prepend(first, results):
+                    if result["status"] in counts:
+                        counts[result["status"]] += 1
+                    yield json.dumps(result) + "\n"
+            yield json.dumps({"summary": {**counts, "rows": sum(counts.values())}}) + "\n"
+        finally:
+            # Records every user created, streamed or not, in one batch
+            await results.aclose()
+            if form is not None:
+                await form.close()
+
+    return RequestStreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+async def _prepend(first, rest):
+    yield first
+    async for item in rest:
+        yield item
+
+
+def _record_bulk_creation(users: List[dict], tenant: str) -> None:
+    """One cache update and one audit commit for a whole upload"""
+    def add_all(store: UserStore) -> None:
+        for user in users:
+            store.upsert(user)
+
+    _update_cached_users(tenant, add_all)
+
+    db = SessionLocal()
+    try:
+        db.add_all([
+            AuditLog(
+                action="create_user",
+                resource_type="user",
+                resource_id=user["id"],
+                user="system",  # TODO: Add authentication
+                details=f"Created user {user['email']} (bulk)"
+            )
+            for user in users
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
 @app.post("/api/users/{user_id}/disable")
-async def disable_user(user_id: str, db: Session = Depends(get_db)):
+async def disable_user(user_id: str, tenant: Optional[str] = None, db: Session = Depends(get_db)):
     """Disable user and release license"""
+    tenant = _tenant(tenant)
     try:
-        provider = MicrosoftGraphProvider()
+        provider = tenant_registry.provider(tenant)
         success = await provider.disable_user(user_id)
 
         if success:
-            # Invalidate user caches
-            for key in list(cache.store.keys()):
-                if key.startswith("users:"):
-                    cache.invalidate(key)
+            _update_cached_users(tenant, lambda store: store.update(user_id, account_enabled=False))
 
             # Log the action
             log = AuditLog(
@@ -181,17 +509,15 @@ async def disable_user(user_id: str, db: Session = Depends(get_db)):
 
 
 @app.delete("/api/users/{user_id}")
-async def delete_user(user_id: str, db: Session = Depends(get_db)):
+async def delete_user(user_id: str, tenant: Optional[str] = None, db: Session = Depends(get_db)):
     """Delete user permanently"""
+    tenant = _tenant(tenant)
     try:
-        provider = MicrosoftGraphProvider()
+        provider = tenant_registry.provider(tenant)
         success = await provider.delete_user(user_id)
 
         if success:
-            # Invalidate user caches
-            for key in list(cache.store.keys()):
-                if key.startswith("users:"):
-                    cache.invalidate(key)
+            _update_cached_users(tenant, lambda store: store.remove(user_id))
 
             # Log the action
             log = AuditLog(
@@ -214,94 +540,576 @@ async def delete_user(user_id: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Microsoft Graph change notifications
+@app.post("/api/webhooks/graph")
+async def graph_webhook(request: Request, background_tasks: BackgroundTasks):
+    """Receive Graph user change notifications"""
+    # Subscription validation handshake: echo the token as plain text
+    validation_token = request.query_params.get("validationToken")
+    if validation_token is not None:
+        return PlainTextResponse(validation_token)
+
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid notification payload")
+
+    notifications = body.get("value", [])
+    accepted = [n for n in notifications if subscription_manager.verify(n)]
+    if len(accepted) < len(notifications):
+        logger.warning(f"Rejected {len(notifications) - len(accepted)} Graph notification(s) with bad client state")
+
+    # Each tenant's notifications go to its own snapshot
+    by_tenant: dict = {}
+    for notification in accepted:
+        tenant = subscription_manager.tenant_of(notification)
+        if tenant is None:
+            logger.warning(f"Ignoring Graph notification for unknown tenant {notification.get('tenantId')}")
+            continue
+        by_tenant.setdefault(tenant, []).append(notification)
+
+    # Graph expects an answer within seconds; apply the changes afterwards
+    for tenant, tenant_notifications in by_tenant.items():
+        background_tasks.add_task(apply_user_notifications, tenant_notifications, tenant)
+
+    return Response(status_code=202)
+
+
 # AI Recommendations
 
-@app.post("/api/analyze-users", response_model=AIAnalysisResponse)
+def _analysis_key(db: Session, snapshot: str) -> str:
+    """Result key of an analysis of the user snapshot `snapshot`"""
+    # Results are keyed by the user snapshot, so directory changes miss
+    invalidate_stale_snapshots(db, "analyze_users", snapshot)
+    return result_key(
+        "analyze_users",
+        snapshot=snapshot,
+        model=MODEL,
+        inactive_days=settings.ai_inactive_days
+    )
+
+
+def _analysis_response(analysis: dict, cached: bool) -> AIAnalysisResponse:
+    return AIAnalysisResponse(
+        response=analysis["response"],
+        recommendations=analysis.get("recommendations"),
+        stats=analysis.get("stats"),
+        cached=cached
+    )
+
+
+async def _run_user_analysis(
+    db: Session,
+    progress: Optional[Callable[[float, str], None]] = None
+) -> AIAnalysisResponse:
+    """Analyze the current user snapshot, reusing a cached result when possible"""
+    def report(fraction: float, message: str) -> None:
+        if progress:
+            progress(fraction, message)
+
+    # Get all users
+    report(0.05, "Loading users")
+    users = await _load_users()
+    snapshot = _users_fingerprint(users)
+    key = _analysis_key(db, snapshot)
+
+    analysis = get_result(db, key, settings.ai_cache_ttl_seconds)
+    cached = analysis is not None
+    if not cached:
+        # Analyze with AI
+        report(0.2, f"Analyzing {len(users)} users")
+        recommender = get_provider("ai")
+        analysis = await recommender.analyze_users(
+            users,
+            on_chunk_done=lambda done, total: report(0.2 + 0.75 * done / total, f"Analyzed part {done} of {total}")
+        )
+        put_result(db, key, "analyze_users", analysis, snapshot=snapshot)
+
+    return _analysis_response(analysis, cached)
+
+
+# Analysis job queued per user snapshot (None while it isn't loaded), so repeated requests join it
+_analysis_jobs: dict = {}
+
+
+@app.post(
+    "/api/analyze-users",
+    response_model=AIAnalysisResponse,
+    responses={202: {"model": JobSubmitResponse, "description": "Analysis queued"}}
+)
 async def analyze_users(db: Session = Depends(get_db)):
-    """Claude AI analyzes inactive users for cleanup"""
+    """Claude AI analyzes inactive users for cleanup
+
+    Returns the cached analysis of the current snapshot if there is one;
+    otherwise queues the analysis and answers 202 with its job id, to be
+    followed at /api/jobs/{job_id}. Users that aren't cached are loaded by
+    the job, never by this request.
+    """
     try:
-        # Get all users
-        provider = MicrosoftGraphProvider()
-        users = await provider.get_users()
+        snapshot = _cached_users_fingerprint()
+        if snapshot is not None:
+            analysis = get_result(db, _analysis_key(db, snapshot), settings.ai_cache_ttl_seconds)
+            if analysis is not None:
+                return _analysis_response(analysis, cached=True)
 
-        # Analyze with AI
-        recommender = AIRecommender()
-        analysis = await recommender.analyze_users(users)
+        job_id = _analysis_jobs.get(snapshot)
+        job = job_manager.get(job_id) if job_id else None
+        if job is None or job["status"] in FINISHED:
+            job_id = _analysis_jobs[snapshot] = job_manager.submit("analyze_users")
+            job = {"status": "queued"}
+        # Only the current snapshot's job is worth joining
+        for stale in [other for other in _analysis_jobs if other != snapshot]:
+            del _analysis_jobs[stale]
 
-        return AIAnalysisResponse(
-            response=analysis["response"],
-            recommendations=analysis.get("recommendations")
+        return JSONResponse(
+            status_code=202, content=JobSubmitResponse(job_id=job_id, status=job["status"]).model_dump()
         )
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/api/ask")
-async def ask_jarvis(request: AIAnalysisRequest):
+async def ask_jarvis(request: AIAnalysisRequest, db: Session = Depends(get_db)):
     """Send question to Claude API for recommendations"""
     try:
-        recommender = AIRecommender()
+        # Answers may be about the directory, so they are keyed by its snapshot like
+        # analyses. Questions don't read the directory, so it isn't loaded for a key:
+        # without a fingerprinted snapshot the result cache is skipped
+        snapshot = _cached_users_fingerprint()
+        key = None
+        if snapshot is not None:
+            invalidate_stale_snapshots(db, "ask", snapshot)
+            key = result_key("ask", question=request.question, context=request.context, snapshot=snapshot, model=MODEL)
+            cached = get_result(db, key, settings.ai_cache_ttl_seconds)
+            if cached is not None:
+                return {"response": cached["response"], "cached": True}
+
+        recommender = get_provider("ai")
         response = await recommender.ask(request.question, request.context)
+        if key is not None:
+            put_result(db, key, "ask", {"response": response}, snapshot=snapshot)
 
-        return {"response": response}
+        return {"response": response, "cached": False}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Background Jobs
+
+@job_manager.register("analyze_users")
+async def analyze_users_job(job: JobContext) -> dict:
+    """Run the user analysis outside the request cycle"""
+    db = SessionLocal()
+    try:
+        result = await _run_user_analysis(db, job.progress)
+        return result.model_dump()
+    finally:
+        db.close()
+
+
+@app.post("/api/jobs/analyze-users", response_model=JobSubmitResponse, status_code=202)
+async def submit_analyze_users():
+    """Queue a user analysis and return its job id"""
+    try:
+        job_id = job_manager.submit("analyze_users")
+        return JobSubmitResponse(job_id=job_id, status="queued")
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get job status and progress"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Stream job progress as server-sent events"""
+    if job_manager.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def stream():
+        async for state in job_manager.events(job_id):
+            yield f"event: {state['status']}\ndata: {json.dumps(state)}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+@app.get("/api/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Get the result of a finished job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=job["error"])
+    if job["status"] != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return job_manager.result(job_id)
+
+
 # Server Management Endpoints
 
+async def _load_servers() -> dict:
+    """Return the cached server inventory, fetching it on a miss"""
+    # Check cache first
+    cached = cache.get("servers")
+    if cached is not None:
+        logger.info("Returning cached servers")
+        return cached
+
+    servers = []
+
+    # Fetch DigitalOcean droplets
+    try:
+        do_provider = get_provider("digitalocean")
+        do_servers = await do_provider.get_droplets()
+        servers.extend(do_servers)
+    except Exception as e:
+        logger.error(f"Error fetching DigitalOcean servers: {str(e)}")
+
+    # Fetch AWS EC2 instances across all regions
+    try:
+        aws_provider = get_provider("aws")
+        aws_servers = await aws_provider.get_instances()
+        servers.extend(aws_servers)
+    except Exception as e:
+        logger.error(f"Error fetching AWS servers: {str(e)}")
+
+    # Fetch GoDaddy domains
+    try:
+        godaddy_provider = get_provider("godaddy")
+        godaddy_servers = await godaddy_provider.get_servers()
+        servers.extend(godaddy_servers)
+    except Exception as e:
+        logger.error(f"Error fetching GoDaddy servers: {str(e)}")
+
+    columns = InventoryColumns(servers)
+    result = {
+        "servers": servers,
+        "total": len(servers),
+        "monthly_cost": round(columns.total_cost(), 2)
+    }
+
+    # Cache for 1 hour
+    cache.set("servers", result, ttl_seconds=3600)
+    cache.set_variant("servers", "columns", columns)
+
+    inventory_history.record(
+        "servers", servers, SERVER_FIELDS,
+        key=lambda server: f"{server.get('provider')}:{server.get('type')}:{server.get('id')}",
+        metrics=flatten_metrics("servers", _server_stats(result))
+    )
+
+    # Keep the expiry index in step with what providers just reported
+    try:
+        expiry_tracker.sync(servers)
+    except Exception as e:
+        logger.error(f"Error syncing expiry index: {str(e)}", exc_info=True)
+
+    return result
+
+
 @app.get("/api/servers")
-async def get_servers():
-    """List all servers from DO, AWS, GoDaddy"""
+async def get_servers(request: Request, fields: Optional[str] = None):
+    """List all servers from DO, AWS, GoDaddy, optionally projected to `fields`"""
+    projection = parse_fields(fields, SERVER_FIELDS)
     try:
-        # Check cache first
-        cached = cache.get("servers")
-        if cached is not None:
-            logger.info("Returning cached servers")
-            return cached
+        result = await _load_servers()
+        return await cached_json_response(request, "servers", lambda fields: project(result, "servers", fields), projection)
+    except Exception as e:
+        logger.error(f"Error fetching servers: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
 
-        from providers.digitalocean import DigitalOceanProvider
-        from providers.aws import AWSProvider
-        from providers.godaddy import GoDaddyProvider
 
-        servers = []
+def _server_columns(result: dict) -> InventoryColumns:
+    """Columnar form of the server inventory, built once per cache fill"""
+    columns = cache.get_variant("servers", "columns")
+    if columns is None:
+        columns = InventoryColumns(result["servers"])
+        cache.set_variant("servers", "columns", columns)
+    return columns
 
-        # Fetch DigitalOcean droplets
-        try:
-            do_provider = DigitalOceanProvider()
-            do_servers = await do_provider.get_droplets()
-            servers.extend(do_servers)
-        except Exception as e:
-            logger.error(f"Error fetching DigitalOcean servers: {str(e)}")
 
-        # Fetch AWS EC2 instances across all regions
-        try:
-            aws_provider = AWSProvider()
-            aws_servers = await aws_provider.get_instances()
-            servers.extend(aws_servers)
-        except Exception as e:
-            logger.error(f"Error fetching AWS servers: {str(e)}")
+def _server_stats(result: dict) -> dict:
+    """Server counts and cost by provider and region, computed once per cache fill"""
+    stats = cache.get_variant("servers", "stats")
+    if stats is not None:
+        return stats
 
-        # Fetch GoDaddy domains
-        try:
-            godaddy_provider = GoDaddyProvider()
-            godaddy_servers = await godaddy_provider.get_servers()
-            servers.extend(godaddy_servers)
-        except Exception as e:
-            logger.error(f"Error fetching GoDaddy servers: {str(e)}")
-
-        result = {
-            "servers": servers,
-            "total": len(servers),
-            "monthly_cost": sum(s.get("cost_monthly", 0) for s in servers)
+    columns = _server_columns(result)
+    total = columns.rollup(())
+    stats = {
+        "total": result["total"],
+        "running": total[0]["running"] if total else 0,
+        "unpriced": total[0]["unpriced"] if total else 0,
+        "monthly_cost": round(result["monthly_cost"], 2),
+    }
+    for dimension in ("provider", "region"):
+        stats[f"by_{dimension}"] = dict(sorted(
+            (row[dimension], {"count": row["count"], "monthly_cost": row["monthly_cost"]})
+            for row in columns.rollup((dimension,))
+        ))
+    cache.set_variant("servers", "stats", stats)
+    return stats
+
+
+@app.get("/api/servers/rollups")
+async def get_server_rollups(request: Request, by: str = "provider"):
+    """Server count, utilization and cost grouped by any of provider, region, size, status and type
+
+    `by=provider,region` groups by both. Utilization is the share of servers
+    running; idle cost is what stopped servers still bill.
+    """
+    dimensions = tuple(name.strip() for name in by.split(",") if name.strip())
+    unknown = [name for name in dimensions if name not in ROLLUP_DIMENSIONS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown rollup dimension: {', '.join(unknown)} (expected any of {', '.join(ROLLUP_DIMENSIONS)})"
+        )
+    try:
+        result = await _load_servers()
+
+        def build(fields):
+            columns = _server_columns(result)
+            total = columns.rollup(())
+            return {
+                "by": list(dimensions),
+                "groups": columns.rollup(dimensions),
+                "total": total[0] if total else None,
+            }
+
+        return await cached_json_response(request, "servers", build, variant=f"rollups:{','.join(dimensions)}")
+    except Exception as e:
+        logger.error(f"Error computing server rollups: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/expiring", response_model=ExpiringResponse)
+async def get_expiring(within: int = 30, include_expired: bool = False):
+    """Domains and certificates expiring within `within` days, soonest first
+
+    Answered from the expiry index, which is synced whenever the inventory is
+    fetched; it is only populated from the providers on first use.
+    """
+    if within < 0:
+        raise HTTPException(status_code=400, detail="within must be a number of days >= 0")
+    try:
+        if not expiry_tracker.populated():
+            await _load_servers()
+        items = expiry_tracker.expiring(within, include_expired)
+        return {"within_days": within, "items": items, "total": len(items)}
+    except Exception as e:
+        logger.error(f"Error fetching expiring items: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Exports
+
+def _export_response(kind: str, rows, columns, format: str) -> StreamingResponse:
+    return StreamingResponse(
+        stream_rows(rows, columns, format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(kind, format)}"'}
+    )
+
+
+def _export_format(format: str) -> str:
+    try:
+        return check_format(format)
+    except ExportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/export/users")
+async def export_users(
+    format: str = "csv",
+    domain: Optional[str] = None,
+    fields: Optional[str] = None,
+    tenant: Optional[str] = None
+):
+    """Stream the cached user snapshot as CSV or Parquet"""
+    format = _export_format(format)
+    columns = select_columns(USER_EXPORT_COLUMNS, parse_fields(fields, USER_FIELDS))
+    tenant = _tenant(tenant)
+    try:
+        users = await _load_users(domain, tenant)
+    except Exception as e:
+        logger.error(f"Error exporting users: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    # A shallow copy of the record list: notifications applied mid-download
+    # can't reorder what is being streamed
+    return _export_response("users", users[:], columns, format)
+
+
+@app.get("/api/export/servers")
+async def export_servers(format: str = "csv", fields: Optional[str] = None):
+    """Stream the cached server inventory as CSV or Parquet"""
+    format = _export_format(format)
+    columns = select_columns(SERVER_EXPORT_COLUMNS, parse_fields(fields, SERVER_FIELDS))
+    try:
+        result = await _load_servers()
+    except Exception as e:
+        logger.error(f"Error exporting servers: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    return _export_response("servers", result["servers"], columns, format)
+
+
+@app.get("/api/export/audit")
+async def export_audit(
+    format: str = "csv",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    action: Optional[str] = None
+):
+    """Stream the audit log, oldest first, as CSV or Parquet"""
+    format = _export_format(format)
+    return _export_response("audit", audit_rows(since, until, action), AUDIT_EXPORT_COLUMNS, format)
+
+
+# History
+
+@app.get("/api/history/metrics")
+async def get_history_metrics(prefix: Optional[str] = None):
+    """Recorded metric series, e.g. `users:default.licensed` or `servers.monthly_cost`"""
+    return {"metrics": inventory_history.metric_names(prefix)}
+
+
+@app.get("/api/history/series")
+async def get_history_series(
+    metric: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    bucket: str = "day",
+    aggregate: str = "avg"
+):
+    """One metric over time, one point per `bucket` (raw, hour, day, week, month)
+
+    Defaults to the last 30 days; `aggregate` is avg, min, max, last or sum.
+    """
+    end = naive_utc(end) if end else datetime.utcnow()
+    start = naive_utc(start) if start else end - timedelta(days=30)
+    try:
+        points = inventory_history.series(metric, start, end, bucket, aggregate)
+    except HistoryQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"metric": metric, "bucket": bucket, "aggregate": aggregate, "points": points}
+
+
+@app.get("/api/history/snapshots")
+async def get_history_snapshots(
+    kind: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+):
+    """Recorded snapshots, oldest first; `kind` is e.g. `users:default` or `servers`"""
+    snapshots = inventory_history.snapshots(
+        kind, naive_utc(start) if start else None, naive_utc(end) if end else None
+    )
+    return {"snapshots": snapshots, "total": len(snapshots)}
+
+
+@app.get("/api/history/snapshots/{snapshot_id}")
+async def get_history_snapshot(request: Request, snapshot_id: int):
+    """Every record as it was when the snapshot was taken"""
+    snapshot = await asyncio.to_thread(inventory_history.snapshot_records, snapshot_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    return json_response(request, snapshot)
+
+
+@app.get("/api/licenses", response_model=LicenseReport)
+async def get_licenses(tenant: Optional[str] = None):
+    """License spend and waste per SKU
+
+    Purchased and consumed seats come from the tenant's subscribed SKUs,
+    assignments from the cached user snapshot. Waste counts seats bought but
+    unassigned plus licenses held by disabled accounts.
+    """
+    tenant = _tenant(tenant)
+    try:
+        users, catalog = await asyncio.gather(_load_users(tenant=tenant), _load_license_catalog(tenant))
+        return license_report(catalog, users.stats.by_license)
+    except Exception as e:
+        logger.error(f"Error computing license report: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Dashboard summary
+@app.get("/api/stats")
+async def get_stats(tenant: Optional[str] = None):
+    """Summary counts and costs for dashboard cards
+
+    User aggregates are kept current as users are created, disabled, deleted
+    or changed upstream, so this never walks the user list once it's cached.
+    """
+    tenant = _tenant(tenant)
+    try:
+        users, servers = await asyncio.gather(_load_users(tenant=tenant), _load_servers())
+        user_stats = users.stats.to_dict()
+        server_stats = _server_stats(servers)
+        return {
+            "tenant": tenant,
+            "users": user_stats,
+            "servers": server_stats,
+            "monthly_cost": round(user_stats["monthly_cost"] + server_stats["monthly_cost"], 2)
         }
+    except Exception as e:
+        logger.error(f"Error computing stats: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Cache for 1 hour
-        cache.set("servers", result, ttl_seconds=3600)
 
-        return result
+# Typeahead search
+SEARCH_KINDS = ("users", "servers")
+
+
+def _server_index(result: dict) -> SearchIndex:
+    """Search index over the server inventory, built once per cache fill"""
+    index = cache.get_variant("servers", "search")
+    if index is None:
+        index = SearchIndex(SERVER_SEARCH_FIELDS, result["servers"])
+        cache.set_variant("servers", "search", index)
+    return index
+
+
+@app.get("/api/search", response_model=SearchResponse)
+async def search(q: str, limit: int = 10, kinds: Optional[str] = None, tenant: Optional[str] = None):
+    """Ranked typeahead matches over user names, emails and departments and server names and regions
+
+    `kinds` is a comma-separated subset of "users,servers" (default both).
+    """
+    requested = parse_fields(kinds, SEARCH_KINDS) or SEARCH_KINDS
+    limit = min(max(limit, 1), 50)
+    tenant = _tenant(tenant)
+    try:
+        matches = []
+        if "users" in requested:
+            users = await _load_users(tenant=tenant)
+            matches += [
+                {"kind": "user", "id": user.id, "title": user.display_name or user.email,
+                 "subtitle": user.email, "score": round(score, 3)}
+                for score, user in users.search_index.search(q, limit)
+            ]
+        if "servers" in requested:
+            index = _server_index(await _load_servers())
+            matches += [
+                {"kind": "server", "id": str(server.get("id")), "title": server.get("name") or str(server.get("id")),
+                 "subtitle": " · ".join(filter(None, (server.get("provider"), server.get("region")))) or None,
+                 "score": round(score, 3)}
+                for score, server in index.search(q, limit)
+            ]
+        # Stable sort keeps each index's own tie-breaking
+        matches.sort(key=lambda match: match["score"], reverse=True)
+        return {"query": q, "results": matches[:limit]}
     except Exception as e:
-        logger.error(f"Error fetching servers: {str(e)}", exc_info=True)
+        logger.error(f"Error searching: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -319,6 +1127,13 @@ async def cache_stats():
     return cache.get_stats()
 
 
+# Metrics
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 # Health check
 @app.get("/health")
 async def health_check():
@@ -0,0 +1,201 @@
+"""Request tracing, latency histograms and Prometheus exposition"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import threading
+import time
+
+# Latency buckets in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: Dict[LabelKey, float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # label key -> (bucket counts, sum, count)
+        self.values: Dict[LabelKey, List] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _label_key(labels)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, ('le', str(bound)))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List = []
+        # Callbacks returning (name, type, help, [(labels, value)]) for externally held values
+        self.collectors: List[Callable[[], List[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]] = []
+
+    def counter(self, name: str, help: str) -> Counter:
+        metric = Counter(name, help)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = BUCKETS) -> Histogram:
+        metric = Histogram(name, help, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, callback):
+        """Register a callback that reports gauges/counters held elsewhere"""
+        self.collectors.append(callback)
+        return callback
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for callback in self.collectors:
+            for name, metric_type, help, samples in callback():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(_label_key(labels))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.histogram(
+    "jarvis_http_request_duration_seconds", "HTTP request latency by route"
+)
+span_duration = registry.histogram(
+    "jarvis_span_duration_seconds", "Duration of traced operations (upstream calls, cache lookups, DB commits)"
+)
+upstream_requests = registry.counter(
+    "jarvis_upstream_requests_total", "Upstream provider calls by outcome"
+)
+
+# Spans recorded during the current request: name -> [total seconds, count]
+_request_spans: ContextVar[Optional[Dict[str, List]]] = ContextVar("request_spans", default=None)
+
+
+def record_span(name: str, seconds: float, upstream: Optional[str] = None, error: bool = False) -> None:
+    """Record a finished span for the current request and the global metrics"""
+    span_duration.observe(seconds, span=name)
+    if upstream:
+        upstream_requests.inc(upstream=upstream, outcome="error" if error else "ok")
+
+    spans = _request_spans.get()
+    if spans is not None:
+        entry = spans.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+
+@contextmanager
+def span(name: str, upstream: Optional[str] = None) -> Iterator[None]:
+    """Time a block; pass `upstream` to count it as a provider call"""
+    started = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        record_span(name, time.perf_counter() - started, upstream=upstream, error=error)
+
+
+def server_timing(spans: Dict[str, List], total: float) -> str:
+    """Format recorded spans as a Server-Timing header value"""
+    entries = [
+        f'{name};dur={seconds * 1000:.2f};desc="n={count}"'
+        for name, (seconds, count) in spans.items()
+    ]
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording route latency and emitting Server-Timing"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        spans: Dict[str, List] = {}
+        token = _request_spans.set(spans)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(spans, time.perf_counter() - started).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_spans.reset(token)
+            route = scope.get("route")
+            http_request_duration.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status)
+            )
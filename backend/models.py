@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from typing import Optional, List, Dict, Any
 from datetime import datetime
 
 
@@ -9,6 +9,11 @@ class Domain(BaseModel):
     is_verified: bool
 
 
+class Tenant(BaseModel):
+    id: str
+    name: str
+
+
 class User(BaseModel):
     id: str
     email: str
@@ -16,11 +21,17 @@ class User(BaseModel):
     domain: str
     last_sign_in: Optional[datetime]
     account_enabled: bool
-    license_type: Optional[str]
+    licenses: List[str] = []  # Assigned SKU ids
+    license_type: Optional[str]  # Display name of the assigned SKUs
+    monthly_cost: float = 0.0
     department: Optional[str]
     manager: Optional[str]
 
 
+# Fields of the inventory records returned by /api/servers
+SERVER_FIELDS = ("id", "name", "provider", "type", "size", "cost_monthly", "status", "region", "expires_at")
+
+
 class CreateUserRequest(BaseModel):
     full_name: str
     username: str
@@ -36,6 +47,58 @@ class UserListResponse(BaseModel):
     monthly_cost: float
 
 
+class SearchResult(BaseModel):
+    kind: str  # "user" or "server"
+    id: str
+    title: str
+    subtitle: Optional[str] = None
+    score: float
+
+
+class SearchResponse(BaseModel):
+    query: str
+    results: List[SearchResult]
+
+
+class ExpiringItem(BaseModel):
+    key: str
+    name: Optional[str]
+    provider: Optional[str]
+    type: Optional[str]
+    expires_at: str
+    days_left: float
+
+
+class ExpiringResponse(BaseModel):
+    within_days: int
+    items: List[ExpiringItem]
+    total: int
+
+
+class LicenseSku(BaseModel):
+    sku_id: Optional[str]
+    part_number: Optional[str]
+    name: str
+    monthly_price: float
+    priced: bool  # False when the SKU has no known price
+    purchased: Optional[int]
+    consumed: Optional[int]
+    assigned: int
+    assigned_disabled: int
+    unused: int
+    monthly_spend: float
+    assigned_cost: float
+    waste_monthly_cost: float
+
+
+class LicenseReport(BaseModel):
+    skus: List[LicenseSku]
+    monthly_spend: float
+    assigned_cost: float
+    waste_monthly_cost: float
+    unused_seats: int
+
+
 class AIAnalysisRequest(BaseModel):
     question: str
     context: Optional[dict] = None
@@ -44,3 +107,10 @@ class AIAnalysisRequest(BaseModel):
 class AIAnalysisResponse(BaseModel):
     response: str
     recommendations: Optional[List[str]] = None
+    stats: Optional[Dict[str, Any]] = None
+    cached: bool = False
+
+
+class JobSubmitResponse(BaseModel):
+    job_id: str
+    status: str
@@ -0,0 +1,211 @@
+"""Bulk user onboarding from CSV uploads
+
+Rows are parsed as the upload is read, validated against CreateUserRequest
+and the verified domains, and created with bounded concurrency. Results are
+yielded per row as they complete, so callers can stream them back.
+"""
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Set
+from starlette.datastructures import UploadFile
+from pydantic import ValidationError
+from models import CreateUserRequest
+from scheduler import priority, BACKGROUND
+import asyncio
+import codecs
+import csv
+import httpx
+import logging
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = ("full_name", "username", "domain")
+OPTIONAL_COLUMNS = ("department", "manager_email", "license_type")
+KNOWN_COLUMNS = REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+
+# Bytes read from the upload per iteration
+READ_CHUNK_BYTES = 64 * 1024
+
+
+class CSVFormatError(ValueError):
+    """The upload is not a usable onboarding CSV"""
+
+
+async def upload_chunks(upload: UploadFile) -> AsyncIterator[bytes]:
+    """Read a multipart upload in chunks"""
+    while True:
+        chunk = await upload.read(READ_CHUNK_BYTES)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def read_csv_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[List[str]]:
+    """Yield CSV records as the bytes arrive, never holding the whole file"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""  # Lines of a record whose quoted field spans a newline
+    buffer = ""
+    eof = False
+    while not eof:
+        chunk = await anext(chunks, b"")
+        eof = not chunk
+        try:
+            buffer += decoder.decode(chunk, final=eof)
+        except UnicodeDecodeError:
+            raise CSVFormatError("CSV must be UTF-8 encoded")
+
+        # Only \n (or \r\n) ends a line: str.splitlines() would also split on
+        # characters such as \x0c or \u2028 that are valid inside a field
+        *lines, buffer = buffer.split("\n")
+        lines = [line + "\n" for line in lines]
+        if eof and buffer:
+            lines.append(buffer)
+        for line in lines:
+            pending += line
+            # Escaped quotes come in pairs, so an odd count means an open quoted field
+            if pending.count('"') % 2:
+                continue
+            for record in csv.reader([pending]):
+                if any(field.strip() for field in record):
+                    yield record
+            pending = ""
+
+    if pending:
+        raise CSVFormatError("CSV ends inside a quoted field")
+
+
+def validate_row(
+    row: Dict[str, str],
+    verified_domains: Set[str],
+    seen: Set[str]
+) -> CreateUserRequest:
+    """Validate one row, raising ValueError with a readable message"""
+    values = {name: value.strip() for name, value in row.items() if value and value.strip()}
+    try:
+        user_request = CreateUserRequest(**values)
+    except ValidationError as e:
+        raise ValueError("; ".join(
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+        ))
+
+    if user_request.domain.lower() not in verified_domains:
+        raise ValueError(f"Domain {user_request.domain} is not a verified domain")
+
+    email = f"{user_request.username}@{user_request.domain}".lower()
+    if email in seen:
+        raise ValueError(f"Duplicate of an earlier row ({email})")
+    seen.add(email)
+    return user_request
+
+
+def _error_message(error: Exception) -> str:
+    if isinstance(error, httpx.HTTPStatusError):
+        try:
+            return error.response.json()["error"]["message"]
+        except (ValueError, KeyError, TypeError):
+            return f"Graph returned {error.response.status_code}"
+    return str(error)
+
+
+async def bulk_create_users(
+    chunks: AsyncIterator[bytes],
+    provider: Any,
+    verified_domains: Iterable[str],
+    concurrency: int,
+    max_rows: int,
+    record_created: Optional[Callable[[List[Dict[str, Any]]], None]] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """Create the users in a CSV byte stream, yielding one result per row as it completes
+
+    Results are `{"row", "status", ...}` with status "created", "invalid" or
+    "failed"; `row` is the 1-based data row number in the file. A format error
+    before any row was processed raises CSVFormatError; later ones end the
+    stream with an "aborted" result once in-flight creates finish.
+
+    `record_created(users)` is called once, when the stream ends or is closed,
+    with every user created, including any whose result was never yielded
+    because the consumer went away.
+    """
+    verified = {domain.lower() for domain in verified_domains}
+    seen: Set[str] = set()
+    pending: Set[asyncio.Task] = set()
+    created: List[Dict[str, Any]] = []
+
+    async def create(row_number: int, user_request: CreateUserRequest) -> Dict[str, Any]:
+        try:
+            # A large upload must not crowd out interactive calls; rows wait for
+            # a slot rather than being shed
+            with priority(BACKGROUND, max_wait=None):
+                user = await provider.create_user(
+                    full_name=user_request.full_name,
+                    username=user_request.username,
+                    domain=user_request.domain,
+                    department=user_request.department,
+                    license_type=user_request.license_type
+                )
+            # Collected here rather than as results are yielded, so none is lost
+            created.append(user)
+            return {"row": row_number, "status": "created", "user": user}
+        except Exception as e:
+            logger.error(f"Bulk onboarding row {row_number} failed: {str(e)}")
+            return {
+                "row": row_number,
+                "status": "failed",
+                "email": f"{user_request.username}@{user_request.domain}",
+                "error": _error_message(e)
+            }
+
+    header: Optional[List[str]] = None
+    row_number = 0
+    yielded = False
+    try:
+        try:
+            async for record in read_csv_records(chunks):
+                if header is None:
+                    header = [name.strip().lower() for name in record]
+                    missing = [name for name in REQUIRED_COLUMNS if name not in header]
+                    if missing:
+                        raise CSVFormatError(f"Missing required columns: {', '.join(missing)}")
+                    continue
+
+                row_number += 1
+                if row_number > max_rows:
+                    raise CSVFormatError(f"CSV has more than {max_rows} rows")
+
+                row = {name: value for name, value in zip(header, record) if name in KNOWN_COLUMNS}
+                try:
+                    user_request = validate_row(row, verified, seen)
+                except ValueError as e:
+                    yielded = True
+                    yield {"row": row_number, "status": "invalid", "error": str(e)}
+                    continue
+
+                # Bounded concurrency: wait for a slot, streaming whatever finished
+                while len(pending) >= concurrency:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        yielded = True
+                        yield task.result()
+                pending.add(asyncio.create_task(create(row_number, user_request)))
+
+            if header is None:
+                raise CSVFormatError("CSV is empty")
+            aborted = None
+        except CSVFormatError as e:
+            # Nothing happened yet: let the caller reject the upload outright
+            if not yielded and not pending:
+                raise
+            aborted = str(e)
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+        if aborted:
+            yield {"row": row_number, "status": "aborted", "error": aborted}
+    finally:
+        # The client went away mid-stream: let in-flight creates finish rather than
+        # cancelling them halfway, and record what they did
+        if pending:
+            logger.warning(f"Bulk onboarding client disconnected; finishing {len(pending)} in-flight create(s)")
+            await asyncio.gather(*pending)
+        if created and record_created is not None:
+            record_created(created)
@@ -0,0 +1,72 @@
+"""Offline EC2 price list
+
+Prices are read from a CSV bundled with the app (data/ec2_prices.csv, or
+EC2_PRICES_FILE) and indexed by (instance type, region, OS) once, on first
+lookup. A row with region "*" prices a type in regions without a row of
+their own. Types the list doesn't know have no price rather than a price
+of $0, so they show up as unpriced instead of as free.
+"""
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from config import get_settings
+import csv
+import logging
+
+logger = logging.getLogger(__name__)
+
+BUNDLED_PRICES = Path(__file__).parent / "data" / "ec2_prices.csv"
+
+# On-demand prices are hourly; AWS bills a month as 730 hours
+HOURS_PER_MONTH = 730
+
+ANY_REGION = "*"
+
+
+def platform_os(platform_details: Optional[str]) -> str:
+    """Price list OS for an instance's PlatformDetails ("Linux/UNIX", "Windows", ...)"""
+    details = (platform_details or "Linux/UNIX").lower()
+    if details.startswith("windows"):
+        return "windows"
+    if details.startswith("red hat"):
+        return "rhel"
+    if details.startswith("suse"):
+        return "suse"
+    if details.startswith("ubuntu pro"):
+        return "ubuntu-pro"
+    return "linux"
+
+
+class PriceList:
+    def __init__(self, path: Path):
+        self.path = path
+        self._hourly: Dict[Tuple[str, str, str], float] = {}
+        with open(path, newline="") as file:
+            rows = csv.DictReader(line for line in file if not line.startswith("#"))
+            for row in rows:
+                key = (row["instance_type"].strip(), row["region"].strip(), row["os"].strip().lower())
+                self._hourly[key] = float(row["hourly_usd"])
+        self._missing: set = set()
+        logger.info(f"Loaded {len(self._hourly)} EC2 prices from {path}")
+
+    def __len__(self) -> int:
+        return len(self._hourly)
+
+    def hourly(self, instance_type: str, region: str, os: str = "linux") -> Optional[float]:
+        price = self._hourly.get((instance_type, region, os))
+        if price is None:
+            price = self._hourly.get((instance_type, ANY_REGION, os))
+        if price is None and (instance_type, region, os) not in self._missing:
+            # Once per combination, not once per instance
+            self._missing.add((instance_type, region, os))
+            logger.warning(f"No EC2 price for {instance_type} ({os}) in {region}; add it to {self.path.name}")
+        return price
+
+    def monthly(self, instance_type: str, region: str, os: str = "linux") -> Optional[float]:
+        hourly = self.hourly(instance_type, region, os)
+        return None if hourly is None else round(hourly * HOURS_PER_MONTH, 2)
+
+
+@lru_cache()
+def get_price_list() -> PriceList:
+    return PriceList(Path(get_settings().ec2_prices_file or BUNDLED_PRICES))
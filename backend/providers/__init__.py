@@ -1 +1,56 @@
 # Providers
+"""Lazy provider registry
+
+Provider modules pull in heavy SDKs (msal, boto3), so they are imported on
+first use rather than when the app starts.
+"""
+from typing import Any, Dict, Iterable, Optional
+import importlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# name -> (module, class)
+PROVIDERS = {
+    "microsoft": ("providers.microsoft", "MicrosoftGraphProvider"),
+    "digitalocean": ("providers.digitalocean", "DigitalOceanProvider"),
+    "aws": ("providers.aws", "AWSProvider"),
+    "godaddy": ("providers.godaddy", "GoDaddyProvider"),
+    "ai": ("ai.recommender", "AIRecommender"),
+}
+
+_classes: Dict[str, type] = {}
+_lock = threading.Lock()
+
+
+def get_provider_class(name: str) -> type:
+    """Import a provider module on first use and return its class"""
+    cls = _classes.get(name)
+    if cls is None:
+        module_name, class_name = PROVIDERS[name]
+        with _lock:
+            module = importlib.import_module(module_name)
+            cls = _classes[name] = getattr(module, class_name)
+    return cls
+
+
+def get_provider(name: str, *args: Any, **kwargs: Any) -> Any:
+    """Instantiate a provider by registry name"""
+    return get_provider_class(name)(*args, **kwargs)
+
+
+def prewarm(names: Optional[Iterable[str]] = None) -> None:
+    """Import providers and their SDKs ahead of the first request"""
+    for name in names or PROVIDERS:
+        started = time.perf_counter()
+        try:
+            cls = get_provider_class(name)
+            # Providers with a lazily imported SDK expose a hook to load it
+            load_sdk = getattr(cls, "load_sdk", None)
+            if load_sdk:
+                load_sdk()
+            logger.info(f"Prewarmed {name} provider in {(time.perf_counter() - started) * 1000:.0f}ms")
+        except Exception as e:
+            logger.warning(f"Could not prewarm {name} provider: {str(e)}")
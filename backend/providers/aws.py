@@ -1,8 +1,10 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 from config import get_settings
+from scheduler import upstream_call
+from pricing import get_price_list, platform_os
+import asyncio
 import logging
-import boto3
-from botocore.exceptions import ClientError, NoCredentialsError
+import threading
 
 logger = logging.getLogger(__name__)
 
@@ -13,14 +15,10 @@ AWS_REGIONS = [
     "ap-south-1", "ap-southeast-1", "ap-southeast-2", "ap-northeast-1"
 ]
 
-# EC2 instance pricing (approximate monthly cost in USD)
-INSTANCE_PRICING = {
-    "t2.micro": 8.50, "t2.small": 17.00, "t2.medium": 34.00, "t2.large": 68.00,
-    "t3.micro": 7.50, "t3.small": 15.00, "t3.medium": 30.00, "t3.large": 60.00,
-    "m5.large": 70.00, "m5.xlarge": 140.00, "m5.2xlarge": 280.00,
-    "c5.large": 62.00, "c5.xlarge": 124.00,
-    "r5.large": 91.00, "r5.xlarge": 182.00
-}
+# EC2 clients by (region, access key), reused across provider instances and fetches
+_session = None
+_clients: Dict[Tuple[str, str], Any] = {}
+_clients_lock = threading.Lock()
 
 
 class AWSProvider:
@@ -29,24 +27,47 @@ class AWSProvider:
         self.access_key = self.settings.aws_access_key_id
         self.secret_key = self.settings.aws_secret_access_key
 
+    @staticmethod
+    def load_sdk():
+        """Import boto3 (deferred, it is one of the slowest imports)"""
+        import boto3
+        return boto3
+
+    def _describe_instances(self, boto3, region: str) -> Dict[str, Any]:
+        """Blocking describe_instances for one region, meant for a worker thread"""
+        global _session
+        # Sessions aren't thread-safe, so clients are created under a lock; the clients themselves are
+        with _clients_lock:
+            ec2 = _clients.get((region, self.access_key))
+            if ec2 is None:
+                if _session is None:
+                    _session = boto3.session.Session()
+                ec2 = _clients[(region, self.access_key)] = _session.client(
+                    'ec2',
+                    aws_access_key_id=self.access_key,
+                    aws_secret_access_key=self.secret_key,
+                    region_name=region,
+                    endpoint_url=self.settings.aws_endpoint_url or None
+                )
+        return ec2.describe_instances()
+
     async def get_instances(self) -> List[Dict[str, Any]]:
         """Get all EC2 instances across multiple regions"""
         if not self.access_key or not self.secret_key:
             logger.warning("AWS credentials not configured")
             return []
 
+        boto3 = self.load_sdk()
+        from botocore.exceptions import ClientError, NoCredentialsError
+
+        prices = get_price_list()
         all_instances = []
 
         for region in AWS_REGIONS:
             try:
-                ec2 = boto3.client(
-                    'ec2',
-                    aws_access_key_id=self.access_key,
-                    aws_secret_access_key=self.secret_key,
-                    region_name=region
-                )
-
-                response = ec2.describe_instances()
+                # boto3 blocks: run it off the event loop so other requests keep moving
+                async with upstream_call("aws.describe_instances", "aws"):
+                    response = await asyncio.to_thread(self._describe_instances, boto3, region)
 
                 for reservation in response.get('Reservations', []):
                     for instance in reservation.get('Instances', []):
@@ -63,7 +84,10 @@ class AWSProvider:
                                 break
 
                         instance_type = instance.get('InstanceType', 'unknown')
-                        cost_monthly = INSTANCE_PRICING.get(instance_type, 0)
+                        # None when the price list doesn't know the type
+                        cost_monthly = prices.monthly(
+                            instance_type, region, platform_os(instance.get('PlatformDetails'))
+                        )
 
                         all_instances.append({
                             "id": instance['InstanceId'],
@@ -71,7 +95,7 @@ class AWSProvider:
                             "provider": "AWS",
                             "type": "Server",
                             "size": instance_type,
-                            "cost_monthly": float(cost_monthly),
+                            "cost_monthly": cost_monthly,
                             "status": state,
                             "region": region
                         })
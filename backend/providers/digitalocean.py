@@ -1,5 +1,6 @@
 from typing import List, Dict, Any
 from config import get_settings
+from scheduler import upstream_call
 import logging
 import httpx
 
@@ -10,7 +11,7 @@ class DigitalOceanProvider:
     def __init__(self):
         self.settings = get_settings()
         self.token = self.settings.do_token
-        self.api_base = "https://api.digitalocean.com/v2"
+        self.api_base = self.settings.do_api_base
 
     async def get_droplets(self) -> List[Dict[str, Any]]:
         """Get all DigitalOcean droplets"""
@@ -25,12 +26,13 @@ class DigitalOceanProvider:
             }
 
             async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.api_base}/droplets",
-                    headers=headers,
-                    timeout=10.0
-                )
-                response.raise_for_status()
+                async with upstream_call("digitalocean.droplets", "digitalocean"):
+                    response = await client.get(
+                        f"{self.api_base}/droplets",
+                        headers=headers,
+                        timeout=10.0
+                    )
+                    response.raise_for_status()
                 data = response.json()
 
                 droplets = []
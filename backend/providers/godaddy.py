@@ -1,5 +1,6 @@
 from typing import List, Dict, Any
 from config import get_settings
+from scheduler import upstream_call
 import logging
 import httpx
 
@@ -11,7 +12,7 @@ class GoDaddyProvider:
         self.settings = get_settings()
         self.api_key = self.settings.godaddy_api_key
         self.api_secret = self.settings.godaddy_api_secret
-        self.api_base = "https://api.godaddy.com/v1"
+        self.api_base = self.settings.godaddy_api_base
 
     async def get_servers(self) -> List[Dict[str, Any]]:
         """Get all GoDaddy domains and SSL certificates"""
@@ -29,12 +30,13 @@ class GoDaddyProvider:
 
             async with httpx.AsyncClient() as client:
                 # Fetch domains with detailed info
-                response = await client.get(
-                    f"{self.api_base}/domains",
-                    headers=headers,
-                    timeout=10.0
-                )
-                response.raise_for_status()
+                async with upstream_call("godaddy.domains", "godaddy"):
+                    response = await client.get(
+                        f"{self.api_base}/domains",
+                        headers=headers,
+                        timeout=10.0
+                    )
+                    response.raise_for_status()
                 domains = response.json()
 
                 for domain_summary in domains:
@@ -42,12 +44,13 @@ class GoDaddyProvider:
 
                     # Fetch detailed domain info to get expiration
                     try:
-                        detail_response = await client.get(
-                            f"{self.api_base}/domains/{domain_name}",
-                            headers=headers,
-                            timeout=10.0
-                        )
-                        detail_response.raise_for_status()
+                        async with upstream_call("godaddy.domain_detail", "godaddy"):
+                            detail_response = await client.get(
+                                f"{self.api_base}/domains/{domain_name}",
+                                headers=headers,
+                                timeout=10.0
+                            )
+                            detail_response.raise_for_status()
                         domain_detail = detail_response.json()
 
                         servers.append({
@@ -77,12 +80,13 @@ class GoDaddyProvider:
 
                 # Fetch SSL certificates
                 try:
-                    ssl_response = await client.get(
-                        f"{self.api_base}/certificates",
-                        headers=headers,
-                        timeout=10.0
-                    )
-                    ssl_response.raise_for_status()
+                    async with upstream_call("godaddy.certificates", "godaddy"):
+                        ssl_response = await client.get(
+                            f"{self.api_base}/certificates",
+                            headers=headers,
+                            timeout=10.0
+                        )
+                        ssl_response.raise_for_status()
                     certificates = ssl_response.json()
 
                     for cert in certificates:
@@ -1,119 +1,406 @@
-import msal
 import httpx
 from typing import List, Optional, Dict, Any
-from datetime import datetime
+from datetime import datetime, timezone
 from config import get_settings
+from metrics import span
+from scheduler import upstream_call
+import asyncio
+import csv
+import io
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
+USER_SELECT = "id,displayName,mail,userPrincipalName,accountEnabled,department,assignedLicenses"
+
+# Needs AuditLog.Read.All and Entra ID P1; without them Graph rejects the whole listing with 403
+SIGN_IN_SELECT = "signInActivity"
+
+# Managers come back inside each user page, so they cost no extra requests
+MANAGER_EXPAND = "manager($select=id,displayName,mail,userPrincipalName)"
+
+# Per-user last activity across Microsoft 365 workloads (Reports.Read.All), one CSV download
+ACTIVITY_REPORT = "reports/getOffice365ActiveUserDetail(period='D180')"
+
+# Where last sign-in times come from, see Settings.graph_sign_in_source
+SIGN_IN_SOURCES = ("auto", "select", "report", "none")
+
+# Times a throttled (429) page is asked for again, after the scheduler's Retry-After pause
+MAX_THROTTLE_RETRIES = 3
+
+
+def _parse_graph_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")) if value else None
+
+
+def _graph_datetime(value: datetime) -> str:
+    """Format an aware datetime the way Graph expects"""
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.0000000Z")
+
 
 class MicrosoftGraphProvider:
-    def __init__(self):
+    def __init__(
+        self,
+        tenant_id: Optional[str] = None,
+        client_id: Optional[str] = None,
+        client_secret: Optional[str] = None
+    ):
         self.settings = get_settings()
-        self.authority = f"https://login.microsoftonline.com/{self.settings.microsoft_tenant_id}"
+        # Credentials default to the single tenant configured in settings
+        self.tenant_id = tenant_id or self.settings.microsoft_tenant_id
+        self.client_id = client_id or self.settings.microsoft_client_id
+        self.client_secret = client_secret or self.settings.microsoft_client_secret
+        self.authority = f"https://login.microsoftonline.com/{self.tenant_id}"
         self.scope = ["https://graph.microsoft.com/.default"]
-        self.graph_endpoint = "https://graph.microsoft.com/v1.0"
+        self.graph_endpoint = self.settings.graph_api_base
+
+        # One MSAL app (and so one token cache) and one connection pool per instance
+        self._msal_app = None
+        self._msal_lock = threading.Lock()
+        self._http: Optional[httpx.AsyncClient] = None
+
+        # "auto" settles on "select" or falls back to "report" on the first listing
+        self.sign_in_source = self.settings.graph_sign_in_source
+        if self.sign_in_source not in SIGN_IN_SOURCES:
+            raise ValueError(f"Invalid GRAPH_SIGN_IN_SOURCE: {self.sign_in_source}")
 
         # Debug logging
         logger.info(f"Initializing Microsoft Graph Provider")
-        logger.info(f"Tenant ID from settings: {self.settings.microsoft_tenant_id}")
-        logger.info(f"Client ID from settings: {self.settings.microsoft_client_id}")
+        logger.info(f"Tenant ID: {self.tenant_id}")
+        logger.info(f"Client ID: {self.client_id}")
         logger.info(f"Authority URL: {self.authority}")
 
+    @staticmethod
+    def load_sdk():
+        """Import msal (deferred to keep app startup fast)"""
+        import msal
+        return msal
+
     def _get_access_token(self) -> str:
         """Get access token for Microsoft Graph API"""
-        app = msal.ConfidentialClientApplication(
-            self.settings.microsoft_client_id,
-            authority=self.authority,
-            client_credential=self.settings.microsoft_client_secret,
-        )
-
-        result = app.acquire_token_silent(self.scope, account=None)
-        if not result:
-            result = app.acquire_token_for_client(scopes=self.scope)
+        msal = self.load_sdk()
+        # MSAL reports failures in the result rather than raising; raise inside the span so it counts as an error.
+        # Building the app discovers the authority over the network, so it is timed and counted too
+        with span("graph.token", upstream="microsoft"):
+            with self._msal_lock:
+                if self._msal_app is None:
+                    self._msal_app = msal.ConfidentialClientApplication(
+                        self.client_id,
+                        authority=self.authority,
+                        client_credential=self.client_secret,
+                    )
+
+            result = self._msal_app.acquire_token_silent(self.scope, account=None)
+            if not result:
+                result = self._msal_app.acquire_token_for_client(scopes=self.scope)
+
+            if "access_token" not in result:
+                raise Exception(f"Failed to acquire token: {result.get('error_description', 'Unknown error')}")
+        return result["access_token"]
+
+    async def _access_token(self) -> str:
+        # MSAL is synchronous; a token refresh must not stall the event loop
+        return await asyncio.to_thread(self._get_access_token)
+
+    def _client(self) -> httpx.AsyncClient:
+        """Pooled HTTP client, reused across calls to keep connections warm"""
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.settings.graph_max_connections)
+            )
+        return self._http
 
-        if "access_token" in result:
-            return result["access_token"]
-        else:
-            raise Exception(f"Failed to acquire token: {result.get('error_description', 'Unknown error')}")
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
 
     async def get_domains(self) -> List[Dict[str, Any]]:
         """Fetch verified domains from Microsoft 365"""
-        token = self._get_access_token()
+        token = await self._access_token()
         headers = {"Authorization": f"Bearer {token}"}
 
-        async with httpx.AsyncClient() as client:
+        client = self._client()
+        async with upstream_call("graph.domains", "microsoft"):
             response = await client.get(
                 f"{self.graph_endpoint}/domains",
                 headers=headers
             )
             response.raise_for_status()
-            data = response.json()
+        data = response.json()
+
+        domains = []
+        for domain in data.get("value", []):
+            domains.append({
+                "id": domain.get("id"),
+                "name": domain.get("id"),
+                "is_verified": domain.get("isVerified", False)
+            })
 
-            domains = []
-            for domain in data.get("value", []):
-                domains.append({
-                    "id": domain.get("id"),
-                    "name": domain.get("id"),
-                    "is_verified": domain.get("isVerified", False)
-                })
+        return [d for d in domains if d["is_verified"]]
+
+    async def get_subscribed_skus(self) -> List[Dict[str, Any]]:
+        """License SKUs the tenant has bought, with purchased and consumed seats"""
+        token = await self._access_token()
+        headers = {"Authorization": f"Bearer {token}"}
+
+        client = self._client()
+        async with upstream_call("graph.subscribed_skus", "microsoft"):
+            response = await client.get(
+                f"{self.graph_endpoint}/subscribedSkus",
+                headers=headers
+            )
+            response.raise_for_status()
+        data = response.json()
+
+        return [
+            {
+                "sku_id": sku.get("skuId"),
+                "part_number": sku.get("skuPartNumber"),
+                "status": sku.get("capabilityStatus"),
+                # Seats in a warning (grace) state are still billed
+                "purchased": (sku.get("prepaidUnits") or {}).get("enabled", 0)
+                + (sku.get("prepaidUnits") or {}).get("warning", 0),
+                "consumed": sku.get("consumedUnits", 0),
+            }
+            for sku in data.get("value", [])
+            if sku.get("appliesTo", "User") == "User"
+        ]
 
-            return [d for d in domains if d["is_verified"]]
+    def _user_query(self) -> str:
+        select = USER_SELECT
+        if self.sign_in_source in ("auto", "select"):
+            select += f",{SIGN_IN_SELECT}"
+        return f"$select={select}&$expand={MANAGER_EXPAND}"
 
     async def get_users(self, domain: Optional[str] = None) -> List[Dict[str, Any]]:
-        """List all O365 users, optionally filtered by domain"""
-        token = self._get_access_token()
+        """List all O365 users, optionally filtered by domain
+
+        Sign-in activity and managers are read in the same paged listing. If
+        the tenant can't select signInActivity, the listing is restarted
+        without it (the 403 comes on the first page) and last sign-ins are
+        taken from the activity report, downloaded alongside the listing.
+        """
+        token = await self._access_token()
         headers = {"Authorization": f"Bearer {token}"}
 
-        # Request user properties (excluding signInActivity as it requires AuditLog.Read.All permission)
-        select_params = "id,displayName,mail,userPrincipalName,accountEnabled,department,assignedLicenses"
-        url = f"{self.graph_endpoint}/users?$select={select_params}"
+        report = None
+        if self.sign_in_source == "report":
+            report = asyncio.create_task(self._activity_report(headers))
+        try:
+            try:
+                pages = await self._list_users(headers)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code != 403 or self.sign_in_source != "auto":
+                    raise
+                logger.warning(
+                    "Graph refused signInActivity (needs AuditLog.Read.All and Entra ID P1); "
+                    "using the Microsoft 365 activity report for last sign-ins"
+                )
+                self.sign_in_source = "report"
+                report = asyncio.create_task(self._activity_report(headers))
+                pages = await self._list_users(headers)
+        except BaseException:
+            if report is not None:
+                report.cancel()
+            raise
+        if self.sign_in_source == "auto":
+            self.sign_in_source = "select"
+
+        last_activity = await report if report is not None else {}
+        users = []
+        for user in pages:
+            principal = user.get("userPrincipalName")
+            user = self._to_user(user)
+
+            # Filter by domain if specified
+            if domain and user["domain"] != domain:
+                continue
+
+            if user["last_sign_in"] is None and principal:
+                user["last_sign_in"] = last_activity.get(principal.lower())
+            users.append(user)
+
+        return users
+
+    async def _list_users(self, headers: Dict[str, str]) -> List[Dict[str, Any]]:
+        """Every Graph user resource, one page at a time"""
+        url = f"{self.graph_endpoint}/users?{self._user_query()}"
 
         users = []
-        async with httpx.AsyncClient() as client:
-            while url:
-                response = await client.get(url, headers=headers)
-                response.raise_for_status()
-                data = response.json()
-
-                for user in data.get("value", []):
-                    email = user.get("mail") or user.get("userPrincipalName")
-                    user_domain = email.split("@")[1] if email and "@" in email else ""
-
-                    # Filter by domain if specified
-                    if domain and user_domain != domain:
-                        continue
-
-                    # Extract last sign-in time
-                    last_sign_in = None
-                    sign_in_activity = user.get("signInActivity", {})
-                    if sign_in_activity:
-                        last_sign_in_str = sign_in_activity.get("lastSignInDateTime")
-                        if last_sign_in_str:
-                            last_sign_in = datetime.fromisoformat(last_sign_in_str.replace("Z", "+00:00"))
-
-                    # Determine license type
-                    licenses = user.get("assignedLicenses", [])
-                    license_type = "Business Standard" if len(licenses) > 0 else None
-
-                    users.append({
-                        "id": user.get("id"),
-                        "email": email,
-                        "display_name": user.get("displayName"),
-                        "domain": user_domain,
-                        "last_sign_in": last_sign_in,
-                        "account_enabled": user.get("accountEnabled", False),
-                        "license_type": license_type,
-                        "department": user.get("department"),
-                        "manager": None  # Would require additional API call
-                    })
-
-                # Handle pagination
-                url = data.get("@odata.nextLink")
+        client = self._client()
+        throttled = 0
+        while url:
+            try:
+                async with upstream_call("graph.users_page", "microsoft"):
+                    response = await client.get(url, headers=headers)
+                    response.raise_for_status()
+                    data = response.json()
+            except httpx.HTTPStatusError as e:
+                # One throttled page shouldn't discard the pages already read
+                if e.response.status_code != 429 or throttled >= MAX_THROTTLE_RETRIES:
+                    raise
+                throttled += 1
+                continue
+            throttled = 0
+
+            users.extend(data.get("value", []))
+
+            # Handle pagination
+            url = data.get("@odata.nextLink")
 
         return users
 
+    async def _activity_report(self, headers: Dict[str, str]) -> Dict[str, datetime]:
+        """Last activity date by lowercased user principal name
+
+        Activity (mail, files, Teams) is the closest stand-in for sign-ins
+        without AuditLog.Read.All. Best effort: on failure users simply keep
+        no last sign-in. Tenants that conceal user details in reports get
+        hashed names, which match nobody.
+        """
+        client = self._client()
+        try:
+            async with upstream_call("graph.activity_report", "microsoft"):
+                # Graph answers with a redirect to a pre-authenticated CSV download
+                response = await client.get(
+                    f"{self.graph_endpoint}/{ACTIVITY_REPORT}",
+                    headers=headers,
+                    follow_redirects=True
+                )
+                response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 403:
+                logger.warning("Graph refused the activity report (needs Reports.Read.All); last sign-ins are unknown")
+                self.sign_in_source = "none"
+            else:
+                logger.error(f"Could not fetch the activity report: {str(e)}")
+            return {}
+        except httpx.HTTPError as e:
+            logger.error(f"Could not fetch the activity report: {str(e)}")
+            return {}
+
+        last_activity = {}
+        for row in csv.DictReader(io.StringIO(response.text.lstrip("\ufeff"))):
+            principal = row.get("User Principal Name")
+            date = row.get("Last Activity Date")
+            if principal and date:
+                last_activity[principal.lower()] = datetime.fromisoformat(date).replace(tzinfo=timezone.utc)
+        return last_activity
+
+    async def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch a single user, or None if it no longer exists"""
+        token = await self._access_token()
+        headers = {"Authorization": f"Bearer {token}"}
+
+        client = self._client()
+        async with upstream_call("graph.user", "microsoft"):
+            response = await client.get(
+                f"{self.graph_endpoint}/users/{user_id}?{self._user_query()}",
+                headers=headers
+            )
+            if response.status_code == 404:
+                return None
+            response.raise_for_status()
+
+        return self._to_user(response.json())
+
+    @staticmethod
+    def _to_user(user: Dict[str, Any]) -> Dict[str, Any]:
+        """Convert a Graph user resource to the JARVIS user shape"""
+        email = user.get("mail") or user.get("userPrincipalName")
+        user_domain = email.split("@")[1] if email and "@" in email else ""
+
+        # Latest interactive or non-interactive sign-in: a mail client
+        # silently refreshing its token is still someone using the account
+        sign_in_activity = user.get("signInActivity") or {}
+        sign_ins = [
+            _parse_graph_datetime(sign_in_activity.get(name))
+            for name in ("lastSignInDateTime", "lastNonInteractiveSignInDateTime")
+        ]
+        last_sign_in = max((value for value in sign_ins if value), default=None)
+
+        manager = user.get("manager") or {}
+
+        # SKU ids; names and prices are resolved against the tenant's catalog
+        licenses = sorted(
+            license["skuId"] for license in user.get("assignedLicenses") or [] if license.get("skuId")
+        )
+
+        return {
+            "id": user.get("id"),
+            "email": email,
+            "display_name": user.get("displayName"),
+            "domain": user_domain,
+            "last_sign_in": last_sign_in,
+            "account_enabled": user.get("accountEnabled", False),
+            "licenses": licenses,
+            "license_type": None,
+            "department": user.get("department"),
+            "manager": manager.get("displayName") or manager.get("mail") or manager.get("userPrincipalName")
+        }
+
+    async def create_subscription(
+        self,
+        resource: str,
+        change_type: str,
+        notification_url: str,
+        client_state: str,
+        expires_at: datetime
+    ) -> Dict[str, Any]:
+        """Subscribe to change notifications for a Graph resource"""
+        token = await self._access_token()
+        headers = {"Authorization": f"Bearer {token}"}
+
+        client = self._client()
+        async with upstream_call("graph.create_subscription", "microsoft"):
+            response = await client.post(
+                f"{self.graph_endpoint}/subscriptions",
+                headers=headers,
+                json={
+                    "changeType": change_type,
+                    "notificationUrl": notification_url,
+                    "resource": resource,
+                    "expirationDateTime": _graph_datetime(expires_at),
+                    "clientState": client_state
+                },
+                timeout=30.0  # Graph validates the notification URL before answering
+            )
+            response.raise_for_status()
+            return response.json()
+
+    async def renew_subscription(self, subscription_id: str, expires_at: datetime) -> Optional[Dict[str, Any]]:
+        """Extend a subscription, or return None if Graph no longer knows it"""
+        token = await self._access_token()
+        headers = {"Authorization": f"Bearer {token}"}
+
+        client = self._client()
+        async with upstream_call("graph.renew_subscription", "microsoft"):
+            response = await client.patch(
+                f"{self.graph_endpoint}/subscriptions/{subscription_id}",
+                headers=headers,
+                json={"expirationDateTime": _graph_datetime(expires_at)}
+            )
+            if response.status_code == 404:
+                return None
+            response.raise_for_status()
+            return response.json()
+
+    async def delete_subscription(self, subscription_id: str) -> None:
+        """Delete a subscription; one Graph no longer knows counts as deleted"""
+        token = await self._access_token()
+        headers = {"Authorization": f"Bearer {token}"}
+
+        client = self._client()
+        async with upstream_call("graph.delete_subscription", "microsoft"):
+            response = await client.delete(
+                f"{self.graph_endpoint}/subscriptions/{subscription_id}",
+                headers=headers
+            )
+            if response.status_code != 404:
+                response.raise_for_status()
+
     async def create_user(
         self,
         full_name: str,
@@ -123,7 +410,7 @@ class MicrosoftGraphProvider:
         license_type: str = "Business Basic"
     ) -> Dict[str, Any]:
         """Create a new O365 user"""
-        token = self._get_access_token()
+        token = await self._access_token()
         headers = {
             "Authorization": f"Bearer {token}",
             "Content-Type": "application/json"
@@ -152,88 +439,94 @@ class MicrosoftGraphProvider:
         if department:
             user_data["department"] = department
 
-        async with httpx.AsyncClient() as client:
+        client = self._client()
+        async with upstream_call("graph.create_user", "microsoft"):
             response = await client.post(
                 f"{self.graph_endpoint}/users",
                 headers=headers,
                 json=user_data
             )
             response.raise_for_status()
-            created_user = response.json()
-
-            # TODO: Assign license based on license_type
-            # This would require additional API call to /users/{id}/assignLicense
-
-            return {
-                "id": created_user.get("id"),
-                "email": created_user.get("userPrincipalName"),
-                "display_name": created_user.get("displayName"),
-                "domain": domain,
-                "last_sign_in": None,
-                "account_enabled": True,
-                "license_type": license_type,
-                "department": department,
-                "manager": None
-            }
+        created_user = response.json()
+
+        # TODO: Assign license based on license_type
+        # This would require additional API call to /users/{id}/assignLicense
+
+        return {
+            "id": created_user.get("id"),
+            "email": created_user.get("userPrincipalName"),
+            "display_name": created_user.get("displayName"),
+            "domain": domain,
+            "last_sign_in": None,
+            "account_enabled": True,
+            # What Graph granted, as _to_user would report it: no license is assigned yet,
+            # and a requested name would otherwise be priced as if it were
+            "licenses": [],
+            "license_type": None,
+            "department": department,
+            "manager": None
+        }
 
     async def disable_user(self, user_id: str) -> bool:
         """Disable a user account and release license"""
-        token = self._get_access_token()
+        token = await self._access_token()
         headers = {
             "Authorization": f"Bearer {token}",
             "Content-Type": "application/json"
         }
 
-        async with httpx.AsyncClient() as client:
-            try:
-                # Disable the account
+        client = self._client()
+        try:
+            # Disable the account
+            async with upstream_call("graph.disable_user", "microsoft"):
                 response = await client.patch(
                     f"{self.graph_endpoint}/users/{user_id}",
                     headers=headers,
                     json={"accountEnabled": False}
                 )
                 response.raise_for_status()
-                logger.info(f"Successfully disabled user {user_id}")
+            logger.info(f"Successfully disabled user {user_id}")
 
-                # TODO: Remove licenses
-                # This would require additional API call to /users/{id}/assignLicense
+            # TODO: Remove licenses
+            # This would require additional API call to /users/{id}/assignLicense
 
-                return True
-            except httpx.HTTPStatusError as e:
-                error_detail = ""
-                try:
-                    error_json = e.response.json()
-                    error_detail = error_json.get("error", {}).get("message", str(e))
-                except:
-                    error_detail = str(e)
+            return True
+        except httpx.HTTPStatusError as e:
+            error_detail = ""
+            try:
+                error_json = e.response.json()
+                error_detail = error_json.get("error", {}).get("message", str(e))
+            except:
+                error_detail = str(e)
 
-                logger.error(f"Failed to disable user {user_id}: {error_detail}")
-                raise Exception(f"Microsoft Graph API error: {error_detail}")
+            logger.error(f"Failed to disable user {user_id}: {error_detail}")
+            raise Exception(f"Microsoft Graph API error: {error_detail}")
 
     async def delete_user(self, user_id: str) -> bool:
         """Permanently delete a user"""
-        token = self._get_access_token()
+        token = await self._access_token()
         headers = {"Authorization": f"Bearer {token}"}
 
-        async with httpx.AsyncClient() as client:
-            try:
+        client = self._client()
+        try:
+            async with upstream_call("graph.delete_user", "microsoft"):
                 response = await client.delete(
                     f"{self.graph_endpoint}/users/{user_id}",
                     headers=headers
                 )
                 response.raise_for_status()
-                logger.info(f"Successfully deleted user {user_id}")
-                return True
-            except httpx.HTTPStatusError as e:
-                error_detail = ""
-                try:
-                    error_json = e.response.json()
-                    error_detail = error_json.get("error", {}).get("message", str(e))
-                except:
-                    error_detail = str(e)
-
-                logger.error(f"Failed to delete user {user_id}: {error_detail}")
-                raise Exception(f"Microsoft Graph API error: {error_detail}")
+            logger.info(f"Successfully deleted user {user_id}")
+            return True
+        except httpx.HTTPStatusError as e:
+            error_detail = ""
+            try:
+                error_json = e.response.json()
+                error_detail = error_json.get("error", {}).get("message", str(e))
+            except:
+                error_detail = str(e)
+
+            logger.error(f"Failed to delete user {user_id}: {error_detail}")
+            raise Exception(f"Microsoft Graph API error: {error_detail}")
 
     def _generate_temp_password(self) -> str:
         """Generate a temporary password for new users"""
@@ -0,0 +1,200 @@
+"""Field projection and pre-compressed JSON responses for cached payloads"""
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from cache import cache
+from config import get_settings
+from metrics import span
+import asyncio
+import gzip
+import json
+
+try:
+    import brotli
+except ImportError:  # Optional: install `brotli` to serve br-encoded responses
+    brotli = None
+
+# Encodings in server preference order
+ENCODINGS = ("br", "gzip") if brotli else ("gzip",)
+
+# Encoded payloads kept per cache entry; filter, fields and encoding
+# combinations past this (or past PAYLOAD_CACHE_MAX_BYTES) evict the least
+# recently served
+MAX_PAYLOAD_VARIANTS = 32
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[Tuple[str, ...]]:
+    """Parse a comma-separated `fields=` parameter into a normalized tuple"""
+    if not fields:
+        return None
+    requested = tuple(sorted({name.strip() for name in fields.split(",") if name.strip()}))
+    unknown = set(requested) - set(allowed)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return requested or None
+
+
+def project(payload: Dict[str, Any], items_key: str, fields: Optional[Tuple[str, ...]]) -> Dict[str, Any]:
+    """Trim every record under `items_key` down to the requested fields"""
+    if not fields:
+        return payload
+    return {
+        **payload,
+        items_key: [{name: item.get(name) for name in fields} for item in payload[items_key]]
+    }
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the preferred supported encoding from an Accept-Encoding header"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if token:
+            accepted[token.strip().lower()] = quality
+
+    for encoding in ENCODINGS:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+def _encode(payload: Dict[str, Any]) -> bytes:
+    with span("response.encode"):
+        return json.dumps(payload, separators=(",", ":")).encode()
+
+
+def json_response(request: Request, payload: Dict[str, Any]) -> Response:
+    """Encode and, if the client accepts it, compress an uncached payload"""
+    body = _encode(payload)
+    headers = {"Vary": "Accept-Encoding"}
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    if encoding and len(body) >= get_settings().compression_min_bytes:
+        with span(f"response.{encoding}"):
+            body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# (Content-Encoding or None, body) as sent to the client
+Payload = Tuple[Optional[str], bytes]
+
+# Payloads being built, by (payloads dict, name), so concurrent misses share one build
+_building: Dict[Tuple[int, str], "asyncio.Future[Payload]"] = {}
+
+
+def _payloads(cache_key: str) -> "OrderedDict[str, Payload]":
+    """Encoded payloads attached to a cache entry, least recently served first"""
+    payloads = cache.get_variant(cache_key, "payloads")
+    if payloads is None:
+        payloads = OrderedDict()
+        # No-op if the entry is gone: the payloads are then built for this response only
+        cache.set_variant(cache_key, "payloads", payloads)
+    return payloads
+
+
+def _lookup(payloads: "OrderedDict[str, Payload]", name: str) -> Optional[Payload]:
+    payload = payloads.get(name)
+    if payload is not None:
+        payloads.move_to_end(name)
+    return payload
+
+
+def _store(payloads: "OrderedDict[str, Payload]", name: str, payload: Payload) -> None:
+    """Keep `payload`, evicting the least recently served past the count or byte limit"""
+    max_bytes = get_settings().payload_cache_max_bytes
+    if len(payload[1]) > max_bytes:
+        return
+    payloads[name] = payload
+    total = sum(len(body) for _, body in payloads.values())
+    while len(payloads) > MAX_PAYLOAD_VARIANTS or total > max_bytes:
+        _, (_, body) = payloads.popitem(last=False)
+        total -= len(body)
+
+
+def _render(
+    payloads: "OrderedDict[str, Payload]",
+    prefix: str,
+    build: Callable[[Optional[Tuple[str, ...]]], Dict[str, Any]],
+    fields: Optional[Tuple[str, ...]],
+    encoding: Optional[str]
+) -> Payload:
+    """Build, encode and compress one variant (runs in a worker thread)"""
+    identity = payloads.get(f"{prefix}|identity")
+    body = identity[1] if identity is not None else _encode(build(fields))
+    if encoding and len(body) >= get_settings().compression_min_bytes:
+        with span(f"response.{encoding}"):
+            return encoding, compress(body, encoding)
+    return None, body
+
+
+async def cached_json_response(
+    request: Request,
+    cache_key: str,
+    build: Callable[[Optional[Tuple[str, ...]]], Dict[str, Any]],
+    fields: Optional[Tuple[str, ...]] = None,
+    variant: str = ""
+) -> Response:
+    """Serve a cached payload, encoding and compressing each variant only once
+
+    `build(fields)` produces the projected payload on a variant miss; it runs
+    in a worker thread with the encoding and compression, so a large miss
+    doesn't stall the event loop. Encoded variants are attached to the cache
+    entry under `cache_key`, so they expire and are invalidated together with
+    the raw data. At most MAX_PAYLOAD_VARIANTS of them, and
+    PAYLOAD_CACHE_MAX_BYTES in total, are kept. A compressed variant is kept
+    without its uncompressed body unless a client asked for that too.
+    """
+    prefix = f"{variant}|{','.join(fields) if fields else '*'}"
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    name = f"{prefix}|{encoding or 'identity'}"
+    payloads = _payloads(cache_key)
+
+    payload = _lookup(payloads, name)
+    if payload is None:
+        building = _building.get((id(payloads), name))
+        if building is None:
+            building = asyncio.ensure_future(asyncio.to_thread(_render, payloads, prefix, build, fields, encoding))
+            _building[(id(payloads), name)] = building
+
+            def finished(task: asyncio.Future) -> None:
+                del _building[(id(payloads), name)]
+                if not task.cancelled() and task.exception() is None:
+                    _store(payloads, name, task.result())
+
+            building.add_done_callback(finished)
+        # Shielded: a client that goes away doesn't cancel a build others are waiting on
+        payload = await asyncio.shield(building)
+
+    content_encoding, body = payload
+    headers = {"Vary": "Accept-Encoding"}
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+class RequestStreamingResponse(StreamingResponse):
+    """Streaming response for handlers that are still reading the request body
+
+    StreamingResponse listens for client disconnects on `receive` while it
+    streams, which swallows request body messages the handler is waiting for.
+    This variant only sends; a client that goes away mid-stream doesn't stop
+    the work, it just stops receiving results.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
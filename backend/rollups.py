@@ -0,0 +1,162 @@
+"""Columnar server inventory and grouped cost and utilization rollups
+
+The inventory is converted once per cache fill into dictionary-encoded
+columns: an integer code per server for each dimension, plus cost and
+running flags as flat arrays. A rollup packs the codes of the requested
+dimensions into one group key per server and sums every measure per key in
+a single pass; with NumPy (imported with the first inventory, not at
+startup) each of those passes is a `bincount`, so tens of thousands of
+servers aggregate in milliseconds.
+"""
+from array import array
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+import math
+
+ROLLUP_DIMENSIONS = ("provider", "region", "size", "status", "type")
+
+# Statuses in which a server is doing (and billing for) work
+RUNNING_STATUSES = frozenset({"active", "running"})
+
+UNKNOWN = "unknown"
+
+# Dense group keys up to this many combinations; sparser ones are compacted first
+DENSE_GROUPS = 1 << 20
+
+
+class RollupError(ValueError):
+    """Unknown rollup dimension"""
+
+
+def load_numpy():
+    """Import numpy (deferred to keep app startup fast); None if not installed"""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class InventoryColumns:
+    def __init__(self, servers: Sequence[Dict[str, Any]], dimensions: Sequence[str] = ROLLUP_DIMENSIONS):
+        self.size = len(servers)
+        self.categories: Dict[str, List[str]] = {}
+        self.codes: Dict[str, Any] = {}
+        for name in dimensions:
+            index: Dict[str, int] = {}
+            codes = array("q", (index.setdefault(server.get(name) or UNKNOWN, len(index)) for server in servers))
+            self.categories[name] = list(index)
+            self.codes[name] = codes
+
+        costs = [server.get("cost_monthly") for server in servers]
+        self.cost = array("d", (cost or 0.0 for cost in costs))
+        self.unpriced = array("d", (1.0 if cost is None else 0.0 for cost in costs))
+        self.running = array("d", (
+            1.0 if str(server.get("status") or "").lower() in RUNNING_STATUSES else 0.0 for server in servers
+        ))
+
+        # Without numpy, rollups fall back to a pure-Python pass over the arrays
+        self.numpy = numpy = load_numpy()
+        if numpy is not None:
+            # Zero-copy views over the arrays' buffers
+            self.codes = {name: numpy.frombuffer(codes, dtype=numpy.int64) for name, codes in self.codes.items()}
+            self.cost = numpy.frombuffer(self.cost)
+            self.unpriced = numpy.frombuffer(self.unpriced)
+            self.running = numpy.frombuffer(self.running)
+
+    def total_cost(self) -> float:
+        return float(self.cost.sum()) if self.numpy is not None else math.fsum(self.cost)
+
+    def rollup(self, dimensions: Sequence[str]) -> List[Dict[str, Any]]:
+        """One row per combination of `dimensions` present, most expensive first"""
+        for name in dimensions:
+            if name not in self.categories:
+                raise RollupError(
+                    f"Unknown rollup dimension: {name} (expected any of {', '.join(self.categories)})"
+                )
+        radices = [len(self.categories[name]) for name in dimensions]
+        if self.numpy is not None:
+            keys, sums = self._sums_vectorized(dimensions, radices)
+        else:
+            keys, sums = self._sums(dimensions, radices)
+
+        rows = []
+        for key, (count, cost, idle_cost, running, unpriced) in zip(keys, sums):
+            row = dict(zip(dimensions, self._decode(int(key), dimensions, radices)))
+            count = int(count)
+            row.update({
+                "count": count,
+                "running": int(running),
+                "utilization": round(running / count, 4),
+                "monthly_cost": round(cost, 2),
+                "idle_monthly_cost": round(idle_cost, 2),
+                "unpriced": int(unpriced),
+            })
+            rows.append(row)
+        rows.sort(key=lambda row: (-row["monthly_cost"], -row["count"]))
+        return rows
+
+    def _group_keys(self, dimensions: Sequence[str], radices: Sequence[int]):
+        """Mixed-radix key per server: codes of the first dimension vary slowest"""
+        numpy = self.numpy
+        keys = numpy.zeros(self.size, dtype=numpy.int64)
+        for name, radix in zip(dimensions, radices):
+            keys = keys * radix + self.codes[name]
+        return keys
+
+    def _sums_vectorized(self, dimensions: Sequence[str], radices: Sequence[int]) -> Tuple[Iterable, Iterable]:
+        """Group keys present and (count, cost, idle cost, running, unpriced) for each"""
+        numpy = self.numpy
+        keys = self._group_keys(dimensions, radices)
+        groups = math.prod(radices)
+        if groups > DENSE_GROUPS:
+            # Many dimensions multiply out to more combinations than servers:
+            # bin over the combinations actually present instead
+            present, keys = numpy.unique(keys, return_inverse=True)
+            groups = len(present)
+        else:
+            present = None
+
+        counts = numpy.bincount(keys, minlength=groups)
+        cost = numpy.bincount(keys, weights=self.cost, minlength=groups)
+        idle_cost = numpy.bincount(keys, weights=self.cost * (1.0 - self.running), minlength=groups)
+        running = numpy.bincount(keys, weights=self.running, minlength=groups)
+        unpriced = numpy.bincount(keys, weights=self.unpriced, minlength=groups)
+
+        nonzero = numpy.flatnonzero(counts)
+        group_keys = present[nonzero] if present is not None else nonzero
+        sums = zip(
+            counts[nonzero].tolist(),
+            cost[nonzero].tolist(),
+            idle_cost[nonzero].tolist(),
+            running[nonzero].tolist(),
+            unpriced[nonzero].tolist(),
+        )
+        return group_keys.tolist(), sums
+
+    def _sums(self, dimensions: Sequence[str], radices: Sequence[int]) -> Tuple[Iterable, Iterable]:
+        groups: Dict[int, List[float]] = {}
+        columns = [self.codes[name] for name in dimensions]
+        # No dimensions: every server falls in the one group
+        rows = zip(*columns) if columns else ((),) * self.size
+        for position, codes in enumerate(rows):
+            key = 0
+            for code, radix in zip(codes, radices):
+                key = key * radix + code
+            entry = groups.get(key)
+            if entry is None:
+                entry = groups[key] = [0, 0.0, 0.0, 0.0, 0.0]
+            cost = self.cost[position]
+            running = self.running[position]
+            entry[0] += 1
+            entry[1] += cost
+            entry[2] += cost * (1.0 - running)
+            entry[3] += running
+            entry[4] += self.unpriced[position]
+        return list(groups), [tuple(entry) for entry in groups.values()]
+
+    def _decode(self, key: int, dimensions: Sequence[str], radices: Sequence[int]) -> List[str]:
+        values = []
+        for name, radix in zip(reversed(dimensions), reversed(radices)):
+            key, code = divmod(key, radix)
+            values.append(self.categories[name][code])
+        return values[::-1]
@@ -0,0 +1,247 @@
+"""Priority-aware scheduling of upstream provider calls
+
+Every provider call takes a slot from its upstream's concurrency budget.
+Interactive calls (the default for request handlers) always go first, and
+part of each budget is reserved for them, so background work (jobs, change
+notifications, bulk onboarding) can never starve a click or a page load.
+Queues are bounded, and background calls that wait past their deadline are
+shed with UpstreamBusyError instead of piling up. An upstream that answers
+429 (or 503 with Retry-After) is paused for the time it asks for: calls
+started meanwhile wait before taking a slot instead of adding to the load.
+"""
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, Optional, Tuple
+from config import get_settings
+from metrics import registry, record_span, span
+import asyncio
+import time
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+# Budget for upstreams missing from UPSTREAM_BUDGETS
+DEFAULT_BUDGET = 8
+
+# Pause after a 429 without Retry-After, and the longest pause honoured
+DEFAULT_RETRY_AFTER = 1.0
+MAX_RETRY_AFTER = 120.0
+
+# (priority, max queue wait in seconds or None for no deadline)
+_priority: ContextVar[Tuple[str, Optional[float]]] = ContextVar("upstream_priority", default=(INTERACTIVE, None))
+
+scheduler_wait = registry.histogram(
+    "jarvis_scheduler_wait_seconds", "Time upstream calls spent queued for a slot"
+)
+scheduler_shed = registry.counter(
+    "jarvis_scheduler_shed_total", "Upstream calls rejected by the scheduler"
+)
+scheduler_throttled = registry.counter(
+    "jarvis_scheduler_throttled_total", "Upstream answers asking to back off (429, or 503 with Retry-After)"
+)
+
+
+class UpstreamBusyError(Exception):
+    """An upstream call was shed: its queue was full or its deadline passed"""
+
+
+def retry_after(response: Any) -> Optional[float]:
+    """Seconds an upstream response asks callers to back off, or None"""
+    status = getattr(response, "status_code", None)
+    if status not in (429, 503):
+        return None
+    value = (getattr(response, "headers", None) or {}).get("retry-after")
+    if value is None:
+        return DEFAULT_RETRY_AFTER if status == 429 else None
+    try:
+        seconds = float(value)
+    except ValueError:
+        # HTTP-date form
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return DEFAULT_RETRY_AFTER
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+_DEFAULT_WAIT = object()
+
+
+@contextmanager
+def priority(level: str, max_wait: Any = _DEFAULT_WAIT) -> Iterator[None]:
+    """Run upstream calls made in this block at the given priority
+
+    Background calls give up after `max_wait` seconds in the queue (default
+    SCHEDULER_BACKGROUND_MAX_WAIT); pass None for work that should wait
+    however long it takes.
+    """
+    if max_wait is _DEFAULT_WAIT:
+        max_wait = get_settings().scheduler_background_max_wait if level == BACKGROUND else None
+    token = _priority.set((level, max_wait))
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class _Upstream:
+    """Slots and wait queues for one upstream"""
+
+    def __init__(self, name: str, budget: int, reserved: int, queue_size: int):
+        self.name = name
+        self.budget = budget
+        # Slots only interactive calls may take
+        self.reserved = reserved
+        self.queue_size = queue_size
+        self.in_flight = 0
+        self.waiters: Dict[str, Deque[asyncio.Future]] = {level: deque() for level in PRIORITIES}
+        # time.monotonic() before which the upstream asked not to be called
+        self.paused_until = 0.0
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def _limit(self, level: str) -> int:
+        return self.budget if level == INTERACTIVE else self.budget - self.reserved
+
+    def _can_start(self, level: str) -> bool:
+        if self.in_flight >= self._limit(level):
+            return False
+        # Nobody jumps a queue of equal or higher priority
+        for other in PRIORITIES:
+            if self.waiters[other]:
+                return False
+            if other == level:
+                break
+        return True
+
+    async def acquire(self, level: str, max_wait: Optional[float]) -> None:
+        paused = self.paused_until - time.monotonic()
+        if paused > 0:
+            if max_wait is not None and paused > max_wait:
+                scheduler_shed.inc(upstream=self.name, priority=level, reason="throttled")
+                raise UpstreamBusyError(f"{self.name} asked callers to back off for {paused:.0f}s")
+            await asyncio.sleep(paused)
+            if max_wait is not None:
+                max_wait -= paused
+
+        if self._can_start(level):
+            self.in_flight += 1
+            return
+
+        queue = self.waiters[level]
+        if len(queue) >= self.queue_size:
+            scheduler_shed.inc(upstream=self.name, priority=level, reason="queue_full")
+            raise UpstreamBusyError(f"{self.name} is busy: {level} queue is full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        try:
+            done, _ = await asyncio.wait({waiter}, timeout=max_wait)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we were cancelled
+                self.release()
+            else:
+                queue.remove(waiter)
+            raise
+
+        if not done:
+            queue.remove(waiter)
+            waiter.cancel()
+            scheduler_shed.inc(upstream=self.name, priority=level, reason="deadline")
+            raise UpstreamBusyError(f"{self.name} is busy: waited {max_wait:.0f}s for a {level} slot")
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        # Hand freed slots to the highest-priority waiters that may use them
+        for level in PRIORITIES:
+            queue = self.waiters[level]
+            while queue and self.in_flight < self._limit(level):
+                waiter = queue.popleft()
+                if waiter.done():
+                    continue
+                self.in_flight += 1
+                waiter.set_result(None)
+            if queue:
+                break
+
+
+class UpstreamScheduler:
+    def __init__(self):
+        self.settings = get_settings()
+        self.budgets = self._parse_budgets(self.settings.upstream_budgets)
+        self.upstreams: Dict[str, _Upstream] = {}
+
+    @staticmethod
+    def _parse_budgets(spec: str) -> Dict[str, int]:
+        """Parse "microsoft=16,aws=4" into {"microsoft": 16, "aws": 4}"""
+        budgets = {}
+        for part in spec.split(","):
+            name, _, value = part.strip().partition("=")
+            if name and value:
+                budgets[name.strip()] = max(int(value), 1)
+        return budgets
+
+    def _upstream(self, name: str) -> _Upstream:
+        upstream = self.upstreams.get(name)
+        if upstream is None:
+            budget = self.budgets.get(name, DEFAULT_BUDGET)
+            # A budget of one can't be split; background then simply queues behind interactive
+            reserved = min(budget - 1, -(-budget * self.settings.scheduler_interactive_reserve_percent // 100))
+            upstream = self.upstreams[name] = _Upstream(
+                name, budget, max(reserved, 0), self.settings.scheduler_queue_size
+            )
+        return upstream
+
+    @asynccontextmanager
+    async def call(self, name: str, upstream: str) -> AsyncIterator[None]:
+        """Hold a slot of `upstream` for the block, traced as span `name`"""
+        level, max_wait = _priority.get()
+        state = self._upstream(upstream)
+
+        started = time.perf_counter()
+        await state.acquire(level, max_wait)
+        waited = time.perf_counter() - started
+        scheduler_wait.observe(waited, upstream=upstream, priority=level)
+        if waited > 0.001:
+            record_span("scheduler.wait", waited)
+
+        try:
+            with span(name, upstream=upstream):
+                yield
+        except Exception as e:
+            # httpx.HTTPStatusError and the SDKs' API errors carry the response
+            backoff = retry_after(getattr(e, "response", None))
+            if backoff is not None:
+                scheduler_throttled.inc(upstream=upstream)
+                state.pause(backoff)
+            raise
+        finally:
+            state.release()
+
+
+# Global scheduler instance
+scheduler = UpstreamScheduler()
+
+
+def upstream_call(name: str, upstream: str):
+    """Schedule and trace one upstream call: `async with upstream_call("graph.user", "microsoft"):`"""
+    return scheduler.call(name, upstream)
+
+
+@registry.collector
+def _scheduler_metrics():
+    return [
+        ("jarvis_scheduler_queue_depth", "gauge", "Upstream calls waiting for a slot",
+         [({"upstream": upstream.name, "priority": level}, len(queue))
+          for upstream in scheduler.upstreams.values() for level, queue in upstream.waiters.items()]),
+        ("jarvis_scheduler_in_flight", "gauge", "Upstream calls currently holding a slot",
+         [({"upstream": upstream.name}, upstream.in_flight) for upstream in scheduler.upstreams.values()]),
+        ("jarvis_scheduler_budget", "gauge", "Concurrent calls allowed per upstream",
+         [({"upstream": upstream.name}, upstream.budget) for upstream in scheduler.upstreams.values()]),
+    ]
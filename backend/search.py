@@ -0,0 +1,227 @@
+"""In-memory typeahead index over cached users and servers
+
+Records are split into lowercase, accent-folded word tokens. A sorted token
+list answers prefix queries, a trigram index over tokens answers infix
+queries ("mith" in "smith"), and candidates are ranked by where and how well
+every query term matched.
+
+The index never copies records: documents are positions in the owner's
+record list, and the owner reports every change with add()/remove(). Tokens
+are stored once however many records share them, and postings are packed
+into arrays rather than Python ints and lists.
+"""
+from array import array
+from bisect import bisect_left, insort
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Set, Tuple
+import heapq
+import re
+import unicodedata
+
+_TOKEN = re.compile(r"[^\W_]+")
+
+# Match quality per query term
+EXACT = 1.0
+PREFIX = 0.7
+INFIX = 0.4
+
+# Records scored per query; bounds latency however common the query is
+MAX_CANDIDATES = 500
+
+USER_SEARCH_FIELDS = (("display_name", 3.0), ("email", 2.0), ("department", 1.0))
+SERVER_SEARCH_FIELDS = (("name", 3.0), ("region", 1.0))
+
+# Posting slot values: a doc id, _EMPTY, or (_SHARED - i) for entry i of the
+# shared posting lists, which are kept sorted
+_EMPTY = -1
+_SHARED = -2
+
+
+def tokenize(text: Any) -> List[str]:
+    """Word tokens: "Zoë.Doe@contoso.com" -> ["zoe", "doe", "contoso", "com"]"""
+    if not text:
+        return []
+    text = str(text).lower()
+    if not text.isascii():
+        text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    return _TOKEN.findall(text)
+
+
+def _trigrams(token: str) -> Set[str]:
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+class SearchIndex:
+    """Token index over a record list the caller owns
+
+    `fields` are (name, weight) pairs read with record.get(). The caller
+    keeps `records` and reports changes: add(doc) after records[doc] was set,
+    remove(doc, record) with the record that was there.
+    """
+
+    def __init__(self, fields: Sequence[Tuple[str, float]], records: Sequence[Any]):
+        self.fields = tuple(fields)
+        self.records = records
+        # Token id -> token; ids in token order for prefix scans
+        self._tokens: List[str] = []
+        self._sorted = array("I")
+        # Token id -> posting slot (see _EMPTY/_SHARED) and the shared posting lists
+        self._postings = array("i")
+        self._shared: List[array] = []
+        # Trigram -> ids of tokens containing it; tokens that lost all postings
+        # stay listed and are skipped at query time
+        self._trigrams: Dict[str, array] = {}
+        self._build()
+
+    def _record_tokens(self, record: Any) -> Set[str]:
+        tokens = set()
+        for name, _ in self.fields:
+            tokens.update(tokenize(record.get(name)))
+        return tokens
+
+    def _build(self) -> None:
+        """Bulk load: collect every posting first, then sort tokens once"""
+        postings: Dict[str, Any] = {}
+        for doc, record in enumerate(self.records):
+            for token in self._record_tokens(record):
+                docs = postings.get(token)
+                if docs is None:
+                    postings[token] = doc
+                elif isinstance(docs, int):
+                    postings[token] = [docs, doc]
+                else:
+                    docs.append(doc)
+
+        for token in sorted(postings):
+            docs = postings[token]
+            if isinstance(docs, int):
+                self._add_token(token, docs)
+            else:
+                self._add_token(token, _SHARED - len(self._shared))
+                self._shared.append(array("I", docs))
+            self._sorted.append(len(self._tokens) - 1)
+
+    def _add_token(self, token: str, slot: int) -> int:
+        token_id = len(self._tokens)
+        self._tokens.append(token)
+        self._postings.append(slot)
+        for trigram in _trigrams(token):
+            self._trigrams.setdefault(trigram, array("I")).append(token_id)
+        return token_id
+
+    def _position(self, token: str) -> int:
+        return bisect_left(self._sorted, token, key=self._tokens.__getitem__)
+
+    def _find(self, token: str) -> int:
+        position = self._position(token)
+        if position < len(self._sorted) and self._tokens[self._sorted[position]] == token:
+            return self._sorted[position]
+        return -1
+
+    def add(self, doc: int) -> None:
+        """Index records[doc]"""
+        for token in self._record_tokens(self.records[doc]):
+            token_id = self._find(token)
+            if token_id < 0:
+                self._add_token(token, doc)
+                insort(self._sorted, len(self._tokens) - 1, key=self._tokens.__getitem__)
+                continue
+            slot = self._postings[token_id]
+            if slot == _EMPTY:
+                self._postings[token_id] = doc
+            elif slot >= 0:
+                self._postings[token_id] = _SHARED - len(self._shared)
+                self._shared.append(array("I", sorted((slot, doc))))
+            else:
+                insort(self._shared[_SHARED - slot], doc)
+
+    def remove(self, doc: int, record: Any) -> None:
+        """Drop the postings `record` had at `doc`"""
+        for token in self._record_tokens(record):
+            token_id = self._find(token)
+            if token_id < 0:
+                continue
+            slot = self._postings[token_id]
+            if slot >= 0:
+                if slot == doc:
+                    self._postings[token_id] = _EMPTY
+            elif slot != _EMPTY:
+                docs = self._shared[_SHARED - slot]
+                position = bisect_left(docs, doc)
+                if position < len(docs) and docs[position] == doc:
+                    del docs[position]
+
+    def _docs(self, token_id: int) -> Iterable[int]:
+        slot = self._postings[token_id]
+        if slot >= 0:
+            return (slot,)
+        return () if slot == _EMPTY else self._shared[_SHARED - slot]
+
+    def _matching_tokens(self, term: str) -> Iterator[int]:
+        """Ids of tokens matching `term` exactly or by prefix, then by infix"""
+        for position in range(self._position(term), len(self._sorted)):
+            # The exact token sorts first among its prefix matches
+            token_id = self._sorted[position]
+            if not self._tokens[token_id].startswith(term):
+                break
+            yield token_id
+
+        if len(term) >= 3:
+            lists = [self._trigrams.get(trigram) for trigram in _trigrams(term)]
+            if all(lists):
+                for token_id in min(lists, key=len):
+                    token = self._tokens[token_id]
+                    if term in token and not token.startswith(term):
+                        yield token_id
+
+    def _candidates(self, term: str) -> Iterator[int]:
+        """Docs matching `term`, best match quality first; a doc may repeat"""
+        for token_id in self._matching_tokens(term):
+            yield from self._docs(token_id)
+
+    def _postings_count(self, term: str) -> int:
+        return sum(len(self._docs(token_id)) for token_id in self._matching_tokens(term))
+
+    def _score(self, record: Any, terms: List[str]) -> float:
+        total = 0.0
+        for term in terms:
+            best = 0.0
+            for name, weight in self.fields:
+                for token in tokenize(record.get(name)):
+                    if token == term:
+                        quality = EXACT
+                    elif token.startswith(term):
+                        quality = PREFIX
+                    elif len(term) >= 3 and term in token:
+                        quality = INFIX
+                    else:
+                        continue
+                    best = max(best, quality * weight)
+            if not best:
+                # Every term has to match somewhere
+                return 0.0
+            total += best
+        return total
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[float, Any]]:
+        """Best matches for `query` as (score, record), highest score first"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        # Every term must match: walk the rarest term's postings and keep the
+        # docs every other term matches too. Only the intersection is capped,
+        # so two common terms still find the few records that have both.
+        counts = {term: self._postings_count(term) for term in terms}
+        if not all(counts.values()):
+            return []
+        rarest, *others = sorted(terms, key=counts.__getitem__)
+        other_docs = [set(self._candidates(term)) for term in others]
+        candidates: Dict[int, None] = {}
+        for doc in self._candidates(rarest):
+            if doc not in candidates and all(doc in docs for docs in other_docs):
+                candidates[doc] = None
+                if len(candidates) >= MAX_CANDIDATES:
+                    break
+
+        scored = ((self._score(self.records[doc], terms), doc) for doc in candidates)
+        best = heapq.nlargest(limit, (entry for entry in scored if entry[0]), key=lambda entry: (entry[0], -entry[1]))
+        return [(score, self.records[doc]) for score, doc in best]
@@ -0,0 +1,225 @@
+"""Microsoft Graph change notifications for the cached user snapshot"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from cache import cache
+from config import get_settings
+from database import SessionLocal, GraphSubscription
+from tenants import tenant_registry, tenant_key, DEFAULT_TENANT
+from scheduler import priority, BACKGROUND
+import asyncio
+import hmac
+import logging
+
+logger = logging.getLogger(__name__)
+
+USERS_RESOURCE = "/users"
+# "created" too, so users added outside JARVIS reach the snapshot
+USERS_CHANGE_TYPE = "created,updated,deleted"
+
+# Concurrent user fetches while applying a notification batch
+FETCH_CONCURRENCY = 8
+
+
+class GraphSubscriptionManager:
+    """Keeps a /users subscription alive for every tenant, renewing each before it expires"""
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.settings.graph_notification_url and self.settings.graph_client_state)
+
+    async def start(self) -> None:
+        if not self.enabled:
+            logger.info("Graph change notifications disabled (no notification URL or client state)")
+            return
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def verify(self, notification: Dict[str, Any]) -> bool:
+        """Check a notification carries our client state"""
+        client_state = notification.get("clientState") or ""
+        expected = self.settings.graph_client_state
+        return bool(expected) and hmac.compare_digest(client_state, expected)
+
+    def tenant_of(self, notification: Dict[str, Any]) -> Optional[str]:
+        """Registry id of the tenant a notification is about, or None if it isn't ours"""
+        tenant_id = (notification.get("tenantId") or "").lower()
+        if tenant_id:
+            for tenant, config in tenant_registry.tenants().items():
+                if config.tenant_id.lower() == tenant_id:
+                    return tenant
+
+        # Fall back to the tenant the subscription was created for
+        db = SessionLocal()
+        try:
+            row = db.get(GraphSubscription, notification.get("subscriptionId") or "")
+            return row.tenant if row is not None else None
+        finally:
+            db.close()
+
+    async def _run(self) -> None:
+        with priority(BACKGROUND):
+            await self._maintain()
+
+    async def _maintain(self) -> None:
+        lead = timedelta(minutes=self.settings.graph_subscription_renew_minutes)
+        while True:
+            tenants = list(tenant_registry.tenants())
+            results = await tenant_registry.gather(self.ensure_subscription, tenants)
+
+            # Wake for the earliest renewal; tenants that failed retry in a minute
+            delays = []
+            for tenant, result in results.items():
+                if isinstance(result, Exception):
+                    logger.error(f"Graph subscription maintenance failed for tenant {tenant}: {str(result)}")
+                    delays.append(60.0)
+                else:
+                    delays.append((result - lead - datetime.now(timezone.utc)).total_seconds())
+            await asyncio.sleep(max(min(delays, default=60.0), 60.0))
+
+    async def ensure_subscription(self, tenant: str = DEFAULT_TENANT) -> datetime:
+        """Create or renew the tenant's users subscription, returning its expiry"""
+        provider = tenant_registry.provider(tenant)
+        now = datetime.now(timezone.utc)
+        expires_at = now + timedelta(minutes=self.settings.graph_subscription_minutes)
+        lead = timedelta(minutes=self.settings.graph_subscription_renew_minutes)
+
+        db = SessionLocal()
+        try:
+            row = db.query(GraphSubscription).filter(
+                GraphSubscription.resource == USERS_RESOURCE,
+                GraphSubscription.tenant == tenant
+            ).first()
+            if row is not None and row.change_type != USERS_CHANGE_TYPE:
+                # Created for other change types (e.g. before "created" was added); replace it
+                await provider.delete_subscription(row.id)
+                db.delete(row)
+                db.commit()
+                row = None
+
+            if row is not None:
+                current = row.expires_at.replace(tzinfo=timezone.utc)
+                if current - lead > now:
+                    return current
+
+                renewed = await provider.renew_subscription(row.id, expires_at)
+                if renewed is not None:
+                    row.expires_at = expires_at.replace(tzinfo=None)
+                    db.commit()
+                    logger.info(f"Renewed Graph subscription {row.id} for tenant {tenant} until {expires_at.isoformat()}")
+                    return expires_at
+
+                # Graph dropped it (expired or deleted); start over
+                db.delete(row)
+                db.commit()
+
+            created = await provider.create_subscription(
+                USERS_RESOURCE,
+                USERS_CHANGE_TYPE,
+                self.settings.graph_notification_url,
+                self.settings.graph_client_state,
+                expires_at
+            )
+            db.add(GraphSubscription(
+                id=created["id"],
+                tenant=tenant,
+                resource=USERS_RESOURCE,
+                change_type=USERS_CHANGE_TYPE,
+                client_state=self.settings.graph_client_state,
+                expires_at=expires_at.replace(tzinfo=None)
+            ))
+            db.commit()
+            logger.info(f"Created Graph subscription {created['id']} for tenant {tenant} until {expires_at.isoformat()}")
+            return expires_at
+        finally:
+            db.close()
+
+
+def _user_id(notification: Dict[str, Any]) -> Optional[str]:
+    resource_data = notification.get("resourceData") or {}
+    if resource_data.get("id"):
+        return resource_data["id"]
+    # e.g. "Users/8a4c..." or "users/8a4c..."
+    resource = notification.get("resource") or ""
+    return resource.rsplit("/", 1)[-1] or None
+
+
+async def apply_user_notifications(
+    notifications: List[Dict[str, Any]],
+    tenant: str = DEFAULT_TENANT
+) -> Dict[str, int]:
+    """Apply user change notifications to the tenant's cached snapshot in place"""
+    key = tenant_key("users", tenant)
+    store = cache.get(key)
+    if store is None:
+        # Nothing cached; the next listing fetches fresh data anyway
+        return {"updated": 0, "deleted": 0, "skipped": len(notifications)}
+
+    # Last change per user wins within a batch
+    changes: Dict[str, str] = {}
+    for notification in notifications:
+        user_id = _user_id(notification)
+        if user_id:
+            changes[user_id] = notification.get("changeType", "updated")
+
+    provider = tenant_registry.provider(tenant)
+    semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+    async def fetch(user_id: str):
+        async with semaphore:
+            # Refreshing the cache is background work; without a deadline a busy
+            # upstream just delays it rather than forcing a full refetch
+            with priority(BACKGROUND, max_wait=None):
+                return user_id, await provider.get_user(user_id)
+
+    to_fetch = [user_id for user_id, change in changes.items() if change != "deleted"]
+    fetched = await asyncio.gather(*(fetch(user_id) for user_id in to_fetch), return_exceptions=True)
+
+    # The snapshot may have been refreshed or dropped while fetching
+    store = cache.get(key)
+    if store is None:
+        return {"updated": 0, "deleted": 0, "skipped": len(notifications)}
+
+    counts = {"updated": 0, "deleted": 0, "skipped": 0}
+    for user_id, change in changes.items():
+        if change == "deleted":
+            store.remove(user_id)
+            counts["deleted"] += 1
+
+    for result in fetched:
+        if isinstance(result, Exception):
+            logger.error(f"Could not fetch changed user: {str(result)}")
+            counts["skipped"] += 1
+            continue
+        user_id, user = result
+        if user is None:
+            store.remove(user_id)
+            counts["deleted"] += 1
+        else:
+            existing = store.get_user(user_id)
+            if user.get("last_sign_in") is None and existing is not None:
+                # Report-sourced sign-ins only arrive with full listings
+                user = {**user, "last_sign_in": existing.last_sign_in}
+            store.upsert(user)
+            counts["updated"] += 1
+
+    if counts["skipped"]:
+        # Can't tell what changed for those users; fall back to a full refetch
+        cache.invalidate(key)
+    else:
+        # Only the encoded payloads derived from the snapshot are stale
+        cache.clear_variants(key)
+    logger.info(f"Applied Graph user notifications: {counts}")
+    return counts
+
+
+# Global subscription manager instance
+subscription_manager = GraphSubscriptionManager()
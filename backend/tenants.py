@@ -0,0 +1,137 @@
+"""Microsoft 365 tenant registry
+
+The tenant configured by MICROSOFT_TENANT_ID/CLIENT_ID/CLIENT_SECRET is
+registered as "default"; MSP deployments add more through MICROSOFT_TENANTS.
+Every tenant gets its own provider instance, so token caches and connection
+pools are never shared, and its own cache keys.
+"""
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, TypeVar, Union
+from pydantic import BaseModel, ValidationError
+from config import get_settings
+from providers import get_provider
+import asyncio
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TENANT = "default"
+
+T = TypeVar("T")
+
+
+class TenantConfig(BaseModel):
+    id: str  # Short name used in URLs and cache keys
+    name: str = ""
+    tenant_id: str
+    client_id: str
+    client_secret: str
+
+
+class UnknownTenantError(KeyError):
+    pass
+
+
+def tenant_key(namespace: str, tenant: str) -> str:
+    """Cache key for a tenant's entry, e.g. "users:contoso"
+
+    The namespace stays first so cache metrics keep grouping by data kind.
+    """
+    return f"{namespace}:{tenant}"
+
+
+class TenantRegistry:
+    def __init__(self):
+        self.settings = get_settings()
+        self._tenants: Optional[Dict[str, TenantConfig]] = None
+        self._providers: Dict[str, Any] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def tenants(self) -> Dict[str, TenantConfig]:
+        if self._tenants is None:
+            self._tenants = self._load()
+        return self._tenants
+
+    def _load(self) -> Dict[str, TenantConfig]:
+        tenants = {}
+        if self.settings.microsoft_tenant_id:
+            tenants[DEFAULT_TENANT] = TenantConfig(
+                id=DEFAULT_TENANT,
+                name="Default",
+                tenant_id=self.settings.microsoft_tenant_id,
+                client_id=self.settings.microsoft_client_id,
+                client_secret=self.settings.microsoft_client_secret
+            )
+
+        if self.settings.microsoft_tenants:
+            try:
+                for entry in json.loads(self.settings.microsoft_tenants):
+                    tenant = TenantConfig(**entry)
+                    if tenant.id in tenants:
+                        raise ValueError(f"Duplicate tenant id: {tenant.id}")
+                    tenants[tenant.id] = tenant
+            except (ValueError, TypeError, ValidationError) as e:
+                raise ValueError(f"Invalid MICROSOFT_TENANTS: {str(e)}")
+
+        logger.info(f"Registered {len(tenants)} Microsoft 365 tenant(s): {', '.join(tenants) or 'none'}")
+        return tenants
+
+    def resolve(self, tenant: Optional[str] = None) -> str:
+        """Validate a tenant id, falling back to the default tenant"""
+        tenant = tenant or DEFAULT_TENANT
+        # Single-tenant deployments without credentials still resolve "default",
+        # so errors surface from Graph rather than as an unknown tenant
+        if tenant == DEFAULT_TENANT or tenant in self.tenants():
+            return tenant
+        raise UnknownTenantError(tenant)
+
+    def provider(self, tenant: Optional[str] = None) -> Any:
+        """The tenant's Graph provider, created once and reused"""
+        tenant = self.resolve(tenant)
+        provider = self._providers.get(tenant)
+        if provider is None:
+            config = self.tenants().get(tenant)
+            if config is None:
+                provider = get_provider("microsoft")
+            else:
+                provider = get_provider(
+                    "microsoft",
+                    tenant_id=config.tenant_id,
+                    client_id=config.client_id,
+                    client_secret=config.client_secret
+                )
+            self._providers[tenant] = provider
+        return provider
+
+    async def gather(
+        self,
+        fetch: Callable[[str], Awaitable[T]],
+        tenants: Optional[Iterable[str]] = None
+    ) -> Dict[str, Union[T, Exception]]:
+        """Run `fetch(tenant)` for every tenant concurrently
+
+        Concurrency is capped across all callers, so several cross-tenant
+        views at once can't flood Graph. A failing tenant yields its exception
+        instead of failing the others.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.settings.tenant_fetch_concurrency)
+        names: List[str] = list(tenants) if tenants is not None else list(self.tenants())
+
+        async def run(tenant: str):
+            async with self._semaphore:
+                return await fetch(tenant)
+
+        results = await asyncio.gather(*(run(tenant) for tenant in names), return_exceptions=True)
+        return dict(zip(names, results))
+
+    async def aclose(self) -> None:
+        """Close every tenant's connection pool"""
+        providers, self._providers = self._providers, {}
+        for provider in providers.values():
+            await provider.aclose()
+        self._semaphore = None
+
+
+# Global tenant registry
+tenant_registry = TenantRegistry()
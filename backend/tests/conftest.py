@@ -0,0 +1,19 @@
+from pathlib import Path
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import pytest
+import sys
+
+# The backend modules import each other as top-level modules (see Procfile)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import Base  # noqa: E402
+
+
+@pytest.fixture
+def sessions(tmp_path):
+    """Session factory over an empty SQLite database in a temp dir"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'jarvis.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
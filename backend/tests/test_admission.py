@@ -0,0 +1,274 @@
+"""Admission gates, client rate limits and request deduplication"""
+from admission import ADMITTED, QUEUED, AdmissionMiddleware, AdmissionRule, _Gate, _RateLimiter
+from config import get_settings
+import asyncio
+import pytest
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class App:
+    """ASGI app answering after `delay` seconds, or from `release` when given"""
+
+    def __init__(self, delay=0.05, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.running = 0
+        self.release = None
+
+    async def __call__(self, scope, receive, send):
+        self.calls += 1
+        self.running += 1
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise RuntimeError("upstream failed")
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            if self.release is not None:
+                await send({"type": "http.response.body", "body": b"part", "more_body": True})
+                await self.release.wait()
+            await send({"type": "http.response.body", "body": f"call {self.calls}".encode()})
+        finally:
+            self.running -= 1
+
+
+async def request(middleware, path="/expensive", query=b"", client="10.0.0.1"):
+    """Status and body of one request through the middleware"""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http", "method": "GET", "path": path, "query_string": query,
+        "headers": [], "client": (client, 1234),
+    }
+    await middleware(scope, receive, send)
+    body = b"".join(message.get("body", b"") for message in messages if message["type"] == "http.response.body")
+    return messages[0]["status"], body
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "admission_enabled", True)
+    monkeypatch.setattr(settings, "admission_limits", "expensive=1")
+    monkeypatch.setattr(settings, "admission_queue_size", 2)
+    monkeypatch.setattr(settings, "admission_max_wait", 1.0)
+    monkeypatch.setattr(settings, "admission_client_rate_per_minute", 60.0)
+    monkeypatch.setattr(settings, "admission_client_burst", 20)
+    monkeypatch.setattr(settings, "admission_client_header", "")
+    return settings
+
+
+def middleware(app, dedupe=True):
+    return AdmissionMiddleware(app, [AdmissionRule("expensive", "GET", ("/expensive",), dedupe=dedupe)])
+
+
+# Gate
+
+
+def test_gate_queues_in_order_and_hands_over_slots():
+    async def scenario():
+        gate = _Gate("x", limit=1, queue_size=2)
+        assert await gate.acquire(1.0) == ADMITTED
+        order = []
+
+        async def wait(name):
+            outcome = await gate.acquire(1.0)
+            order.append((name, outcome))
+
+        waiters = [asyncio.create_task(wait(name)) for name in ("first", "second")]
+        await settle()
+        # The queue holds two; a third is shed at once
+        assert await gate.acquire(1.0) is None
+        gate.release(0.5)
+        await settle()
+        assert order == [("first", QUEUED)]
+        gate.release(0.5)
+        await asyncio.gather(*waiters)
+        assert order == [("first", QUEUED), ("second", QUEUED)]
+        assert gate.in_flight == 1
+        gate.release(0.5)
+        assert gate.in_flight == 0
+
+    run(scenario())
+
+
+def test_gate_sheds_after_max_wait():
+    async def scenario():
+        gate = _Gate("x", limit=1, queue_size=2)
+        await gate.acquire(1.0)
+        assert await gate.acquire(0.01) is None
+        assert not gate.waiters
+        gate.release(None)
+        assert gate.in_flight == 0
+
+    run(scenario())
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def scenario():
+        gate = _Gate("x", limit=1, queue_size=2)
+        await gate.acquire(1.0)
+        waiter = asyncio.create_task(gate.acquire(1.0))
+        await settle()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert not gate.waiters
+        gate.release(None)
+        assert gate.in_flight == 0
+
+    run(scenario())
+
+
+def test_cancel_after_slot_was_handed_over_returns_it():
+    async def scenario():
+        gate = _Gate("x", limit=1, queue_size=2)
+        await gate.acquire(1.0)
+        waiter = asyncio.create_task(gate.acquire(1.0))
+        await settle()
+        # The slot passes to the waiter, which is cancelled before it resumes
+        gate.release(None)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert gate.in_flight == 0
+        assert await gate.acquire(0.01) == ADMITTED
+
+    run(scenario())
+
+
+def test_retry_after_grows_with_queue():
+    gate = _Gate("x", limit=2, queue_size=8)
+    gate.service_seconds = 4.0
+    assert gate.retry_after() == 2
+    gate.waiters.extend([None] * 3)
+    assert gate.retry_after() == 8
+
+
+def test_rate_limiter_refills():
+    limiter = _RateLimiter(per_minute=60.0, burst=2)
+    assert limiter.take("x", "a") == 0
+    assert limiter.take("x", "a") == 0
+    assert limiter.take("x", "a") == pytest.approx(1.0, abs=0.01)
+    # Buckets are per rule and per client
+    assert limiter.take("y", "a") == 0
+    assert limiter.take("x", "b") == 0
+    limiter.buckets[("x", "a")].updated -= 1.0
+    assert limiter.take("x", "a") == 0
+
+
+# Middleware
+
+
+def test_identical_requests_share_one_response(settings):
+    async def scenario():
+        app = App()
+        admission = middleware(app)
+        results = await asyncio.gather(*(request(admission) for _ in range(5)))
+        assert results == [(200, b"call 1")] * 5
+        assert app.calls == 1
+        # Different query strings are different requests
+        await asyncio.gather(request(admission, query=b"a=1"), request(admission, query=b"a=2"))
+        assert app.calls == 3
+        assert not admission.flights
+
+    run(scenario())
+
+
+def test_rate_limit_applies_before_joining(settings, monkeypatch):
+    monkeypatch.setattr(settings, "admission_client_burst", 2)
+
+    async def scenario():
+        app = App()
+        admission = middleware(app)
+        results = await asyncio.gather(*(request(admission) for _ in range(3)))
+        assert sorted(status for status, _ in results) == [200, 200, 429]
+        assert app.calls == 1
+        # Another client has its own bucket
+        assert (await request(admission, client="10.0.0.2"))[0] == 200
+
+    run(scenario())
+
+
+def test_followers_wait_at_most_max_wait(settings, monkeypatch):
+    monkeypatch.setattr(settings, "admission_max_wait", 0.05)
+
+    async def scenario():
+        app = App(delay=0.3)
+        admission = middleware(app)
+        leader, follower = await asyncio.gather(request(admission), request(admission))
+        assert leader[0] == 200
+        assert follower[0] == 503
+        assert app.calls == 1
+
+    run(scenario())
+
+
+def test_failed_leader_is_not_shared(settings):
+    async def scenario():
+        app = App(fail=True)
+        admission = middleware(app)
+        results = await asyncio.gather(*(request(admission) for _ in range(2)), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        # The follower ran on its own after the leader failed
+        assert app.calls == 2
+        assert admission.gates["expensive"].in_flight == 0
+
+    run(scenario())
+
+
+def test_queue_overflow_is_shed(settings):
+    async def scenario():
+        app = App(delay=0.1)
+        admission = middleware(app, dedupe=False)
+        results = await asyncio.gather(*(request(admission) for _ in range(5)))
+        # One running, two queued, the rest shed
+        assert sorted(status for status, _ in results) == [200, 200, 200, 503, 503]
+        assert app.calls == 3
+
+    run(scenario())
+
+
+def test_slot_is_released_when_the_response_starts(settings):
+    async def scenario():
+        app = App(delay=0.01)
+        app.release = asyncio.Event()
+        admission = middleware(app, dedupe=False)
+        streaming = asyncio.create_task(request(admission))
+        while app.calls == 0 or admission.gates["expensive"].in_flight:
+            await asyncio.sleep(0.01)
+        # The first response is still streaming but no longer holds the slot
+        assert app.running == 1
+        second = asyncio.create_task(request(admission))
+        while app.calls < 2:
+            await asyncio.sleep(0.01)
+        app.release.set()
+        assert (await streaming)[0] == 200
+        assert (await second)[0] == 200
+        assert admission.gates["expensive"].in_flight == 0
+
+    run(scenario())
+
+
+def test_unmatched_and_disabled_requests_pass_through(settings, monkeypatch):
+    async def scenario():
+        app = App(delay=0)
+        admission = middleware(app)
+        assert (await request(admission, path="/cheap"))[0] == 200
+        monkeypatch.setattr(settings, "admission_enabled", False)
+        assert (await request(admission))[0] == 200
+        assert not admission.limiter.buckets
+
+    run(scenario())
@@ -0,0 +1,104 @@
+"""Expiry index sync and threshold alerts"""
+from datetime import datetime, timedelta
+from database import AuditLog, InventoryExpiry
+from expiry import ExpiryTracker, parse_expiry, parse_thresholds
+import asyncio
+import expiry
+import pytest
+
+NOW = datetime(2026, 5, 1, 12, 0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [NOW]
+    monkeypatch.setattr(expiry, "_utcnow", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def tracker(sessions, monkeypatch, clock):
+    monkeypatch.setattr(expiry, "SessionLocal", sessions)
+    tracker = ExpiryTracker()
+    tracker.thresholds = (30, 14, 7, 0)
+    return tracker
+
+
+def item(item_id, days, provider="godaddy"):
+    return {
+        "id": item_id, "name": f"{item_id}.com", "provider": provider, "type": "domain",
+        "expires_at": (NOW + timedelta(days=days)).isoformat() + "Z",
+    }
+
+
+def evaluate(tracker):
+    return [(alert["key"], alert["threshold_days"]) for alert in asyncio.run(tracker.evaluate())]
+
+
+def test_parsing():
+    assert parse_thresholds("7, 30,14,7,") == (30, 14, 7)
+    assert parse_expiry("2026-05-01T12:00:00Z") == NOW
+    assert parse_expiry("2026-05-01T14:00:00+02:00") == NOW
+    assert parse_expiry("soon") is None
+    assert parse_expiry(None) is None
+
+
+def test_alerts_once_per_threshold(tracker, clock):
+    tracker.sync([item("a", 40), item("b", 3), item("c", 200)])
+    # "b" is already past 30, 14 and 7: only the tightest is reported
+    assert evaluate(tracker) == [("godaddy:domain:b", 7)]
+    assert evaluate(tracker) == []
+
+    clock[0] = NOW + timedelta(days=11)
+    assert sorted(evaluate(tracker)) == [("godaddy:domain:a", 30), ("godaddy:domain:b", 0)]
+    clock[0] = NOW + timedelta(days=26)
+    assert evaluate(tracker) == [("godaddy:domain:a", 14)]
+    # Evaluated after both the 7-day and expiry thresholds passed: one alert
+    clock[0] = NOW + timedelta(days=41)
+    assert evaluate(tracker) == [("godaddy:domain:a", 0)]
+    assert evaluate(tracker) == []
+
+
+def test_alerts_are_audited(tracker, sessions):
+    tracker.sync([item("a", 3)])
+    evaluate(tracker)
+    db = sessions()
+    try:
+        entries = db.query(AuditLog).filter(AuditLog.action == "expiry_alert").all()
+        assert [(entry.resource_id, entry.details) for entry in entries] == [
+            ("godaddy:domain:a", "a.com expires within 7 day(s)")
+        ]
+    finally:
+        db.close()
+
+
+def test_renewal_restarts_alerts(tracker, clock):
+    tracker.sync([item("a", 5)])
+    assert evaluate(tracker) == [("godaddy:domain:a", 7)]
+    assert tracker.sync([item("a", 365)]) == 1
+    assert evaluate(tracker) == []
+    clock[0] = NOW + timedelta(days=340)
+    assert evaluate(tracker) == [("godaddy:domain:a", 30)]
+
+
+def test_sync_drops_only_missing_items_of_providers_that_answered(tracker, sessions):
+    tracker.sync([item("a", 10), item("b", 10), item("web", 10, provider="digitalocean")])
+    # digitalocean returned nothing (perhaps an error), so its rows stay
+    assert tracker.sync([item("a", 10)]) == 1
+    assert tracker.sync([item("a", 10)]) == 0
+    db = sessions()
+    try:
+        assert sorted(row.key for row in db.query(InventoryExpiry)) == [
+            "digitalocean:domain:web", "godaddy:domain:a"
+        ]
+    finally:
+        db.close()
+
+
+def test_expiring_window(tracker):
+    tracker.sync([item("past", -2), item("soon", 5), item("later", 60)])
+    assert [entry["key"] for entry in tracker.expiring(30)] == ["godaddy:domain:soon"]
+    assert [entry["key"] for entry in tracker.expiring(30, include_expired=True)] == [
+        "godaddy:domain:past", "godaddy:domain:soon"
+    ]
+    assert tracker.expiring(30)[0]["days_left"] == 5.0
@@ -0,0 +1,78 @@
+"""CSV and Parquet export encoding"""
+from datetime import datetime, timezone
+from exports import ExportFormatError, USER_EXPORT_COLUMNS, check_format, select_columns, stream_csv, stream_parquet
+import csv
+import io
+import exports
+import pytest
+
+
+def users(count):
+    return [
+        {
+            "id": f"u{i}",
+            "email": f"user{i}@contoso.com",
+            "display_name": f"User, {i}",
+            "domain": "contoso.com",
+            "last_sign_in": datetime(2026, 4, 1, 8, i % 60) if i % 3 else None,
+            "account_enabled": i % 2 == 0,
+            "licenses": ["sku-a", "sku-b"][:i % 3],
+            "license_type": None,
+            "monthly_cost": 6 if i % 2 else None,
+            "department": None,
+            "manager": None,
+        }
+        for i in range(count)
+    ]
+
+
+def test_csv_round_trips_in_chunks(monkeypatch):
+    monkeypatch.setattr(exports, "CSV_CHUNK_BYTES", 256)
+    rows = users(50)
+    chunks = list(stream_csv(rows, USER_EXPORT_COLUMNS))
+    assert len(chunks) > 1
+    parsed = list(csv.DictReader(io.StringIO(b"".join(chunks).decode())))
+    assert [row["display_name"] for row in parsed] == [row["display_name"] for row in rows]
+    assert parsed[1]["last_sign_in"] == "2026-04-01T08:01:00Z"
+    assert parsed[2]["licenses"] == "sku-a;sku-b"
+    assert parsed[0]["monthly_cost"] == ""
+
+
+def test_parquet_writes_one_row_group_per_batch():
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.parquet
+
+    rows = users(25)
+    chunks = list(stream_parquet(rows, USER_EXPORT_COLUMNS, row_group_rows=10))
+    # Three row groups, then the footer
+    assert len(chunks) == 4
+    parquet = pyarrow.parquet.ParquetFile(pyarrow.BufferReader(b"".join(chunks)))
+    assert [parquet.metadata.row_group(i).num_rows for i in range(parquet.num_row_groups)] == [10, 10, 5]
+
+    table = parquet.read()
+    assert table.column("id").to_pylist() == [row["id"] for row in rows]
+    assert table.column("licenses").to_pylist()[2] == ["sku-a", "sku-b"]
+    assert table.column("monthly_cost").to_pylist()[:2] == [None, 6.0]
+    assert table.column("last_sign_in").to_pylist()[1] == datetime(2026, 4, 1, 8, 1, tzinfo=timezone.utc)
+
+
+def test_parquet_of_no_rows_is_a_valid_file():
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.parquet
+
+    data = b"".join(stream_parquet([], USER_EXPORT_COLUMNS, row_group_rows=10))
+    assert pyarrow.parquet.read_table(pyarrow.BufferReader(data)).num_rows == 0
+
+
+def test_check_format(monkeypatch):
+    assert check_format("csv") == "csv"
+    with pytest.raises(ExportFormatError):
+        check_format("xlsx")
+    monkeypatch.setattr(exports, "load_pyarrow", lambda: None)
+    with pytest.raises(ExportFormatError):
+        check_format("parquet")
+
+
+def test_select_columns_keeps_export_order():
+    assert [name for name, _ in select_columns(USER_EXPORT_COLUMNS, ["email", "id"])] == ["id", "email"]
+    assert select_columns(USER_EXPORT_COLUMNS, None) == USER_EXPORT_COLUMNS
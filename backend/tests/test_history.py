@@ -0,0 +1,104 @@
+"""Snapshot chains, metric rollups and retention"""
+from datetime import datetime, timedelta
+from database import InventorySnapshot, MetricRollup
+from history import DAY, HOUR, RAW, HistoryQueryError, InventoryHistory, flatten_metrics
+import history
+import random
+import pytest
+
+FIELDS = ("name", "size", "tags")
+START = datetime(2026, 3, 2, 0, 30)
+
+
+@pytest.fixture
+def store(sessions, monkeypatch):
+    monkeypatch.setattr(history, "SessionLocal", sessions)
+    return InventoryHistory()
+
+
+def key(record):
+    return record["name"]
+
+
+def mutate(rng, records):
+    records = [dict(record) for record in records if rng.random() > 0.1]
+    for record in rng.sample(records, min(5, len(records))):
+        record["size"] = rng.randint(1, 8)
+    for _ in range(rng.randint(0, 4)):
+        records.append({"name": f"s{rng.randrange(10**6)}", "size": rng.randint(1, 8), "tags": ["web", "prod"]})
+    return records
+
+
+def test_replay_rebuilds_every_snapshot(store):
+    rng = random.Random(3)
+    records = [{"name": f"s{i}", "size": i % 4, "tags": ["db"]} for i in range(40)]
+    expected = []
+    # Two days, so the second day starts with a new keyframe
+    for step in range(12):
+        records = mutate(rng, records)
+        store._record("servers", records, FIELDS, key, {}, START + timedelta(hours=4 * step))
+        expected.append(sorted(records, key=key))
+
+    listed = store.snapshots("servers")
+    assert [snapshot["delta"] for snapshot in listed] == [False] + [True] * 5 + [False] + [True] * 5
+    for snapshot, records in zip(listed, expected):
+        rebuilt = store.snapshot_records(snapshot["id"])["records"]
+        assert sorted(rebuilt, key=key) == records
+    assert store.snapshot_records(10**6) is None
+
+
+def test_keyframe_after_max_deltas_or_field_change(store, monkeypatch):
+    monkeypatch.setattr(store.settings, "history_max_deltas", 2)
+    records = [{"name": "a", "size": 1, "tags": []}]
+    for step in range(4):
+        store._record("servers", records, FIELDS, key, {}, START + timedelta(minutes=step))
+    store._record("servers", records, ("name", "size"), key, {}, START + timedelta(minutes=5))
+    assert [snapshot["delta"] for snapshot in store.snapshots("servers")] == [False, True, True, False, False]
+
+
+def test_series_aggregates_by_bucket(store):
+    for minutes, value in ((0, 1.0), (20, 3.0), (90, 5.0), (24 * 60, 7.0)):
+        store._record("users", [], FIELDS, key, {"users.total": value}, START + timedelta(minutes=minutes))
+
+    end = START + timedelta(days=2)
+    assert [point["value"] for point in store.series("users.total", START, end, "hour", "avg")] == [2.0, 5.0, 7.0]
+    assert [point["value"] for point in store.series("users.total", START, end, "day", "max")] == [5.0, 7.0]
+    assert [point["samples"] for point in store.series("users.total", START, end, "raw")] == [1, 1, 1, 1]
+    assert store.series("users.total", START, end, "week", "sum")[0]["value"] == 16.0
+    assert store.metric_names("users.") == ["users.total"]
+    with pytest.raises(HistoryQueryError):
+        store.series("users.total", START, end, "fortnight")
+    with pytest.raises(HistoryQueryError):
+        store.series("users.total", START, end, "day", "median")
+
+
+def test_prune_keeps_recent_data_and_whole_days(store, sessions):
+    settings = store.settings
+    now = START + timedelta(days=settings.history_snapshot_days + 10)
+    old_day = now - timedelta(days=settings.history_raw_days + 2)
+    ancient_day = now - timedelta(days=settings.history_snapshot_days + 2)
+    for day in (ancient_day, old_day):
+        for minutes in (0, 30):
+            store._record("users", [{"name": f"u{minutes}"}], ("name",), key, {"m": 1.0}, day + timedelta(minutes=minutes))
+
+    db = sessions()
+    try:
+        store._prune(db, now)
+        db.commit()
+        snapshots = db.query(InventorySnapshot).order_by(InventorySnapshot.taken_at).all()
+        # Past raw retention only the day's keyframe is left; past snapshot retention nothing is
+        assert [(snapshot.taken_at, snapshot.base_id) for snapshot in snapshots] == [(old_day, None)]
+        resolutions = {row.resolution for row in db.query(MetricRollup)}
+        assert resolutions == {HOUR, DAY}
+        assert all(
+            row.bucket_start >= now - timedelta(days=settings.history_hourly_days)
+            for row in db.query(MetricRollup).filter(MetricRollup.resolution == HOUR)
+        )
+        assert not db.query(MetricRollup).filter(MetricRollup.resolution == RAW).count()
+    finally:
+        db.close()
+
+
+def test_flatten_metrics_skips_non_numbers():
+    stats = {"total": 3, "enabled": True, "by_license": {"Basic": {"users": 2, "name": "x"}}}
+    assert flatten_metrics("users", stats) == {"users.total": 3.0, "users.by_license.Basic.users": 2.0}
@@ -0,0 +1,112 @@
+"""License catalog resolution, pricing and the waste report"""
+from licensing import LicenseCatalog, license_report
+from user_store import UserStats
+import licensing
+import pytest
+
+BASIC = "3b555118-da6a-4418-894f-7df1e2096870"  # Business Basic, 6.00
+STANDARD = "f245ecc8-75af-4f8e-b61f-27d8114de5f3"  # Business Standard, 12.50
+E3 = "05e9a617-0261-4cee-bb44-138d3ef5d965"  # Microsoft 365 E3, 36.00
+CUSTOM = "11111111-2222-3333-4444-555555555555"
+
+SUBSCRIBED = [
+    {"sku_id": BASIC, "part_number": "O365_BUSINESS_ESSENTIALS", "purchased": 10, "consumed": 7},
+    {"sku_id": STANDARD, "part_number": "O365_BUSINESS_PREMIUM", "purchased": 3, "consumed": 3},
+    {"sku_id": CUSTOM, "part_number": "CONTOSO_ADDON", "purchased": 5, "consumed": 1},
+]
+
+
+@pytest.mark.parametrize("licenses, license_type, expected", [
+    ((), None, ((), None, 0)),
+    ([BASIC], None, ((BASIC,), "Microsoft 365 Business Basic", 6.0)),
+    # Most expensive first in the label, ids sorted
+    ([BASIC, E3], None, (tuple(sorted((BASIC, E3))), "Microsoft 365 E3 + Microsoft 365 Business Basic", 42.0)),
+    # A named license only counts through an alias, display name or part number
+    ((), "Business Standard", ((STANDARD,), "Microsoft 365 Business Standard", 12.5)),
+    ((), "Microsoft 365 E3", ((E3,), "Microsoft 365 E3", 36.0)),
+    ((), "SPE_E3", ((E3,), "Microsoft 365 E3", 36.0)),
+    ((), "Some Other Plan", ((), "Some Other Plan", 0)),
+    # Assigned SKUs win over the name
+    ([BASIC], "Business Premium", ((BASIC,), "Microsoft 365 Business Basic", 6.0)),
+    # Unknown SKU ids are named by id and free
+    (["unknown"], None, (("unknown",), "unknown", 0)),
+])
+def test_resolve(licenses, license_type, expected):
+    assert LicenseCatalog(overrides={}).resolve(licenses, license_type) == expected
+
+
+def test_resolve_shares_results():
+    catalog = LicenseCatalog(overrides={})
+    assert catalog.resolve([E3, BASIC]) is catalog.resolve([BASIC, E3])
+
+
+def test_subscribed_sku_missing_from_price_table_is_unpriced():
+    catalog = LicenseCatalog(SUBSCRIBED, overrides={})
+    sku = catalog.sku(CUSTOM)
+    assert (sku.name, sku.monthly_price, sku.priced) == ("CONTOSO_ADDON", 0.0, False)
+    assert catalog.sku("CONTOSO_ADDON") is sku
+    assert [entry.sku_id for entry in catalog.subscribed()] == [BASIC, STANDARD, CUSTOM]
+
+
+@pytest.mark.parametrize("overrides, sku_id, price", [
+    ({BASIC: 5.0}, BASIC, 5.0),
+    ({"O365_BUSINESS_ESSENTIALS": 4.5}, BASIC, 4.5),
+    # The id wins over the part number
+    ({BASIC: 5.0, "O365_BUSINESS_ESSENTIALS": 4.5}, BASIC, 5.0),
+    ({"CONTOSO_ADDON": 2.0}, CUSTOM, 2.0),
+])
+def test_price_overrides(overrides, sku_id, price):
+    catalog = LicenseCatalog(SUBSCRIBED, overrides=overrides)
+    assert catalog.price(sku_id) == price
+    assert catalog.sku(sku_id).priced
+
+
+def test_license_prices_setting(monkeypatch):
+    settings = licensing.get_settings()
+    monkeypatch.setattr(settings, "license_prices", '{"SPE_E3": 30}')
+    assert LicenseCatalog().price(E3) == 30.0
+    monkeypatch.setattr(settings, "license_prices", "not json")
+    with pytest.raises(ValueError, match="LICENSE_PRICES"):
+        LicenseCatalog()
+
+
+def test_report_counts_unused_and_disabled_seats_as_waste():
+    catalog = LicenseCatalog(SUBSCRIBED, overrides={"CONTOSO_ADDON": 2.0})
+    users = (
+        [{"licenses": [BASIC], "account_enabled": True}] * 5
+        + [{"licenses": [BASIC], "account_enabled": False}] * 2
+        + [{"licenses": [STANDARD, BASIC], "account_enabled": False}]
+        + [{"licenses": [E3], "account_enabled": True}]
+    )
+    stats = UserStats([{**user, "domain": "contoso.com"} for user in users], catalog)
+    report = license_report(catalog, stats.by_license)
+    by_id = {entry["sku_id"]: entry for entry in report["skus"]}
+
+    # Basic: 10 bought, 7 consumed -> 3 unused; 3 held by disabled accounts
+    assert by_id[BASIC]["unused"] == 3
+    assert by_id[BASIC]["assigned"] == 8
+    assert by_id[BASIC]["assigned_disabled"] == 3
+    assert by_id[BASIC]["waste_monthly_cost"] == (3 + 3) * 6.0
+    assert by_id[BASIC]["monthly_spend"] == 60.0
+    assert by_id[BASIC]["assigned_cost"] == 30.0
+    # Standard: fully consumed, one seat on a disabled account
+    assert by_id[STANDARD]["waste_monthly_cost"] == 12.5
+    # Custom: 4 unused at the overridden price
+    assert by_id[CUSTOM]["waste_monthly_cost"] == 8.0
+    assert by_id[CUSTOM]["priced"]
+    # E3 is assigned but not subscribed: spend from assignments, no seat counts
+    assert (by_id[E3]["purchased"], by_id[E3]["monthly_spend"], by_id[E3]["unused"]) == (None, 36.0, 0)
+
+    assert report["unused_seats"] == 7
+    assert report["waste_monthly_cost"] == 36.0 + 12.5 + 8.0
+    assert report["monthly_spend"] == 60.0 + 37.5 + 10.0 + 36.0
+    assert report["assigned_cost"] == 30.0 + 36.0
+    assert [entry["waste_monthly_cost"] for entry in report["skus"]] == sorted(
+        (entry["waste_monthly_cost"] for entry in report["skus"]), reverse=True
+    )
+
+
+def test_report_of_unpriced_sku_has_no_waste_cost():
+    catalog = LicenseCatalog(SUBSCRIBED, overrides={})
+    entry = next(entry for entry in license_report(catalog, {})["skus"] if entry["sku_id"] == CUSTOM)
+    assert (entry["unused"], entry["priced"], entry["waste_monthly_cost"]) == (4, False, 0.0)
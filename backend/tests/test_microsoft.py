@@ -0,0 +1,19 @@
+"""Microsoft Graph provider: token acquisition accounting"""
+from metrics import _label_key, upstream_requests
+from providers.microsoft import MicrosoftGraphProvider
+import pytest
+
+
+def errors() -> float:
+    return upstream_requests.values.get(_label_key({"upstream": "microsoft", "outcome": "error"}), 0.0)
+
+
+def test_failed_msal_app_construction_counts_as_a_token_error():
+    pytest.importorskip("msal")
+    provider = MicrosoftGraphProvider("tenant", "client", "secret")
+    # Rejected by MSAL before any request is sent
+    provider.authority = "not-a-url"
+    before = errors()
+    with pytest.raises(ValueError):
+        provider._get_access_token()
+    assert errors() == before + 1
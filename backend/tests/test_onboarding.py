@@ -0,0 +1,146 @@
+"""Streaming CSV reader and bulk user creation"""
+from onboarding import CSVFormatError, bulk_create_users, read_csv_records
+import asyncio
+import pytest
+
+HEADER = "full_name,username,domain,department\n"
+
+
+async def chunked(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def read(data: bytes, size: int = 7):
+    async def collect():
+        return [record async for record in read_csv_records(chunked(data, size))]
+    return asyncio.run(collect())
+
+
+@pytest.mark.parametrize("size", [1, 3, 64 * 1024])
+def test_records_survive_any_chunking(size):
+    data = (
+        '\ufeffname,notes\r\n'
+        '"Doe, Jane","line one\nline two"\r\n'
+        '"Zoë ""Z"" Ng",plain\n'
+        '\n'
+        'last,no newline at end'
+    ).encode()
+    assert read(data, size) == [
+        ["name", "notes"],
+        ["Doe, Jane", "line one\nline two"],
+        ['Zoë "Z" Ng', "plain"],
+        ["last", "no newline at end"],
+    ]
+
+
+def test_only_newlines_end_records():
+    # Characters str.splitlines() treats as line breaks are ordinary field content
+    separators = "\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+    data = f'a,b\nx{separators}y,"q{separators}"\n'.encode()
+    assert read(data, 5) == [["a", "b"], [f"x{separators}y", f"q{separators}"]]
+
+
+def test_unterminated_quote_and_bad_encoding():
+    with pytest.raises(CSVFormatError, match="quoted field"):
+        read(b'a,b\n"open,1\n')
+    with pytest.raises(CSVFormatError, match="UTF-8"):
+        read(b"a,b\n\xff\xfe,1\n")
+
+
+class Provider:
+    def __init__(self, fail=(), delay=0.0):
+        self.fail = set(fail)
+        self.delay = delay
+        self.calls = 0
+
+    async def create_user(self, full_name, username, domain, department=None, license_type=None):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if username in self.fail:
+            raise RuntimeError(f"cannot create {username}")
+        return {"id": f"id-{username}", "email": f"{username}@{domain}", "display_name": full_name}
+
+
+def bulk(data: str, provider, concurrency=2, max_rows=100, take=None):
+    """(results, users passed to record_created) for an upload; `take` stops reading early"""
+    recorded = []
+
+    async def run():
+        results = bulk_create_users(
+            chunked(data.encode(), 16), provider, ["contoso.com"], concurrency, max_rows,
+            record_created=recorded.append
+        )
+        collected = []
+        try:
+            async for result in results:
+                collected.append(result)
+                if take is not None and len(collected) >= take:
+                    break
+        finally:
+            await results.aclose()
+        return collected
+
+    results = asyncio.run(run())
+    assert len(recorded) <= 1
+    return results, recorded[0] if recorded else []
+
+
+def rows(*usernames):
+    return HEADER + "".join(f"User {name},{name},contoso.com,Sales\n" for name in usernames)
+
+
+def test_creates_validates_and_reports_each_row():
+    data = rows("ana", "bo") + "Cy,cy,example.org,\nAna Again,ANA,contoso.com,\n,missing,contoso.com,\n" + rows("dee")[len(HEADER):]
+    results, recorded = bulk(data, Provider(fail={"bo"}))
+    by_row = {result["row"]: result for result in results}
+    assert [by_row[row]["status"] for row in range(1, 7)] == [
+        "created", "failed", "invalid", "invalid", "invalid", "created"
+    ]
+    assert "not a verified domain" in by_row[3]["error"]
+    assert "Duplicate" in by_row[4]["error"]
+    assert "full_name" in by_row[5]["error"]
+    assert by_row[2]["error"] == "cannot create bo"
+    assert sorted(user["email"] for user in recorded) == ["ana@contoso.com", "dee@contoso.com"]
+
+
+def test_format_error_before_any_row_is_raised():
+    with pytest.raises(CSVFormatError, match="Missing required columns: domain"):
+        bulk("full_name,username\nAna,ana\n", Provider())
+    with pytest.raises(CSVFormatError, match="empty"):
+        bulk("", Provider())
+
+
+def test_format_error_after_the_first_row_aborts_the_stream():
+    provider = Provider()
+    results, recorded = bulk(rows("ana", "bo") + '"unterminated,x,contoso.com\n', provider)
+    assert [result["status"] for result in results] == ["created", "created", "aborted"]
+    assert "quoted field" in results[-1]["error"]
+    assert len(recorded) == 2
+
+    results, _ = bulk(rows("a", "b", "c"), Provider(), max_rows=2)
+    assert results[-1]["status"] == "aborted"
+    assert "more than 2 rows" in results[-1]["error"]
+
+
+def test_users_created_after_the_consumer_leaves_are_recorded():
+    provider = Provider(delay=0.01)
+    names = [f"u{i}" for i in range(8)]
+    results, recorded = bulk(rows(*names), provider, concurrency=4, take=1)
+    assert len(results) == 1
+    # Every create that started finished, and all of them reach the audit/cache batch
+    assert provider.calls == len(recorded)
+    assert len(recorded) > 1
+    assert len({user["email"] for user in recorded}) == len(recorded)
+
+
+def test_finished_but_unyielded_results_are_recorded():
+    # All creates finish together, so one wait returns several done tasks and
+    # the consumer leaves after the first is yielded
+    provider = Provider()
+    results, recorded = bulk(rows("a", "b", "c", "d", "e"), provider, concurrency=3, take=1)
+    assert len(results) == 1
+    assert sorted(user["email"] for user in recorded) == sorted(
+        f"{name}@contoso.com" for name in "abcde"[:provider.calls]
+    )
+    assert provider.calls >= 3
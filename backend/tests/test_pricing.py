@@ -0,0 +1,127 @@
+"""EC2 price list lookups and server cost rollups"""
+from pricing import BUNDLED_PRICES, HOURS_PER_MONTH, PriceList, platform_os
+from rollups import InventoryColumns, RollupError
+import random
+import rollups
+import pytest
+
+PRICES = """# comment lines are skipped
+instance_type,region,os,hourly_usd
+m5.large,*,linux,0.096
+m5.large,eu-west-1,linux,0.107
+m5.large,*,windows,0.188
+"""
+
+
+@pytest.fixture
+def prices(tmp_path):
+    path = tmp_path / "prices.csv"
+    path.write_text(PRICES)
+    return PriceList(path)
+
+
+def test_region_row_overrides_any_region(prices):
+    assert len(prices) == 3
+    assert prices.hourly("m5.large", "eu-west-1") == 0.107
+    assert prices.hourly("m5.large", "ap-south-1") == 0.096
+    assert prices.hourly("m5.large", "eu-west-1", "windows") == 0.188
+
+
+def test_unknown_type_has_no_price(prices):
+    assert prices.hourly("x9.huge", "us-east-1") is None
+    assert prices.monthly("x9.huge", "us-east-1") is None
+    assert prices.hourly("m5.large", "us-east-1", "rhel") is None
+
+
+def test_monthly_price(prices):
+    assert prices.monthly("m5.large", "us-east-1") == round(0.096 * HOURS_PER_MONTH, 2)
+
+
+def test_platform_os():
+    assert platform_os(None) == "linux"
+    assert platform_os("Linux/UNIX") == "linux"
+    assert platform_os("Windows BYOL") == "windows"
+    assert platform_os("Red Hat Enterprise Linux") == "rhel"
+    assert platform_os("SUSE Linux") == "suse"
+    assert platform_os("Ubuntu Pro") == "ubuntu-pro"
+
+
+def test_bundled_list_loads():
+    bundled = PriceList(BUNDLED_PRICES)
+    assert bundled.hourly("t3.micro", "us-east-1") == 0.0104
+    assert bundled.hourly("t2.micro", "us-east-1", "windows") == 0.0162
+
+
+def servers(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        {
+            "provider": rng.choice(("aws", "digitalocean")),
+            "region": rng.choice(("us-east-1", "eu-west-1", "nyc1", None)),
+            "size": rng.choice(("t3.micro", "m5.large", "s-1vcpu-1gb")),
+            "status": rng.choice(("running", "stopped", "active", "off")),
+            "type": "vm",
+            "cost_monthly": rng.choice((None, 7.59, 70.08, 5.0)),
+        }
+        for _ in range(count)
+    ]
+
+
+def brute_force(inventory, dimensions):
+    groups = {}
+    for server in inventory:
+        key = tuple(server.get(name) or "unknown" for name in dimensions)
+        row = groups.setdefault(key, {"count": 0, "running": 0, "cost": 0.0, "idle": 0.0, "unpriced": 0})
+        running = server["status"] in ("running", "active")
+        cost = server["cost_monthly"] or 0.0
+        row["count"] += 1
+        row["running"] += running
+        row["cost"] += cost
+        row["idle"] += 0.0 if running else cost
+        row["unpriced"] += server["cost_monthly"] is None
+    return {
+        key: (row["count"], row["running"], round(row["cost"], 2), round(row["idle"], 2), row["unpriced"])
+        for key, row in groups.items()
+    }
+
+
+def as_groups(rows, dimensions):
+    return {
+        tuple(row[name] for name in dimensions):
+            (row["count"], row["running"], row["monthly_cost"], row["idle_monthly_cost"], row["unpriced"])
+        for row in rows
+    }
+
+
+@pytest.fixture(params=["numpy", "python", "sparse"])
+def columns(request, monkeypatch):
+    """InventoryColumns, run with NumPy, without it, and with sparse group keys"""
+    if request.param == "python":
+        monkeypatch.setattr(rollups, "load_numpy", lambda: None)
+    else:
+        pytest.importorskip("numpy")
+        if request.param == "sparse":
+            # Force the path that bins only the combinations present
+            monkeypatch.setattr(rollups, "DENSE_GROUPS", 1)
+    return InventoryColumns
+
+
+@pytest.mark.parametrize("dimensions", [(), ("provider",), ("region", "status"), rollups.ROLLUP_DIMENSIONS])
+def test_rollup_matches_brute_force(columns, dimensions):
+    inventory = servers(500)
+    rows = columns(inventory).rollup(dimensions)
+    assert as_groups(rows, dimensions) == brute_force(inventory, dimensions)
+    assert [row["monthly_cost"] for row in rows] == sorted((row["monthly_cost"] for row in rows), reverse=True)
+
+
+def test_total_cost_and_unknown_dimension(columns):
+    inventory = servers(100, seed=1)
+    inventory_columns = columns(inventory)
+    assert inventory_columns.total_cost() == pytest.approx(sum(server["cost_monthly"] or 0.0 for server in inventory))
+    with pytest.raises(RollupError):
+        inventory_columns.rollup(("colour",))
+
+
+def test_empty_inventory(columns):
+    assert columns([]).rollup(("provider",)) == []
+    assert columns([]).total_cost() == 0.0
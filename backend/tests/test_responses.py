@@ -0,0 +1,136 @@
+"""Cached, pre-compressed JSON responses"""
+from starlette.requests import Request
+from cache import cache
+from config import get_settings
+from responses import MAX_PAYLOAD_VARIANTS, cached_json_response, negotiate_encoding, parse_fields
+import asyncio
+import gzip
+import json
+import pytest
+import responses
+
+KEY = "test:payloads"
+
+
+def request(accept_encoding=""):
+    headers = [(b"accept-encoding", accept_encoding.encode())] if accept_encoding else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers, "query_string": b""})
+
+
+@pytest.fixture
+def entry():
+    cache.set(KEY, {"items": list(range(2000))}, ttl_seconds=60)
+    yield
+    cache.invalidate(KEY)
+
+
+class Builder:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, fields):
+        self.calls += 1
+        return {"items": list(range(2000)), "fields": list(fields or ())}
+
+
+def serve(build, accept_encoding="", fields=None, variant=""):
+    return cached_json_response(request(accept_encoding), KEY, build, fields, variant)
+
+
+def test_variants_are_built_once_per_encoding(entry):
+    async def scenario():
+        build = Builder()
+        plain = await serve(build)
+        again = await serve(build)
+        assert json.loads(plain.body) == json.loads(again.body)
+        assert "content-encoding" not in plain.headers
+        compressed = await serve(build, "gzip")
+        assert compressed.headers["content-encoding"] == "gzip"
+        assert json.loads(gzip.decompress(compressed.body)) == json.loads(plain.body)
+        # The compressed variant reused the cached identity body
+        assert build.calls == 1
+
+    asyncio.run(scenario())
+
+
+def test_compressed_variant_is_kept_without_its_identity_body(entry):
+    async def scenario():
+        build = Builder()
+        await serve(build, "gzip")
+        await serve(build, "gzip")
+        assert build.calls == 1
+        assert list(cache.get_variant(KEY, "payloads")) == ["|*|gzip"]
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_misses_share_one_build(entry):
+    async def scenario():
+        build = Builder()
+        bodies = await asyncio.gather(*(serve(build, "gzip") for _ in range(10)))
+        assert build.calls == 1
+        assert len({response.body for response in bodies}) == 1
+
+    asyncio.run(scenario())
+
+
+def test_variant_count_is_bounded(entry):
+    async def scenario():
+        build = Builder()
+        for variant in range(MAX_PAYLOAD_VARIANTS + 5):
+            await serve(build, variant=str(variant))
+        payloads = cache.get_variant(KEY, "payloads")
+        assert len(payloads) == MAX_PAYLOAD_VARIANTS
+        # The least recently served went first
+        assert "0|*|identity" not in payloads
+        assert f"{MAX_PAYLOAD_VARIANTS + 4}|*|identity" in payloads
+
+    asyncio.run(scenario())
+
+
+def test_total_bytes_are_bounded(entry, monkeypatch):
+    settings = get_settings()
+
+    async def scenario():
+        build = Builder()
+        size = len((await serve(build, variant="first")).body)
+        monkeypatch.setattr(settings, "payload_cache_max_bytes", size * 3)
+        for variant in range(6):
+            await serve(build, variant=str(variant))
+        payloads = cache.get_variant(KEY, "payloads")
+        assert sum(len(body) for _, body in payloads.values()) <= size * 3
+        assert list(payloads) == ["3|*|identity", "4|*|identity", "5|*|identity"]
+
+        # A body larger than the whole budget is served but not kept
+        monkeypatch.setattr(settings, "payload_cache_max_bytes", size - 1)
+        response = await serve(build, variant="large")
+        assert len(response.body) == size
+        assert "large|*|identity" not in cache.get_variant(KEY, "payloads")
+
+    asyncio.run(scenario())
+
+
+def test_without_a_cache_entry_payloads_are_built_per_response():
+    async def scenario():
+        build = Builder()
+        await serve(build)
+        await serve(build)
+        assert build.calls == 2
+        assert not responses._building
+
+    asyncio.run(scenario())
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding("") is None
+    assert negotiate_encoding("gzip, deflate") == "gzip"
+    assert negotiate_encoding("gzip;q=0") is None
+    assert negotiate_encoding("*") in responses.ENCODINGS
+
+
+def test_parse_fields():
+    assert parse_fields("email, id,email", ("id", "email", "name")) == ("email", "id")
+    assert parse_fields("", ("id",)) is None
+    with pytest.raises(Exception) as error:
+        parse_fields("id,secret", ("id",))
+    assert error.value.status_code == 400
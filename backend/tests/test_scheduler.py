@@ -0,0 +1,125 @@
+"""Upstream call scheduling: priorities, deadlines and Retry-After pauses"""
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from scheduler import (
+    BACKGROUND, DEFAULT_RETRY_AFTER, INTERACTIVE, MAX_RETRY_AFTER, UpstreamBusyError, UpstreamScheduler, _Upstream,
+    _priority, priority, retry_after
+)
+import asyncio
+import time
+import pytest
+
+
+class Response:
+    def __init__(self, status_code, **headers):
+        self.status_code = status_code
+        self.headers = {name.replace("_", "-"): value for name, value in headers.items()}
+
+
+class ThrottledError(Exception):
+    def __init__(self, response):
+        super().__init__("throttled")
+        self.response = response
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_retry_after_parsing():
+    assert retry_after(Response(200)) is None
+    assert retry_after(Response(503)) is None
+    assert retry_after(Response(429)) == DEFAULT_RETRY_AFTER
+    assert retry_after(Response(429, retry_after="7")) == 7.0
+    assert retry_after(Response(503, retry_after="10000")) == MAX_RETRY_AFTER
+    later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert retry_after(Response(429, retry_after=later)) == pytest.approx(30, abs=2)
+    assert retry_after(Response(429, retry_after="soon")) == DEFAULT_RETRY_AFTER
+    assert retry_after(None) is None
+
+
+def test_interactive_waiters_go_first_and_reserve_is_kept():
+    async def scenario():
+        upstream = _Upstream("graph", budget=2, reserved=1, queue_size=4)
+        await upstream.acquire(BACKGROUND, None)
+        # The second slot is reserved for interactive calls
+        background = asyncio.create_task(upstream.acquire(BACKGROUND, None))
+        await settle()
+        assert not background.done()
+        await upstream.acquire(INTERACTIVE, None)
+        interactive = asyncio.create_task(upstream.acquire(INTERACTIVE, None))
+        await settle()
+
+        upstream.release()
+        await settle()
+        assert interactive.done() and not background.done()
+        upstream.release()
+        upstream.release()
+        await settle()
+        assert background.done()
+        assert upstream.in_flight == 1
+
+    asyncio.run(scenario())
+
+
+def test_background_calls_are_shed_past_their_deadline():
+    async def scenario():
+        upstream = _Upstream("graph", budget=1, reserved=0, queue_size=1)
+        await upstream.acquire(INTERACTIVE, None)
+        with pytest.raises(UpstreamBusyError, match="waited"):
+            await upstream.acquire(BACKGROUND, 0.01)
+        assert not upstream.waiters[BACKGROUND]
+
+        waiting = asyncio.create_task(upstream.acquire(BACKGROUND, None))
+        await settle()
+        with pytest.raises(UpstreamBusyError, match="queue is full"):
+            await upstream.acquire(BACKGROUND, None)
+        upstream.release()
+        await waiting
+        assert upstream.in_flight == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_returns_a_handed_over_slot():
+    async def scenario():
+        upstream = _Upstream("graph", budget=1, reserved=0, queue_size=2)
+        await upstream.acquire(INTERACTIVE, None)
+        waiter = asyncio.create_task(upstream.acquire(INTERACTIVE, None))
+        await settle()
+        upstream.release()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert upstream.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_throttled_upstream_pauses_later_calls():
+    async def scenario():
+        scheduler = UpstreamScheduler()
+        with pytest.raises(ThrottledError):
+            async with scheduler.call("graph.users", "graph"):
+                raise ThrottledError(Response(429, retry_after="0.2"))
+        upstream = scheduler.upstreams["graph"]
+        assert upstream.in_flight == 0
+
+        # A background call that can't wait out the pause is shed at once
+        with priority(BACKGROUND, max_wait=0.05):
+            with pytest.raises(UpstreamBusyError, match="back off"):
+                async with scheduler.call("graph.users", "graph"):
+                    pass
+
+        started = time.monotonic()
+        async with scheduler.call("graph.users", "graph"):
+            waited = time.monotonic() - started
+        assert waited >= 0.15
+
+    asyncio.run(scenario())
+
+
+def test_priority_context_restores_default():
+    with priority(BACKGROUND, max_wait=3):
+        assert _priority.get() == (BACKGROUND, 3)
+    assert _priority.get() == (INTERACTIVE, None)
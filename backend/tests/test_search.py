@@ -0,0 +1,75 @@
+"""Typeahead index: tokenizing, match quality and incremental updates"""
+from search import EXACT, INFIX, MAX_CANDIDATES, PREFIX, SearchIndex, tokenize
+import random
+import string
+
+FIELDS = (("name", 3.0), ("region", 1.0))
+
+
+def brute_force(records, query, limit=10):
+    """Score every record directly, ordered the way SearchIndex orders results"""
+    index = SearchIndex(FIELDS, [])
+    terms = list(dict.fromkeys(tokenize(query)))
+    scored = [(index._score(record, terms), doc) for doc, record in enumerate(records)]
+    scored = sorted((entry for entry in scored if entry[0]), key=lambda entry: (-entry[0], entry[1]))
+    return [(score, records[doc]["name"]) for score, doc in scored[:limit]]
+
+
+def test_tokenize_folds_case_accents_and_punctuation():
+    assert tokenize("Zoë.Doe@Contoso.com") == ["zoe", "doe", "contoso", "com"]
+    assert tokenize("web_01-prod") == ["web", "01", "prod"]
+    assert tokenize(None) == []
+
+
+def test_exact_beats_prefix_beats_infix():
+    records = [{"name": "smithson"}, {"name": "goldsmith"}, {"name": "smith"}]
+    index = SearchIndex(FIELDS, records)
+    assert index.search("smith") == [
+        (EXACT * 3.0, records[2]),
+        (PREFIX * 3.0, records[0]),
+        (INFIX * 3.0, records[1]),
+    ]
+
+
+def test_every_term_must_match():
+    records = [{"name": "web-1", "region": "nyc1"}, {"name": "web-2", "region": "ams3"}]
+    index = SearchIndex(FIELDS, records)
+    assert [record["name"] for _, record in index.search("web ams")] == ["web-2"]
+    assert index.search("web lon") == []
+    assert index.search("  ") == []
+
+
+def test_random_updates_match_brute_force():
+    rng = random.Random(7)
+    words = ["".join(rng.choices(string.ascii_lowercase[:6], k=rng.randint(2, 6))) for _ in range(40)]
+
+    def record():
+        return {"name": f"{rng.choice(words)}-{rng.choice(words)}", "region": rng.choice(("nyc1", "ams3", "sfo2"))}
+
+    records = [record() for _ in range(50)]
+    index = SearchIndex(FIELDS, records)
+    for _ in range(200):
+        doc = rng.randrange(len(records))
+        if rng.random() < 0.3:
+            records.append(record())
+            index.add(len(records) - 1)
+        else:
+            index.remove(doc, records[doc])
+            records[doc] = record()
+            index.add(doc)
+    for query in words[:15] + [word[1:4] for word in words[:15]] + ["nyc", "abc ams"]:
+        results = [(score, record["name"]) for score, record in index.search(query, limit=10)]
+        assert results == brute_force(records, query), query
+
+
+def test_common_terms_still_find_their_intersection():
+    # Both terms match more than MAX_CANDIDATES records; only the last has both
+    records = (
+        [{"name": f"John Smith{i}"} for i in range(MAX_CANDIDATES + 100)]
+        + [{"name": f"Maria Garcia{i}"} for i in range(MAX_CANDIDATES + 100)]
+        + [{"name": "John Garcia"}]
+    )
+    index = SearchIndex(FIELDS, records)
+    for query in ("john garcia", "garcia john", "john garc"):
+        assert [record["name"] for _, record in index.search(query)] == ["John Garcia"], query
+    assert len(index.search("john", limit=MAX_CANDIDATES * 2)) == MAX_CANDIDATES
@@ -0,0 +1,249 @@
+"""Graph change notifications applied to the cached user snapshot"""
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from cache import cache
+from database import GraphSubscription
+from subscriptions import USERS_CHANGE_TYPE, GraphSubscriptionManager, apply_user_notifications
+from tenants import tenant_key
+from user_store import UserStore
+import asyncio
+import random
+import subscriptions
+import pytest
+
+TENANT = "test"
+KEY = tenant_key("users", TENANT)
+SIGNED_IN = datetime(2026, 2, 1, tzinfo=timezone.utc)
+
+
+def user(user_id, **changes):
+    return {
+        "id": user_id, "email": f"{user_id}@contoso.com", "display_name": f"User {user_id}",
+        "domain": "contoso.com", "account_enabled": True, "licenses": [], "last_sign_in": None,
+        **changes,
+    }
+
+
+class Provider:
+    """Graph as seen by notifications and subscription upkeep"""
+
+    def __init__(self, users=()):
+        self.users = {entry["id"]: entry for entry in users}
+        self.failing = set()
+        self.subscriptions = {}
+        self.created = 0
+        self.deleted = []
+
+    async def get_user(self, user_id):
+        await asyncio.sleep(0)
+        if user_id in self.failing:
+            raise RuntimeError("Graph unavailable")
+        return self.users.get(user_id)
+
+    async def create_subscription(self, resource, change_type, url, client_state, expires_at):
+        self.created += 1
+        subscription_id = f"sub-{self.created}"
+        self.subscriptions[subscription_id] = (change_type, expires_at)
+        return {"id": subscription_id}
+
+    async def renew_subscription(self, subscription_id, expires_at):
+        if subscription_id not in self.subscriptions:
+            return None
+        change_type, _ = self.subscriptions[subscription_id]
+        self.subscriptions[subscription_id] = (change_type, expires_at)
+        return {"id": subscription_id}
+
+    async def delete_subscription(self, subscription_id):
+        self.subscriptions.pop(subscription_id, None)
+        self.deleted.append(subscription_id)
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    provider = Provider()
+    registry = SimpleNamespace(
+        provider=lambda tenant: provider,
+        tenants=lambda: {TENANT: SimpleNamespace(tenant_id="AAAA-bbbb")},
+    )
+    monkeypatch.setattr(subscriptions, "tenant_registry", registry)
+    yield provider
+    cache.invalidate(KEY)
+
+
+def notification(user_id, change="updated"):
+    return {"changeType": change, "resourceData": {"id": user_id}, "resource": f"Users/{user_id}"}
+
+
+def apply(notifications):
+    return asyncio.run(apply_user_notifications(notifications, TENANT))
+
+
+def cache_store(users):
+    store = UserStore(users)
+    # Built up front so the incremental paths are the ones exercised
+    store.stats
+    store.search_index
+    cache.set(KEY, store, ttl_seconds=60)
+    cache.set_variant(KEY, "payloads", {"stale": b"{}"})
+    return store
+
+
+def test_updates_creations_and_deletions(provider):
+    store = cache_store([user("a"), user("b"), user("c")])
+    provider.users = {
+        "a": user("a", account_enabled=False),
+        "new": user("new"),
+        # "c" is gone from Graph although the notification said "updated"
+    }
+    counts = apply([
+        notification("a"), notification("b", "deleted"), notification("new", "created"), notification("c"),
+    ])
+    assert counts == {"updated": 2, "deleted": 2, "skipped": 0}
+    assert cache.get(KEY) is store
+    assert sorted(record.id for record in store) == ["a", "new"]
+    assert store.get_user("a").account_enabled is False
+    # Only the encoded payloads were dropped
+    assert cache.get_variant(KEY, "payloads") is None
+    assert store.stats.to_dict() == UserStore(list(store)).stats.to_dict()
+
+
+def test_last_change_per_user_wins(provider):
+    store = cache_store([user("a")])
+    provider.users = {"a": user("a", display_name="Renamed")}
+    assert apply([notification("a", "deleted"), notification("a")])["updated"] == 1
+    assert store.get_user("a").display_name == "Renamed"
+    assert apply([notification("a"), notification("a", "deleted")])["deleted"] == 1
+    assert store.get_user("a") is None
+
+
+def test_report_sourced_sign_ins_are_kept(provider):
+    store = cache_store([user("a", last_sign_in=SIGNED_IN), user("b", last_sign_in=SIGNED_IN)])
+    later = SIGNED_IN + timedelta(days=3)
+    # The per-user read carries no sign-in for "a" (report source) but one for "b"
+    provider.users = {"a": user("a", department="Sales"), "b": user("b", last_sign_in=later)}
+    apply([notification("a"), notification("b")])
+    assert store.get_user("a").last_sign_in == SIGNED_IN
+    assert store.get_user("a").department == "Sales"
+    assert store.get_user("b").last_sign_in == later
+
+
+def test_failed_refetch_invalidates_the_snapshot(provider):
+    cache_store([user("a"), user("b")])
+    provider.users = {"a": user("a"), "b": user("b")}
+    provider.failing = {"b"}
+    assert apply([notification("a"), notification("b")]) == {"updated": 1, "deleted": 0, "skipped": 1}
+    assert cache.get(KEY) is None
+
+
+def test_nothing_cached_is_skipped(provider):
+    assert apply([notification("a")]) == {"updated": 0, "deleted": 0, "skipped": 1}
+    assert cache.get(KEY) is None
+
+
+def test_snapshot_dropped_while_fetching_is_left_alone(provider, monkeypatch):
+    cache_store([user("a")])
+    provider.users = {"a": user("a")}
+    get_user = provider.get_user
+
+    async def get_user_then_refresh(user_id):
+        cache.invalidate(KEY)
+        return await get_user(user_id)
+
+    monkeypatch.setattr(provider, "get_user", get_user_then_refresh)
+    assert apply([notification("a")])["skipped"] == 1
+    assert cache.get(KEY) is None
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_random_batches_match_graph(provider, seed):
+    rng = random.Random(seed)
+    graph = {f"u{i}": user(f"u{i}", department=rng.choice(("Sales", "Ops"))) for i in range(40)}
+    store = cache_store(graph.values())
+    for _ in range(10):
+        batch = []
+        for _ in range(rng.randint(1, 8)):
+            user_id = f"u{rng.randrange(60)}"
+            if rng.random() < 0.3:
+                graph.pop(user_id, None)
+                batch.append(notification(user_id, "deleted"))
+            else:
+                graph[user_id] = user(user_id, department=rng.choice(("Sales", "Ops", "Legal")))
+                batch.append(notification(user_id, "updated" if rng.random() < 0.5 else "created"))
+        provider.users = dict(graph)
+        apply(batch)
+        assert {record.id: record.department for record in store} == {
+            user_id: entry["department"] for user_id, entry in graph.items()
+        }
+        assert store.stats.to_dict() == UserStore(list(store)).stats.to_dict()
+
+
+# Subscriptions
+
+
+@pytest.fixture
+def manager(provider, sessions, monkeypatch):
+    monkeypatch.setattr(subscriptions, "SessionLocal", sessions)
+    manager = GraphSubscriptionManager()
+    monkeypatch.setattr(manager.settings, "graph_client_state", "s3cret")
+    monkeypatch.setattr(manager.settings, "graph_notification_url", "https://jarvis.test/api/webhooks/graph")
+    return manager
+
+
+def test_client_state_is_checked(manager, monkeypatch):
+    assert manager.verify({"clientState": "s3cret"})
+    assert not manager.verify({"clientState": "s3cre"})
+    assert not manager.verify({})
+    monkeypatch.setattr(manager.settings, "graph_client_state", "")
+    assert not manager.verify({"clientState": ""})
+
+
+def test_tenant_of_matches_tenant_id_then_subscription(manager):
+    assert manager.tenant_of({"tenantId": "aaaa-BBBB"}) == TENANT
+    assert manager.tenant_of({"tenantId": "other", "subscriptionId": "unknown"}) is None
+    asyncio.run(manager.ensure_subscription(TENANT))
+    assert manager.tenant_of({"subscriptionId": "sub-1"}) == TENANT
+
+
+def test_subscription_is_created_kept_renewed_and_recreated(manager, provider, sessions):
+    first = asyncio.run(manager.ensure_subscription(TENANT))
+    assert list(provider.subscriptions) == ["sub-1"]
+    assert provider.subscriptions["sub-1"][0] == USERS_CHANGE_TYPE
+    # Far from expiry: left alone
+    assert asyncio.run(manager.ensure_subscription(TENANT)) == first
+
+    db = sessions()
+    try:
+        row = db.get(GraphSubscription, "sub-1")
+        row.expires_at = datetime.utcnow() + timedelta(minutes=5)
+        db.commit()
+    finally:
+        db.close()
+    assert asyncio.run(manager.ensure_subscription(TENANT)) > first
+    assert list(provider.subscriptions) == ["sub-1"]
+
+    # Graph dropped it: the next renewal creates a new one
+    provider.subscriptions.clear()
+    db = sessions()
+    try:
+        db.get(GraphSubscription, "sub-1").expires_at = datetime.utcnow()
+        db.commit()
+    finally:
+        db.close()
+    asyncio.run(manager.ensure_subscription(TENANT))
+    assert list(provider.subscriptions) == ["sub-2"]
+
+
+def test_subscription_for_other_change_types_is_replaced(manager, provider, sessions):
+    provider.subscriptions["old"] = ("updated,deleted", None)
+    db = sessions()
+    try:
+        db.add(GraphSubscription(
+            id="old", tenant=TENANT, resource="/users", change_type="updated,deleted",
+            client_state="s3cret", expires_at=datetime.utcnow() + timedelta(days=2)
+        ))
+        db.commit()
+    finally:
+        db.close()
+    asyncio.run(manager.ensure_subscription(TENANT))
+    assert provider.deleted == ["old"]
+    assert [change_type for change_type, _ in provider.subscriptions.values()] == [USERS_CHANGE_TYPE]
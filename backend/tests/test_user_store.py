@@ -0,0 +1,103 @@
+"""UserStore and its incrementally maintained aggregates and search index
+
+Every change applied to a live store must leave it indistinguishable from a
+store rebuilt from scratch over the same records.
+"""
+from datetime import datetime, timezone
+from licensing import KNOWN_SKUS
+from user_store import UserRecord, UserStore
+import random
+import pytest
+
+DOMAINS = ("contoso.com", "fabrikam.com", "example.org")
+DEPARTMENTS = ("Sales", "Engineering", "Finance", None)
+FIRST_NAMES = ("Ana", "Zoë", "Jon", "Smith", "Mei", "Ravi", "O'Brien")
+LAST_NAMES = ("Smith", "Jones", "Goldsmith", "Lee", "Núñez", "Doe")
+SKU_IDS = tuple(sku.sku_id for sku in KNOWN_SKUS[:4]) + ("unknown-sku",)
+QUERIES = ("smith", "mith", "zoe", "ana sales", "contoso", "jo", "nunez", "lee fin", "nobody")
+
+
+def make_user(rng: random.Random, user_id: str) -> dict:
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    domain = rng.choice(DOMAINS)
+    return {
+        "id": user_id,
+        "email": f"{first}.{last}@{domain}".lower(),
+        "display_name": f"{first} {last}",
+        "domain": domain,
+        "last_sign_in": datetime(2026, 1, rng.randint(1, 28), tzinfo=timezone.utc),
+        "account_enabled": rng.random() < 0.8,
+        "licenses": rng.sample(SKU_IDS, rng.randint(0, 2)),
+        "department": rng.choice(DEPARTMENTS),
+        "manager": None,
+    }
+
+
+def assert_matches_rebuild(store: UserStore) -> None:
+    rebuilt = UserStore(list(store))
+    assert store.stats.to_dict() == rebuilt.stats.to_dict()
+    for query in QUERIES:
+        live = [(score, record.id) for score, record in store.search_index.search(query, limit=20)]
+        fresh = [(score, record.id) for score, record in rebuilt.search_index.search(query, limit=20)]
+        assert live == fresh, query
+    assert {record.id: position for position, record in enumerate(store)} == {
+        record.id: position for position, record in enumerate(rebuilt)
+    }
+    for record in store:
+        assert store.get_user(record.id) is record
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_changes_match_rebuild(seed):
+    rng = random.Random(seed)
+    store = UserStore(make_user(rng, f"u{i}") for i in range(60))
+    # Materialize both so every change below goes through the incremental paths
+    store.stats
+    store.search_index
+    next_id = 60
+
+    for step in range(300):
+        ids = [record.id for record in store]
+        action = rng.random()
+        if action < 0.35 or not ids:
+            store.upsert(make_user(rng, f"u{next_id}"))
+            next_id += 1
+        elif action < 0.6:
+            store.upsert(make_user(rng, rng.choice(ids)))
+        elif action < 0.8:
+            store.remove(rng.choice(ids))
+        else:
+            store.update(rng.choice(ids), account_enabled=rng.random() < 0.5, department=rng.choice(DEPARTMENTS))
+        if step % 25 == 0:
+            assert_matches_rebuild(store)
+    assert_matches_rebuild(store)
+
+
+def test_remove_unknown_and_last_user():
+    store = UserStore([make_user(random.Random(1), "only")])
+    store.stats
+    store.search_index
+    assert store.remove("missing") is None
+    assert store.remove("only").id == "only"
+    assert len(store) == 0
+    assert store.stats.to_dict()["total"] == 0
+    assert store.search_index.search("smith") == []
+
+
+def test_record_is_read_like_a_dict():
+    record = UserRecord({"id": "u1", "email": "a@contoso.com", "domain": "contoso.com", "licenses": [SKU_IDS[0]]})
+    assert record["email"] == "a@contoso.com"
+    assert record.get("missing", "default") == "default"
+    assert record.license_type == KNOWN_SKUS[0].name
+    assert record.monthly_cost == KNOWN_SKUS[0].monthly_price
+    with pytest.raises(KeyError):
+        record["missing"]
+
+
+def test_domain_view_shares_records():
+    rng = random.Random(2)
+    store = UserStore(make_user(rng, f"u{i}") for i in range(30))
+    view = store.for_domain("contoso.com")
+    assert all(record.domain == "contoso.com" for record in view)
+    assert all(store.get_user(record.id) is record for record in view)
+    assert view.stats.to_dict()["total"] == store.stats.to_dict()["by_domain"].get("contoso.com", 0)
@@ -0,0 +1,272 @@
+"""Compact in-memory user snapshot
+
+Users are held as __slots__ records with interned domain, department,
+license and manager strings instead of one dict per user. Records keep the
+dict-style `.get()` the rest of the code uses, so the store can be passed
+anywhere a list of user dicts was accepted.
+"""
+from collections import Counter
+from collections.abc import Sequence
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+from licensing import LicenseCatalog, default_catalog
+from search import SearchIndex, USER_SEARCH_FIELDS
+import sys
+
+USER_FIELDS = (
+    "id", "email", "display_name", "domain", "last_sign_in", "account_enabled",
+    "licenses", "license_type", "monthly_cost", "department", "manager"
+)
+
+# Low-cardinality fields shared by many users
+INTERNED_FIELDS = ("domain", "department", "manager")
+
+# Derived from `licenses` by the catalog rather than taken from the input
+LICENSE_FIELDS = ("licenses", "license_type", "monthly_cost")
+
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class UserRecord:
+    __slots__ = USER_FIELDS
+
+    def __init__(self, user: Mapping[str, Any], catalog: LicenseCatalog = default_catalog):
+        for name in USER_FIELDS:
+            if name not in LICENSE_FIELDS:
+                value = user.get(name)
+                setattr(self, name, _intern(value) if name in INTERNED_FIELDS else value)
+        # Resolved once per license combination; records share the results
+        self.licenses, self.license_type, self.monthly_cost = catalog.resolve(
+            user.get("licenses"), user.get("license_type")
+        )
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return getattr(self, name, default)
+
+    def __getitem__(self, name: str) -> Any:
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name)
+
+    def keys(self):
+        return USER_FIELDS
+
+    def to_dict(self, fields: Iterable[str] = USER_FIELDS) -> Dict[str, Any]:
+        """JSON-ready dict of the requested fields"""
+        result = {}
+        for name in fields:
+            value = getattr(self, name)
+            if isinstance(value, datetime):
+                value = value.isoformat().replace("+00:00", "Z")
+            result[name] = value
+        return result
+
+    def __repr__(self) -> str:
+        return f"UserRecord(id={self.id!r}, email={self.email!r})"
+
+
+class UserStats:
+    """Aggregate counters over a set of users, updated one record at a time
+
+    The initial build groups users by (domain, licenses, enabled) and prices
+    each group once, so its cost is one pass over the records however many
+    SKUs they hold.
+    """
+
+    def __init__(self, records: Iterable[Any] = (), catalog: LicenseCatalog = default_catalog):
+        self.catalog = catalog
+        self.total = 0
+        self.enabled = 0
+        self.licensed = 0
+        # Only enabled, licensed users count towards cost
+        self.monthly_cost = 0.0
+        # Licenses held by disabled accounts: paid for, not used
+        self.disabled_licensed_cost = 0.0
+        self.by_domain: Dict[str, int] = {}
+        # SKU id (or license name when no SKU is known) -> [users holding it, monthly cost, disabled holders]
+        self.by_license: Dict[str, List] = {}
+        groups = Counter(self._group(record) for record in records)
+        for group, count in groups.items():
+            self._apply(group, count)
+
+    @staticmethod
+    def _group(user: Any) -> Tuple[str, Tuple[str, ...], Optional[str], bool]:
+        return (
+            user.get("domain") or "",
+            tuple(user.get("licenses") or ()),
+            user.get("license_type"),
+            bool(user.get("account_enabled")),
+        )
+
+    def _apply(self, group: Tuple[str, Tuple[str, ...], Optional[str], bool], count: int) -> None:
+        domain, licenses, license_type, enabled = group
+        self.total += count
+        if enabled:
+            self.enabled += count
+
+        users = self.by_domain.get(domain, 0) + count
+        if users:
+            self.by_domain[domain] = users
+        else:
+            self.by_domain.pop(domain, None)
+
+        keys = licenses or ((license_type,) if license_type else ())
+        if not keys:
+            return
+        self.licensed += count
+        for key in keys:
+            cost = count * self.catalog.price(key)
+            if enabled:
+                self.monthly_cost += cost
+            else:
+                self.disabled_licensed_cost += cost
+            entry = self.by_license.setdefault(key, [0, 0.0, 0])
+            entry[0] += count
+            if enabled:
+                entry[1] += cost
+            else:
+                entry[2] += count
+            if not entry[0]:
+                del self.by_license[key]
+
+    def add(self, user: Any, sign: int = 1) -> None:
+        self._apply(self._group(user), sign)
+
+    def remove(self, user: Any) -> None:
+        self.add(user, -1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "enabled": self.enabled,
+            "disabled": self.total - self.enabled,
+            "licensed": self.licensed,
+            "unlicensed": self.total - self.licensed,
+            "monthly_cost": round(self.monthly_cost, 2),
+            "disabled_licensed_cost": round(self.disabled_licensed_cost, 2),
+            "by_domain": dict(sorted(self.by_domain.items())),
+            "by_license": dict(sorted(
+                (self.catalog.name(key), {
+                    "users": users,
+                    "disabled": disabled,
+                    "monthly_cost": round(cost, 2),
+                })
+                for key, (users, cost, disabled) in self.by_license.items()
+            )),
+        }
+
+
+class UserStore(Sequence):
+    """Read-only sequence of user records
+
+    Consumers only read; the cache owner applies change notifications with
+    upsert() and remove(). Licenses are named and priced by `catalog`.
+    """
+
+    def __init__(
+        self,
+        users: Iterable[Any] = (),
+        catalog: LicenseCatalog = default_catalog,
+        _records: Optional[List[UserRecord]] = None
+    ):
+        if _records is None:
+            _records = [user if isinstance(user, UserRecord) else UserRecord(user, catalog) for user in users]
+        self.catalog = catalog
+        self._records = _records
+        self._index: Optional[Dict[str, int]] = None
+        self._stats: Optional[UserStats] = None
+        self._search: Optional[SearchIndex] = None
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return UserStore(catalog=self.catalog, _records=self._records[index])
+        return self._records[index]
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self) -> Iterator[UserRecord]:
+        return iter(self._records)
+
+    def for_domain(self, domain: str) -> "UserStore":
+        """View of the users in one domain, sharing records with this store"""
+        return UserStore(catalog=self.catalog, _records=[record for record in self._records if record.domain == domain])
+
+    def get_user(self, user_id: str) -> Optional[UserRecord]:
+        position = self._positions().get(user_id)
+        return None if position is None else self._records[position]
+
+    def upsert(self, user: Mapping[str, Any]) -> UserRecord:
+        """Insert or replace a user by id"""
+        record = user if isinstance(user, UserRecord) else UserRecord(user, self.catalog)
+        positions = self._positions()
+        position = positions.get(record.id)
+        if position is None:
+            positions[record.id] = len(self._records)
+            self._records.append(record)
+        else:
+            if self._stats is not None:
+                self._stats.remove(self._records[position])
+            if self._search is not None:
+                self._search.remove(position, self._records[position])
+            self._records[position] = record
+        if self._stats is not None:
+            self._stats.add(record)
+        if self._search is not None:
+            self._search.add(positions[record.id])
+        return record
+
+    def remove(self, user_id: str) -> Optional[UserRecord]:
+        """Remove a user by id in O(1); the last record takes its place"""
+        positions = self._positions()
+        position = positions.pop(user_id, None)
+        if position is None:
+            return None
+        removed = self._records[position]
+        if self._search is not None:
+            self._search.remove(position, removed)
+        last = self._records.pop()
+        if last is not removed:
+            if self._search is not None:
+                self._search.remove(len(self._records), last)
+            self._records[position] = last
+            positions[last.id] = position
+            if self._search is not None:
+                self._search.add(position)
+        if self._stats is not None:
+            self._stats.remove(removed)
+        return removed
+
+    def update(self, user_id: str, **changes: Any) -> Optional[UserRecord]:
+        """Replace a user with a copy carrying `changes`; None if it isn't held"""
+        record = self.get_user(user_id)
+        if record is None:
+            return None
+        return self.upsert({**record, **changes})
+
+    @property
+    def stats(self) -> UserStats:
+        """Aggregates over the store, computed once and then kept current by upsert()/remove()"""
+        if self._stats is None:
+            self._stats = UserStats(self._records, self.catalog)
+        return self._stats
+
+    @property
+    def search_index(self) -> SearchIndex:
+        """Typeahead index over the store, built on first search and then kept current by upsert()/remove()"""
+        if self._search is None:
+            self._search = SearchIndex(USER_SEARCH_FIELDS, self._records)
+        return self._search
+
+    def _positions(self) -> Dict[str, int]:
+        # Built on first lookup; plain listings never pay for it
+        if self._index is None:
+            self._index = {record.id: position for position, record in enumerate(self._records)}
+        return self._index
+
+    def to_dicts(self, fields: Iterable[str] = USER_FIELDS) -> List[Dict[str, Any]]:
+        fields = tuple(fields)
+        return [record.to_dict(fields) for record in self._records]
@@ -38,6 +38,16 @@ export interface AIAnalysisResponse {
   recommendations?: string[];
 }
 
+export interface Job {
+  id: string;
+  status: 'queued' | 'running' | 'succeeded' | 'failed';
+  progress: number;
+  message: string | null;
+  error: string | null;
+}
+
+const JOB_POLL_INTERVAL_MS = 1000;
+
 class APIClient {
   async getDomains(): Promise<Domain[]> {
     const response = await fetch(`${API_BASE}/domains`);
@@ -81,11 +91,35 @@ class APIClient {
     if (!response.ok) throw new Error('Failed to delete user');
   }
 
-  async analyzeUsers(): Promise<AIAnalysisResponse> {
+  async analyzeUsers(onProgress?: (job: Job) => void): Promise<AIAnalysisResponse> {
     const response = await fetch(`${API_BASE}/analyze-users`, {
       method: 'POST',
     });
     if (!response.ok) throw new Error('Failed to analyze users');
+    // 202: no cached analysis, one was queued as a job
+    if (response.status === 202) {
+      const { job_id } = await response.json();
+      return this.waitForJob<AIAnalysisResponse>(job_id, onProgress);
+    }
+    return response.json();
+  }
+
+  async getJob(jobId: string): Promise<Job> {
+    const response = await fetch(`${API_BASE}/jobs/${jobId}`);
+    if (!response.ok) throw new Error('Failed to fetch job');
+    return response.json();
+  }
+
+  async waitForJob<T>(jobId: string, onProgress?: (job: Job) => void): Promise<T> {
+    for (;;) {
+      const job = await this.getJob(jobId);
+      onProgress?.(job);
+      if (job.status === 'failed') throw new Error(job.error || 'Job failed');
+      if (job.status === 'succeeded') break;
+      await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    }
+    const response = await fetch(`${API_BASE}/jobs/${jobId}/result`);
+    if (!response.ok) throw new Error('Failed to fetch job result');
     return response.json();
   }
 
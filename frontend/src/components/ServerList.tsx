@@ -10,7 +10,7 @@ interface Server {
   provider: string;
   type: string;
   size: string;
-  cost_monthly: number;
+  cost_monthly: number | null;  // null when the type has no known price
   status: string;
   region?: string;
   expires_at?: string;
@@ -22,6 +22,9 @@ interface ServerListResponse {
   monthly_cost: number;
 }
 
+const formatCost = (cost: number | null): string =>
+  cost === null ? 'Unpriced' : `$${cost.toFixed(2)}`;
+
 export const ServerList: FC = () => {
   const [servers, setServers] = useState<Server[]>([]);
   const [loading, setLoading] = useState(true);
@@ -99,7 +102,7 @@ export const ServerList: FC = () => {
     },
     {
       header: 'Cost/Month',
-      accessor: (server: Server) => `$${server.cost_monthly.toFixed(2)}`,
+      accessor: (server: Server) => formatCost(server.cost_monthly),
     },
     {
       header: 'Expires',
@@ -192,7 +195,7 @@ export const ServerList: FC = () => {
         <div>
           <span className="text-gray-500">Cost/Month:</span>{' '}
           <span className="font-semibold">
-            ${filteredServers.reduce((sum, s) => sum + s.cost_monthly, 0).toFixed(2)}
+            ${filteredServers.reduce((sum, s) => sum + (s.cost_monthly ?? 0), 0).toFixed(2)}
           </span>
         </div>
       </div>
@@ -260,7 +263,7 @@ export const ServerList: FC = () => {
                   )}
                   <div>
                     <span className="text-gray-500">Cost/Month:</span>
-                    <p className="font-medium truncate mt-0.5">${server.cost_monthly.toFixed(2)}</p>
+                    <p className="font-medium truncate mt-0.5">{formatCost(server.cost_monthly)}</p>
                   </div>
                   <div>
                     <span className="text-gray-500">Expires:</span>
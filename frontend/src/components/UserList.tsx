@@ -197,7 +197,9 @@ export const UserList: FC = () => {
     setAiAnalysis('');
 
     try {
-      const result = await apiClient.analyzeUsers();
+      const result = await apiClient.analyzeUsers(job => {
+        if (job.message) setAiAnalysis(`${job.message}...`);
+      });
       setAiAnalysis(result.response);
     } catch (err) {
       setAiAnalysis('Failed to analyze users: ' + (err instanceof Error ? err.message : 'Unknown error'));
@@ -568,7 +570,7 @@ export const UserList: FC = () => {
 
               {aiLoading ? (
                 <div className="text-center py-8">
-                  <div className="text-gray-500">Analyzing users with Claude AI...</div>
+                  <div className="text-gray-500">{aiAnalysis || 'Analyzing users with Claude AI...'}</div>
                 </div>
               ) : (
                 <div className="mb-6">